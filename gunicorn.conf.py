@@ -0,0 +1,23 @@
+# Configuración de gunicorn para producción.
+#
+# ASGI (por defecto): workers de uvicorn sirven web_project.asgi; las vistas
+# async del catálogo atienden muchas conexiones por worker.
+#   gunicorn web_project.asgi:application -c gunicorn.conf.py
+#
+# WSGI (stack sync anterior, para comparar):
+#   GUNICORN_WORKER_CLASS=sync gunicorn web_project.wsgi:application -c gunicorn.conf.py
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Solo para workers sync/gthread: hilos por worker
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers para acotar fugas de memoria
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+accesslog = '-'
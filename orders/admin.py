@@ -1,14 +1,47 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from .models import Product, Order, Restaurant, Client, Driver, Review, Delivery, OrderItem
+from .lifecycle import bulk_transition
+from .models import Product, Order, Restaurant, Client, Driver, Review, Delivery, OrderItem, ClientStats, OutboundEmail
+
+
+class PartialSaveAdmin(admin.ModelAdmin):
+    """Edits save only the changed columns; the status is moved by orders.lifecycle"""
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        fields = self.changed_fields(obj, form)
+        if fields:
+            obj.save(update_fields=fields)
+
+    def changed_fields(self, obj, form):
+        return [f.name for f in obj._meta.concrete_fields if f.name in form.changed_data]
 
 
 @admin.register(Restaurant)
-class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ['name', 'address', 'phone_number', 'rating', 'opening_time', 'closing_time']
+class RestaurantAdmin(PartialSaveAdmin):
+    """The rating is captured by hand until the first review; then it is the reviews' average"""
+    list_display = ['name', 'address', 'phone_number', 'rating', 'reviews', 'opening_time', 'closing_time']
     search_fields = ['name', 'address']
     list_filter = ['rating']
 
+    @admin.display(description='Reviews', ordering='rating_count')
+    def reviews(self, obj):
+        return obj.rating_count if obj.has_reviews else 'sin reseñas'
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.has_reviews:
+            return ['rating']
+        return []
+
+    def changed_fields(self, obj, form):
+        fields = super().changed_fields(obj, form)
+        if 'rating' in fields:
+            fields.remove('rating')
+            # Si llegó una reseña desde que se abrió el formulario, su promedio manda
+            Restaurant.objects.filter(pk=obj.pk, rating_count=0).update(rating=obj.rating)
+        return fields
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -19,9 +52,17 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'phone_number', 'registration_date']
-    search_fields = ['name', 'email']
+    list_display = ['name', 'email', 'user', 'phone_number', 'registration_date']
+    search_fields = ['name', 'email', 'user__username']
     list_filter = ['registration_date']
+    raw_id_fields = ['user']
+
+
+@admin.register(ClientStats)
+class ClientStatsAdmin(admin.ModelAdmin):
+    list_display = ['client', 'total_orders', 'pending_orders', 'total_spent', 'favorite_restaurant']
+    search_fields = ['client__name', 'client__email']
+    raw_id_fields = ['client', 'favorite_restaurant']
 
 
 @admin.register(Driver)
@@ -32,11 +73,38 @@ class DriverAdmin(admin.ModelAdmin):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(PartialSaveAdmin):
     list_display = ['id', 'client', 'restaurant', 'status', 'total', 'creation_date', 'payment_method']
     list_filter = ['status', 'payment_method', 'creation_date']
     search_fields = ['client__name', 'restaurant__name']
     date_hierarchy = 'creation_date'
+    # El estado solo cambia con las acciones, nunca al guardar el formulario
+    readonly_fields = ['status', 'version']
+    actions = ['mark_in_progress', 'mark_delivered', 'mark_cancelled']
+
+    def _transition(self, request, queryset, status):
+        results = bulk_transition(list(queryset.values_list('pk', flat=True)), status)
+        rejected = sorted(pk for pk, result in results.items() if not result['ok'])
+        updated = len(results) - len(rejected)
+        self.message_user(request, f'{updated} pedido(s) pasaron a {status}.', messages.SUCCESS)
+        if rejected:
+            self.message_user(
+                request,
+                f"{len(rejected)} pedido(s) no admiten esa transición: {', '.join(map(str, rejected[:20]))}",
+                messages.WARNING,
+            )
+
+    @admin.action(description='Marcar como en preparación')
+    def mark_in_progress(self, request, queryset):
+        self._transition(request, queryset, 'in_progress')
+
+    @admin.action(description='Marcar como entregados')
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'delivered')
+
+    @admin.action(description='Marcar como cancelados')
+    def mark_cancelled(self, request, queryset):
+        self._transition(request, queryset, 'cancelled')
 
 
 @admin.register(OrderItem)
@@ -55,9 +123,17 @@ class ReviewAdmin(admin.ModelAdmin):
 
 
 @admin.register(Delivery)
-class DeliveryAdmin(admin.ModelAdmin):
+class DeliveryAdmin(PartialSaveAdmin):
     list_display = ['id', 'order', 'driver', 'delivery_status', 'delivery_date', 'delivery_time']
     list_filter = ['delivery_status', 'delivery_date']
     search_fields = ['order__id', 'driver__name']
     date_hierarchy = 'delivery_date'
+    readonly_fields = ['delivery_status', 'version']
+
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'to']
+    date_hierarchy = 'created_at'
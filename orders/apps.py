@@ -5,3 +5,6 @@ class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
 
+    def ready(self):
+        # ensure signals are loaded
+        from . import signals  # noqa
@@ -0,0 +1,258 @@
+"""End-to-end HTTP benchmarks for the storefront and the API.
+
+Offline mode drives the views through Django's test client inside a
+transaction that is rolled back at the end, and records latency, queries
+and allocated memory per request. Server mode sends the read-only
+scenarios to a running server over HTTP and records latency only.
+Results are plain JSON so two runs can be compared with ``compare``.
+"""
+import base64
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Product, Driver
+
+# Endpoints registrados en el DefaultRouter de web_project/urls.py
+API_ENDPOINTS = ['products', 'orders', 'restaurants', 'clients', 'drivers', 'reviews', 'deliveries']
+
+BENCH_USERNAME = 'benchmark'
+
+Scenario = namedtuple('Scenario', 'name method path body setup offline_only')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def scenarios(restaurant_id, product_ids):
+    """Scenarios in run order; ``setup`` runs untimed before each request"""
+    cart = {str(pk): 1 for pk in product_ids}
+
+    def fill_cart(target):
+        target.set_session('cart', cart)
+
+    items = [
+        Scenario('home', 'GET', '/', None, None, False),
+        Scenario('restaurant_list', 'GET', '/restaurants/', None, None, False),
+        Scenario('restaurant_detail', 'GET', f'/restaurants/{restaurant_id}/', None, None, False),
+        Scenario('cart_add', 'POST', f'/cart/api/lines/{product_ids[0]}/', {'delta': 1}, None, True),
+        Scenario('cart_page', 'GET', '/cart/', None, fill_cart, True),
+        Scenario('checkout', 'POST', '/checkout/', {
+            'delivery_address': 'Periférico Sur 8585', 'payment_method': 'cash', 'comments': '',
+        }, fill_cart, True),
+    ]
+    items += [Scenario(f'api_{name}', 'GET', f'/api/{name}/', None, None, False) for name in API_ENDPOINTS]
+    return items
+
+
+class OfflineTarget:
+    """Requests through the test client as a logged-in user"""
+
+    def __init__(self, user):
+        self.client = TestClient()
+        self.client.force_login(user)
+
+    def set_session(self, key, value):
+        session = self.client.session
+        session[key] = value
+        session.save()
+
+    def request(self, scenario):
+        if scenario.method == 'GET':
+            response = self.client.get(scenario.path)
+        elif scenario.path.startswith('/cart/api/'):
+            response = self.client.post(scenario.path, json.dumps(scenario.body), content_type='application/json')
+        else:
+            response = self.client.post(scenario.path, scenario.body)
+        # Consumir respuestas en streaming para medir la petición completa
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def measure(self, scenario):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            status = self.request(scenario)
+            elapsed = time.perf_counter() - start
+        return status, elapsed * 1000, len(ctx.captured_queries)
+
+    def measure_memory(self, scenario):
+        tracemalloc.start()
+        try:
+            self.request(scenario)
+            return tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+
+class ServerTarget:
+    """Requests over HTTP to a running server; API calls use basic auth if given"""
+
+    def __init__(self, base_url, username=None, password=None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {}
+        if username:
+            token = base64.b64encode(f'{username}:{password or ""}'.encode()).decode()
+            self.headers['Authorization'] = f'Basic {token}'
+
+    def measure(self, scenario):
+        request = urllib.request.Request(self.base_url + scenario.path, headers=self.headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return status, (time.perf_counter() - start) * 1000, None
+
+
+def _percentiles(values):
+    if len(values) < 2:
+        return {'p50': values[0], 'p95': values[0], 'p99': values[0]}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def run_scenario(target, scenario, iterations, warmup, memory_iterations, concurrency=1):
+    """Measure one scenario; with concurrency > 1 requests are sent from that many threads"""
+    def once(measure):
+        if scenario.setup:
+            scenario.setup(target)
+        return measure(scenario)
+
+    for _ in range(warmup):
+        once(target.measure)
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda _: once(target.measure), range(iterations)))
+    else:
+        samples = [once(target.measure) for _ in range(iterations)]
+    wall = time.perf_counter() - start
+
+    statuses = {status for status, _, _ in samples}
+    latencies = [elapsed for _, elapsed, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    result = {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'throughput_rps': iterations / wall if wall else None,
+        'status': sorted(statuses),
+        'latency_ms': {**_percentiles(latencies), 'mean': statistics.fmean(latencies)},
+        'queries': {'mean': statistics.fmean(queries), 'max': max(queries)} if queries else None,
+        'peak_memory_kib': None,
+    }
+    if memory_iterations and hasattr(target, 'measure_memory'):
+        result['peak_memory_kib'] = statistics.median(
+            once(target.measure_memory) for _ in range(memory_iterations)
+        )
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fixtures():
+    product = Product.objects.filter(availability=True).order_by('pk').first()
+    if product is None or not Driver.objects.exists():
+        raise ValueError('The database needs products and drivers; run seed_load first.')
+    product_ids = list(
+        Product.objects.filter(restaurant_id=product.restaurant_id, availability=True)
+        .order_by('pk').values_list('pk', flat=True)[:3]
+    )
+    return product.restaurant_id, product_ids
+
+
+def run(iterations=50, warmup=3, memory_iterations=5, only=None, base_url=None, username=None,
+        password=None, concurrency=1):
+    """Run the suite and return the results as a JSON-serializable dict.
+
+    ``concurrency`` only applies to server mode: the test client and its
+    rolled back transaction are bound to one thread.
+    """
+    restaurant_id, product_ids = _fixtures()
+    selected = [
+        s for s in scenarios(restaurant_id, product_ids)
+        if (not only or s.name in only) and not (base_url and s.offline_only)
+    ]
+    results = {}
+
+    if base_url:
+        target = ServerTarget(base_url, username, password)
+        for scenario in selected:
+            results[scenario.name] = run_scenario(target, scenario, iterations, warmup, 0, concurrency)
+    else:
+        # Checkout and cart writes are rolled back with the benchmark user
+        try:
+            with transaction.atomic():
+                user, _ = User.objects.get_or_create(
+                    username=BENCH_USERNAME, defaults={'email': 'benchmark@example.com'}
+                )
+                target = OfflineTarget(user)
+                for scenario in selected:
+                    results[scenario.name] = run_scenario(
+                        target, scenario, iterations, warmup, memory_iterations
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'mode': 'server' if base_url else 'offline',
+            'base_url': base_url,
+            'concurrency': concurrency if base_url else 1,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """Rows of (scenario, metric, before, after, change, worse) and whether any regressed.
+
+    A metric regresses when it grows by more than ``threshold`` (a fraction).
+    Query counts regress on any increase.
+    """
+    rows, regressed = [], False
+    for name, after in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        metrics = [('p50_ms', before['latency_ms']['p50'], after['latency_ms']['p50'], threshold),
+                   ('p95_ms', before['latency_ms']['p95'], after['latency_ms']['p95'], threshold)]
+        if before['queries'] and after['queries']:
+            metrics.append(('queries', before['queries']['max'], after['queries']['max'], 0))
+        if before['peak_memory_kib'] and after['peak_memory_kib']:
+            metrics.append(('memory_kib', before['peak_memory_kib'], after['peak_memory_kib'], threshold))
+        for metric, old, new, allowed in metrics:
+            change = (new - old) / old if old else 0
+            worse = change > allowed
+            regressed = regressed or worse
+            rows.append((name, metric, old, new, change, worse))
+    return rows, regressed
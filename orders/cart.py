@@ -0,0 +1,162 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import Http404
+
+from .models import Product
+
+
+class Cart:
+    """Session cart with a priced snapshot of its products.
+
+    ``session['cart']`` keeps the {product_id: quantity} mapping used so far;
+    ``session['cart_snapshot']`` keeps name, description and price of those
+    products so the cart page and the mutation views do not have to query
+    them again. The snapshot is reloaded with a single ``in_bulk`` query when
+    it is older than ``CART_SNAPSHOT_TTL`` seconds or misses a product.
+    """
+    SESSION_KEY = 'cart'
+    SNAPSHOT_KEY = 'cart_snapshot'
+
+    def __init__(self, request):
+        self.session = request.session
+        self.lines = dict(self.session.get(self.SESSION_KEY, {}))
+        self.snapshot = self.session.get(self.SNAPSHOT_KEY) or {'priced_at': 0, 'products': {}}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def quantity(self, product_id):
+        return self.lines.get(str(product_id), 0)
+
+    def _is_fresh(self):
+        ttl = getattr(settings, 'CART_SNAPSHOT_TTL', 300)
+        return time.time() - self.snapshot['priced_at'] < ttl
+
+    def _price(self, product_ids):
+        """Load product data for the given ids into the snapshot with one query"""
+        by_id = Product.objects.in_bulk([int(pid) for pid in product_ids])
+        products = self.snapshot['products']
+        for pid in product_ids:
+            product = by_id.get(int(pid))
+            if product is None:
+                products.pop(pid, None)
+                continue
+            products[pid] = {
+                'id': product.id,
+                'name': product.name,
+                'description': product.description,
+                'price': str(product.price),
+                'restaurant_id': product.restaurant_id,
+            }
+
+    def _ensure_priced(self, extra=()):
+        if not self._is_fresh():
+            self.snapshot = {'priced_at': time.time(), 'products': {}}
+            self._price(list(self.lines) + [pid for pid in extra if pid not in self.lines])
+            self._save()
+            return
+        missing = [pid for pid in (*self.lines, *extra) if pid not in self.snapshot['products']]
+        if missing:
+            self._price(missing)
+            self._save()
+
+    def _save(self):
+        self.session[self.SESSION_KEY] = self.lines
+        self.session[self.SNAPSHOT_KEY] = self.snapshot
+
+    def product(self, product_id):
+        """Snapshot data of a product, loading it if needed; 404 if it does not exist"""
+        pid = str(product_id)
+        self._ensure_priced(extra=[pid])
+        try:
+            return self.snapshot['products'][pid]
+        except KeyError:
+            raise Http404('Producto no encontrado')
+
+    def add(self, product_id, quantity=1):
+        product = self.product(product_id)
+        pid = str(product_id)
+        self.lines[pid] = self.lines.get(pid, 0) + quantity
+        self._save()
+        return product
+
+    def set(self, product_id, quantity):
+        product = self.product(product_id)
+        pid = str(product_id)
+        if quantity > 0:
+            self.lines[pid] = quantity
+        else:
+            self.lines.pop(pid, None)
+        self._save()
+        return product
+
+    def update(self, quantities):
+        """Set several quantities at once; products are priced with one query.
+
+        ``quantities`` maps product ids to quantities (0 removes the line).
+        Nothing is changed and Http404 is raised if any product is unknown.
+        """
+        quantities = {str(pid): qty for pid, qty in quantities.items()}
+        self._ensure_priced(extra=list(quantities))
+        if any(pid not in self.snapshot['products'] for pid in quantities):
+            raise Http404('Producto no encontrado')
+        for pid, qty in quantities.items():
+            if qty > 0:
+                self.lines[pid] = qty
+            else:
+                self.lines.pop(pid, None)
+        self._save()
+
+    def remove(self, product_id):
+        pid = str(product_id)
+        if pid not in self.lines:
+            return False
+        del self.lines[pid]
+        self._save()
+        return True
+
+    def clear(self):
+        self.lines = {}
+        self._save()
+
+    def items(self):
+        """Priced lines of the cart; products that no longer exist are dropped"""
+        self._ensure_priced()
+        products = self.snapshot['products']
+        stale = [pid for pid in self.lines if pid not in products]
+        if stale:
+            for pid in stale:
+                del self.lines[pid]
+            self._save()
+        items = []
+        for pid, qty in self.lines.items():
+            product = products[pid]
+            price = Decimal(product['price'])
+            items.append({
+                'product': product,
+                'quantity': qty,
+                'unit_price': price,
+                'subtotal': price * qty,
+            })
+        return items
+
+    @property
+    def total(self):
+        return sum((item['subtotal'] for item in self.items()), Decimal('0'))
+
+    def products(self):
+        """Fresh (product, quantity) pairs from the database for checkout.
+
+        Always re-reads prices with a single query; raises Http404 if a
+        product in the cart no longer exists.
+        """
+        ids = [int(pid) for pid in self.lines]
+        by_id = Product.objects.select_related('restaurant').in_bulk(ids)
+        if len(by_id) != len(ids):
+            raise Http404('Producto no encontrado')
+        return [(by_id[pid], qty) for pid, qty in zip(ids, self.lines.values())]
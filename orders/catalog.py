@@ -0,0 +1,154 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Restaurant, Product
+
+_MISSING = object()
+_lock = threading.Lock()
+_stats = Counter()
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')]
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _count(kind, hit):
+    with _lock:
+        _stats[kind, 'hits' if hit else 'misses'] += 1
+
+
+def get_or_set(key, loader, kind):
+    """Return the cached value for key, calling loader() on a miss"""
+    cache = _cache()
+    value = cache.get(key, _MISSING)
+    _count(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = loader()
+        cache.set(key, value, _timeout())
+    return value
+
+
+async def aget_or_set(key, aloader, kind):
+    """Async get_or_set for async views; ``aloader`` is a coroutine function"""
+    cache = _cache()
+    value = await cache.aget(key, _MISSING)
+    _count(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = await aloader()
+        await cache.aset(key, value, _timeout())
+    return value
+
+
+def fragment_key(name, *vary_on):
+    return ':'.join(['catalog:fragment', name, *map(str, vary_on)])
+
+
+# Las recargas leen del primario: una réplica atrasada volvería a cachear
+# los datos que la invalidación acaba de descartar
+
+def _restaurants():
+    return Restaurant.objects.using(DEFAULT_DB_ALIAS).order_by('-rating')
+
+
+def _menu(restaurant_id):
+    return (
+        Product.objects.using(DEFAULT_DB_ALIAS)
+        .filter(restaurant_id=restaurant_id, availability=True)
+        .order_by('name')
+    )
+
+
+def restaurants():
+    """All restaurants, best rated first"""
+    return get_or_set('catalog:restaurants', lambda: list(_restaurants()), 'restaurants')
+
+
+def top_restaurants():
+    """The 20 best rated restaurants shown on the home page"""
+    return get_or_set('catalog:restaurants:top', lambda: list(_restaurants()[:20]), 'restaurants')
+
+
+def restaurant(pk):
+    """A single restaurant, or None when it does not exist"""
+    return get_or_set(
+        f'catalog:restaurant:{pk}',
+        lambda: Restaurant.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk).first(),
+        'restaurant',
+    )
+
+
+def menu(restaurant_id):
+    """Available products of a restaurant ordered by name"""
+    return get_or_set(f'catalog:menu:{restaurant_id}', lambda: list(_menu(restaurant_id)), 'menu')
+
+
+# Versiones async para las vistas async; comparten claves de caché con las de arriba
+
+async def arestaurants():
+    return await aget_or_set('catalog:restaurants', lambda: _alist(_restaurants()), 'restaurants')
+
+
+async def atop_restaurants():
+    return await aget_or_set('catalog:restaurants:top', lambda: _alist(_restaurants()[:20]), 'restaurants')
+
+
+async def arestaurant(pk):
+    return await aget_or_set(
+        f'catalog:restaurant:{pk}',
+        lambda: Restaurant.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk).afirst(),
+        'restaurant',
+    )
+
+
+async def amenu(restaurant_id):
+    return await aget_or_set(f'catalog:menu:{restaurant_id}', lambda: _alist(_menu(restaurant_id)), 'menu')
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def invalidate_restaurant(pk):
+    _cache().delete_many([
+        'catalog:restaurants',
+        'catalog:restaurants:top',
+        f'catalog:restaurant:{pk}',
+        f'catalog:menu:{pk}',
+        fragment_key('home'),
+        fragment_key('restaurant_list'),
+        fragment_key('menu', pk),
+    ])
+
+
+def invalidate_menu(*restaurant_ids):
+    keys = []
+    for pk in set(restaurant_ids):
+        keys += [f'catalog:menu:{pk}', fragment_key('menu', pk)]
+    _cache().delete_many(keys)
+
+
+def invalidate_all():
+    """Drop the whole catalog cache, e.g. after bulk loads that skip signals"""
+    _cache().clear()
+
+
+def cache_stats():
+    """Hit/miss counters of this process, by kind of cached object"""
+    with _lock:
+        stats = {}
+        for (kind, outcome), count in _stats.items():
+            stats.setdefault(kind, {'hits': 0, 'misses': 0})[outcome] = count
+        return stats
+
+
+def reset_cache_stats():
+    with _lock:
+        _stats.clear()
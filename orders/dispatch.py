@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, F, OuterRef, Subquery, IntegerField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .load_index import load_index
+from .models import Driver, Delivery
+
+
+def drivers_by_load(queryset=None):
+    """Annotate drivers with their active delivery count, least loaded first.
+
+    The count is a correlated subquery instead of a GROUP BY so the queryset
+    can still be locked with select_for_update().
+    """
+    if queryset is None:
+        queryset = Driver.objects.all()
+    active = (
+        Delivery.objects
+        .filter(driver=OuterRef('pk'), delivery_status__in=Delivery.ACTIVE_STATUSES)
+        .order_by()
+        .values('driver')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return queryset.annotate(
+        active_deliveries=Coalesce(Subquery(active, output_field=IntegerField()), 0)
+    ).order_by('active_deliveries', 'pk')
+
+
+def least_loaded_driver():
+    """Lock and return the available driver with the fewest active deliveries.
+
+    Must run inside transaction.atomic(). Rows already locked by a concurrent
+    checkout are skipped so parallel orders spread across drivers instead of
+    queueing on the same one; if every candidate is locked we wait for the
+    least loaded. Returns None when no driver is available.
+    """
+    candidates = drivers_by_load(Driver.objects.filter(availability=True))
+    if connection.features.has_select_for_update_skip_locked:
+        driver = candidates.select_for_update(skip_locked=True, of=('self',)).first()
+        if driver is not None:
+            return driver
+    return candidates.select_for_update(of=('self',)).first()
+
+
+# Conductores que el índice puede proponer antes de caer a la consulta completa
+MAX_INDEX_ATTEMPTS = 3
+
+
+def _indexed_driver():
+    """Pop a candidate from the in-memory index and confirm it under a row lock.
+
+    The index is per process and may be up to DRIVER_LOAD_INDEX_TTL stale,
+    so the popped driver's row is locked and its active_delivery_count
+    compared with the index (one query, the Delivery table is not read);
+    if another process already gave it more work, the index is corrected and
+    the next candidate tried. Must run inside transaction.atomic().
+    """
+    for _ in range(MAX_INDEX_ATTEMPTS):
+        pk = load_index.pop()
+        if pk is None:
+            return None
+        driver = Driver.objects.select_for_update(of=('self',)).filter(pk=pk, availability=True).first()
+        if driver is None:
+            load_index.driver_deleted(pk)
+            continue
+        if load_index.verify(pk, driver.active_delivery_count):
+            return driver
+    return least_loaded_driver()
+
+
+def assign_driver():
+    """Pick a driver for a new delivery.
+
+    Uses the in-memory DriverLoadIndex, confirmed under a row lock, when
+    DRIVER_LOAD_INDEX_ENABLED is set and the locked aggregate query
+    otherwise. Must run inside transaction.atomic(). Returns a (driver, created)
+    tuple; created is True when there were no drivers at all and an
+    emergency driver had to be registered.
+    """
+    if getattr(settings, 'DRIVER_LOAD_INDEX_ENABLED', True):
+        driver = _indexed_driver()
+    else:
+        driver = least_loaded_driver()
+    if driver is not None:
+        return driver, False
+    # Si no hay conductores disponibles, buscar cualquier conductor
+    driver = drivers_by_load().first()
+    if driver is not None:
+        return driver, False
+    # Si no hay conductores en el sistema, crear uno de emergencia
+    driver = Driver.objects.create(
+        name='Conductor de Emergencia',
+        email='emergencia@example.com',
+        phone_number='555-0000',
+        vehicle_type='Moto',
+        availability=True
+    )
+    return driver, True
+
+
+def release_driver(driver):
+    """Undo an assign_driver() reservation whose delivery was not created"""
+    if getattr(settings, 'DRIVER_LOAD_INDEX_ENABLED', True):
+        load_index.release(driver.pk)
+
+
+def shift_driver_loads(deltas):
+    """Apply {driver_id: delta} to Driver.active_delivery_count with one UPDATE"""
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    Driver.objects.filter(pk__in=deltas).update(active_delivery_count=Greatest(
+        F('active_delivery_count') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+
+
+def record_delivery_change(old, new):
+    """Move the driver counters between two (driver_id, delivery_status) snapshots.
+
+    ``old`` is None for new deliveries and ``new`` is None for deleted ones.
+    """
+    deltas = {}
+    for snap, sign in ((old, -1), (new, 1)):
+        if snap is not None and snap[1] in Delivery.ACTIVE_STATUSES:
+            deltas[snap[0]] = deltas.get(snap[0], 0) + sign
+    shift_driver_loads(deltas)
+
+
+def driver_load_drift(driver_ids=None):
+    """Drivers whose active_delivery_count disagrees with their deliveries.
+
+    Returns {driver_pk: {'counter': n, 'database': n}}.
+    """
+    drivers = drivers_by_load()
+    if driver_ids is not None:
+        drivers = drivers.filter(pk__in=driver_ids)
+    return {
+        pk: {'counter': counter, 'database': actual}
+        for pk, counter, actual in (
+            drivers.exclude(active_delivery_count=F('active_deliveries'))
+            .values_list('pk', 'active_delivery_count', 'active_deliveries')
+        )
+    }
+
+
+def rebuild_driver_loads(driver_ids=None):
+    """Recompute active_delivery_count from the deliveries with one UPDATE"""
+    drivers = Driver.objects.all() if driver_ids is None else Driver.objects.filter(pk__in=driver_ids)
+    active = (
+        Delivery.objects
+        .filter(driver=OuterRef('pk'), delivery_status__in=Delivery.ACTIVE_STATUSES)
+        .order_by()
+        .values('driver')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return drivers.update(active_delivery_count=Coalesce(Subquery(active, output_field=IntegerField()), 0))
@@ -0,0 +1,126 @@
+from datetime import time
+from decimal import Decimal
+
+import factory
+from django.utils import timezone
+from factory.django import DjangoModelFactory
+from factory.random import randgen
+
+from .models import (
+    Restaurant, Product, Client, Order, OrderItem, Driver, Delivery, Review, ClientStats, OutboundEmail,
+)
+
+# Todos los valores aleatorios salen de Faker o de randgen, así que
+# factory.random.reseed_random(seed) hace la generación reproducible.
+
+
+class RestaurantFactory(DjangoModelFactory):
+    class Meta:
+        model = Restaurant
+
+    name = factory.Faker('company')
+    address = factory.Faker('street_address')
+    phone_number = factory.Faker('numerify', text='33########')
+    opening_time = factory.LazyFunction(lambda: time(randgen.randint(6, 11)))
+    closing_time = factory.LazyFunction(lambda: time(randgen.randint(18, 23)))
+
+
+class ProductFactory(DjangoModelFactory):
+    class Meta:
+        model = Product
+
+    restaurant = factory.SubFactory(RestaurantFactory)
+    name = factory.Faker('sentence', nb_words=3)
+    price = factory.Faker('pydecimal', left_digits=3, right_digits=2, min_value=20, max_value=450)
+    description = factory.Faker('paragraph', nb_sentences=2)
+    # ~90 % de los productos están disponibles
+    availability = factory.Faker('pybool', truth_probability=90)
+
+
+class ClientFactory(DjangoModelFactory):
+    class Meta:
+        model = Client
+
+    name = factory.Faker('name')
+    email = factory.Faker('email')
+    address = factory.Faker('street_address')
+    phone_number = factory.Faker('numerify', text='33########')
+
+
+class DriverFactory(DjangoModelFactory):
+    class Meta:
+        model = Driver
+
+    name = factory.Faker('name')
+    email = factory.Faker('email')
+    phone_number = factory.Faker('numerify', text='33########')
+    vehicle_type = factory.Faker('random_element', elements=['Moto', 'Bicicleta', 'Auto'])
+
+
+class OrderFactory(DjangoModelFactory):
+    class Meta:
+        model = Order
+
+    client = factory.SubFactory(ClientFactory)
+    restaurant = factory.SubFactory(RestaurantFactory)
+    status = factory.Faker('random_element', elements=['pending', 'in_progress', 'delivered',
+                                                       'delivered', 'delivered', 'cancelled'])
+    total = factory.Faker('pydecimal', left_digits=4, right_digits=2, min_value=50, max_value=2500)
+    delivery_date = factory.LazyFunction(timezone.now)
+    delivery_address = factory.Faker('street_address')
+    payment_method = factory.Faker('random_element', elements=['credit_card', 'debit_card', 'cash'])
+    comments = ''
+
+
+class OrderItemFactory(DjangoModelFactory):
+    class Meta:
+        model = OrderItem
+
+    order = factory.SubFactory(OrderFactory)
+    product = factory.SubFactory(ProductFactory)
+    quantity = factory.Faker('random_int', min=1, max=4)
+    unit_price = factory.LazyAttribute(lambda o: o.product.price or Decimal('0'))
+
+
+class DeliveryFactory(DjangoModelFactory):
+    class Meta:
+        model = Delivery
+
+    order = factory.SubFactory(OrderFactory)
+    driver = factory.SubFactory(DriverFactory)
+    delivery_date = factory.LazyFunction(timezone.now)
+    delivery_time = factory.LazyFunction(lambda: timezone.now().time())
+    delivery_status = factory.LazyAttribute(lambda o: {
+        'pending': 'pending',
+        'in_progress': 'in_transit',
+        'cancelled': 'failed',
+    }.get(o.order.status, 'delivered'))
+
+
+class ReviewFactory(DjangoModelFactory):
+    class Meta:
+        model = Review
+
+    order = factory.SubFactory(OrderFactory)
+    client = factory.SelfAttribute('order.client')
+    restaurant = factory.SelfAttribute('order.restaurant')
+    rating = factory.Faker('random_int', min=1, max=5)
+    comment = factory.Faker('sentence', nb_words=10)
+
+
+class ClientStatsFactory(DjangoModelFactory):
+    """Empty stats row; seed_load computes the real values from the orders"""
+    class Meta:
+        model = ClientStats
+
+    client = factory.SubFactory(ClientFactory)
+
+
+class OutboundEmailFactory(DjangoModelFactory):
+    class Meta:
+        model = OutboundEmail
+
+    subject = factory.Faker('sentence', nb_words=5)
+    body = factory.Faker('paragraph', nb_sentences=4)
+    from_email = 'RAPPITESO <no-reply@example.com>'
+    to = factory.List([factory.Faker('email')])
@@ -0,0 +1,181 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .dispatch import shift_driver_loads
+from .load_index import load_index
+from .models import ClientStats, Delivery, Order
+
+# Transiciones permitidas de Order.status
+ORDER_TRANSITIONS = {
+    'pending': ('in_progress', 'cancelled'),
+    'in_progress': ('delivered', 'cancelled'),
+    'delivered': (),
+    'cancelled': (),
+}
+
+# Transiciones permitidas de Delivery.delivery_status
+DELIVERY_TRANSITIONS = {
+    'pending': ('in_transit', 'failed'),
+    'in_transit': ('delivered', 'failed'),
+    'delivered': (),
+    'failed': (),
+}
+
+# Estado que toma la entrega activa cuando el pedido llega a un estado final
+DELIVERY_STATUS_FOR_ORDER = {
+    'delivered': 'delivered',
+    'cancelled': 'failed',
+}
+
+MAX_BULK_TRANSITION = 1000
+
+
+class InvalidTransition(ValueError):
+    """The current status does not allow moving to the target status"""
+
+
+class TransitionConflict(Exception):
+    """The row changed since it was read: its version is no longer the expected one"""
+
+
+def can_transition(current, target, transitions=ORDER_TRANSITIONS):
+    return target in transitions.get(current, ())
+
+
+def transition_order(order, target):
+    """Move one order to ``target`` only if nobody changed it since it was read.
+
+    ``order`` needs ``pk``, ``client_id``, ``status`` and ``version``
+    loaded; the row is written with ``UPDATE ... WHERE version = ...`` and
+    never re-saved, so the check costs no extra read. Raises
+    InvalidTransition when ``order.status`` doesn't allow ``target`` and
+    TransitionConflict when the version moved on in between. On success the
+    instance is updated in place and returned.
+    """
+    if target not in ORDER_TRANSITIONS:
+        raise ValueError(f'Unknown order status: {target!r}')
+    if not can_transition(order.status, target):
+        raise InvalidTransition(f'Order {order.pk}: {order.status} -> {target}')
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, version=order.version).update(
+            status=target, version=F('version') + 1
+        )
+        if not updated:
+            raise TransitionConflict(f'Order {order.pk} changed since version {order.version}')
+        _sync_deliveries([order.pk], target)
+        _shift_pending_orders({
+            order.client_id: (target in Order.OPEN_STATUSES) - (order.status in Order.OPEN_STATUSES)
+        })
+    order.status = target
+    order.version += 1
+    return order
+
+
+def transition_delivery(delivery, target):
+    """Move one delivery to ``target`` only if nobody changed it since it was read.
+
+    Same contract as transition_order; ``delivery`` needs ``pk``,
+    ``driver_id``, ``delivery_status`` and ``version`` loaded.
+    """
+    if target not in DELIVERY_TRANSITIONS:
+        raise ValueError(f'Unknown delivery status: {target!r}')
+    if not can_transition(delivery.delivery_status, target, DELIVERY_TRANSITIONS):
+        raise InvalidTransition(f'Delivery {delivery.pk}: {delivery.delivery_status} -> {target}')
+    with transaction.atomic():
+        updated = Delivery.objects.filter(pk=delivery.pk, version=delivery.version).update(
+            delivery_status=target, version=F('version') + 1
+        )
+        if not updated:
+            raise TransitionConflict(f'Delivery {delivery.pk} changed since version {delivery.version}')
+        active = Delivery.ACTIVE_STATUSES
+        shift_driver_loads({delivery.driver_id: (target in active) - (delivery.delivery_status in active)})
+        saved = Delivery(pk=delivery.pk, driver_id=delivery.driver_id, delivery_status=target)
+        transaction.on_commit(lambda: load_index.delivery_saved(saved))
+    delivery.delivery_status = target
+    delivery.version += 1
+    return delivery
+
+
+def bulk_transition(order_ids, target):
+    """Move many orders to ``target`` with set-based UPDATEs in one transaction.
+
+    The orders are locked and read with one query; those whose current
+    status allows the transition are updated with a single UPDATE, their
+    active deliveries follow DELIVERY_STATUS_FOR_ORDER, and the pending
+    counters of ClientStats move with one F() update, so the cost does not
+    grow with the number of orders. Returns ``{order_id: result}`` where
+    result has ``ok``, ``from`` (the previous status, None when the order
+    does not exist) and ``error`` ('not_found' or 'invalid_transition').
+    """
+    if target not in ORDER_TRANSITIONS:
+        raise ValueError(f'Unknown order status: {target!r}')
+    ids = list(dict.fromkeys(order_ids))
+    results = {}
+    moved = []
+    pending = Counter()
+    with transaction.atomic():
+        rows = {
+            pk: (status, client_id)
+            for pk, status, client_id in (
+                Order.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'status', 'client_id')
+            )
+        }
+        for pk in ids:
+            if pk not in rows:
+                results[pk] = {'ok': False, 'from': None, 'error': 'not_found'}
+                continue
+            status, client_id = rows[pk]
+            if not can_transition(status, target):
+                results[pk] = {'ok': False, 'from': status, 'error': 'invalid_transition'}
+                continue
+            results[pk] = {'ok': True, 'from': status, 'error': None}
+            moved.append(pk)
+            pending[client_id] += (target in Order.OPEN_STATUSES) - (status in Order.OPEN_STATUSES)
+
+        if moved:
+            Order.objects.filter(pk__in=moved).update(status=target, version=F('version') + 1)
+            _sync_deliveries(moved, target)
+            _shift_pending_orders(pending)
+    return results
+
+
+def _sync_deliveries(order_ids, target):
+    status = DELIVERY_STATUS_FOR_ORDER.get(target)
+    if status is None:
+        return
+    # Bloqueadas hasta el final: los contadores de carga restan exactamente estas
+    active = list(
+        Delivery.objects.select_for_update()
+        .filter(order_id__in=order_ids, delivery_status__in=Delivery.ACTIVE_STATUSES)
+        .values_list('pk', 'driver_id')
+    )
+    if not active:
+        return
+    Delivery.objects.filter(pk__in=[pk for pk, _ in active]).update(
+        delivery_status=status, version=F('version') + 1
+    )
+    released = Counter()
+    for _, driver_id in active:
+        released[driver_id] -= 1
+    shift_driver_loads(released)
+
+    # update() no dispara las señales: el índice de carga se actualiza aquí
+    def release_drivers():
+        for pk, driver_id in active:
+            load_index.delivery_saved(Delivery(pk=pk, driver_id=driver_id, delivery_status=status))
+    transaction.on_commit(release_drivers)
+
+
+def _shift_pending_orders(deltas):
+    deltas = {client_id: delta for client_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Clientes sin fila de estadísticas la calculan completa al leer su perfil
+    ClientStats.objects.filter(client_id__in=deltas).update(
+        pending_orders=F('pending_orders') + Case(
+            *[When(client_id=client_id, then=Value(delta)) for client_id, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,235 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Driver, Delivery
+
+logger = logging.getLogger(__name__)
+
+
+class DriverLoadIndex:
+    """In-memory min-heap of available drivers keyed by active delivery count.
+
+    Each process keeps its own copy: it is built lazily from the database,
+    updated incrementally from Delivery/Driver signals and rebuilt every
+    ``DRIVER_LOAD_INDEX_TTL`` seconds so assignments made by other processes
+    are eventually picked up. Heap entries are invalidated lazily, so every
+    update and every pop is O(log n).
+
+    Drift (the index disagreeing with the database) is counted per process,
+    both on the TTL rebuilds and when dispatch corrects a popped driver, and
+    reported by report().
+    """
+
+    def __init__(self, ttl=None):
+        self._lock = threading.RLock()
+        self._ttl = ttl
+        self._built_at = None
+        self._heap = []
+        self._loads = {}
+        self._available = set()
+        self._active = {}
+        self._reserved = Counter()
+        self._rebuilds = 0
+        self._drift_events = 0
+        self._drifted_drivers = 0
+        self._last_drift = {}
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'DRIVER_LOAD_INDEX_TTL', 60)
+
+    def invalidate(self):
+        """Drop the current state; the next access rebuilds from the database"""
+        with self._lock:
+            self._built_at = None
+
+    def rebuild(self):
+        """Reload availability and active deliveries with two queries"""
+        available = set(Driver.objects.filter(availability=True).values_list('pk', flat=True))
+        active = dict(
+            Delivery.objects
+            .filter(delivery_status__in=Delivery.ACTIVE_STATUSES)
+            .values_list('pk', 'driver_id')
+        )
+        loads = Counter(active.values())
+        with self._lock:
+            if self._built_at is not None:
+                self._rebuilds += 1
+                self._record_drift(self._diff(available, loads))
+            self._available = available
+            self._active = active
+            self._loads = {pk: loads.get(pk, 0) for pk in available | set(loads)}
+            self._reserved.clear()
+            self._heap = [(self._loads[pk], pk) for pk in available]
+            heapq.heapify(self._heap)
+            self._built_at = time.monotonic()
+
+    def _record_drift(self, drift):
+        if not drift:
+            return
+        logger.warning('Driver load index drifted for %d drivers: %s', len(drift), drift)
+        self._drift_events += 1
+        self._drifted_drivers += len(drift)
+        self._last_drift = drift
+
+    def _ensure_built(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self.rebuild()
+
+    def _push(self, pk):
+        heapq.heappush(self._heap, (self._loads.get(pk, 0), pk))
+        # Compact once stale entries dominate the heap
+        if len(self._heap) > 2 * len(self._available) + 64:
+            self._heap = [(self._loads.get(p, 0), p) for p in self._available]
+            heapq.heapify(self._heap)
+
+    def _adjust(self, pk, delta):
+        self._loads[pk] = max(0, self._loads.get(pk, 0) + delta)
+        if pk in self._available:
+            self._push(pk)
+
+    def pop(self):
+        """Reserve and return the pk of the least loaded available driver.
+
+        The reservation counts as one active delivery until the Delivery row
+        is committed for that driver, or until release() is called. Returns
+        None when no driver is available.
+        """
+        with self._lock:
+            self._ensure_built()
+            while self._heap:
+                load, pk = self._heap[0]
+                if pk in self._available and self._loads.get(pk) == load:
+                    self._reserved[pk] += 1
+                    self._adjust(pk, 1)
+                    return pk
+                heapq.heappop(self._heap)
+            return None
+
+    def release(self, pk):
+        """Give back a reservation whose delivery was never committed"""
+        with self._lock:
+            if self._reserved[pk] > 0:
+                self._reserved[pk] -= 1
+                self._adjust(pk, -1)
+
+    def verify(self, pk, database_load):
+        """Check a popped driver against its active count read from the database.
+
+        Reservations of this process may or may not be committed yet, so any
+        count between the committed and the reserved load is in sync.
+        Otherwise the index is corrected; returns False (and gives back the
+        reservation) when the driver had more deliveries than the index
+        believed, so the caller should pop again.
+        """
+        with self._lock:
+            if pk not in self._loads:
+                return True
+            popped = self._loads[pk] - 1
+            committed = self._loads[pk] - self._reserved[pk]
+            if committed <= database_load <= popped:
+                return True
+            self._record_drift({pk: {'index': committed, 'database': database_load}})
+            stale = database_load > popped
+            if stale and self._reserved[pk] > 0:
+                self._reserved[pk] -= 1
+            self._loads[pk] = database_load + self._reserved[pk]
+            if pk in self._available:
+                self._push(pk)
+            return not stale
+
+    def load(self, pk):
+        with self._lock:
+            self._ensure_built()
+            return self._loads.get(pk, 0)
+
+    def delivery_saved(self, delivery):
+        with self._lock:
+            if self._built_at is None:
+                return
+            previous = self._active.pop(delivery.pk, None)
+            if previous is not None:
+                self._adjust(previous, -1)
+            if delivery.delivery_status in Delivery.ACTIVE_STATUSES:
+                self._active[delivery.pk] = delivery.driver_id
+                if previous is None and self._reserved[delivery.driver_id] > 0:
+                    # Already counted when the driver was popped
+                    self._reserved[delivery.driver_id] -= 1
+                else:
+                    self._adjust(delivery.driver_id, 1)
+
+    def delivery_deleted(self, delivery_pk):
+        with self._lock:
+            if self._built_at is None:
+                return
+            previous = self._active.pop(delivery_pk, None)
+            if previous is not None:
+                self._adjust(previous, -1)
+
+    def driver_saved(self, driver):
+        with self._lock:
+            if self._built_at is None:
+                return
+            if driver.availability and driver.pk not in self._available:
+                self._available.add(driver.pk)
+                self._push(driver.pk)
+            elif not driver.availability:
+                self._available.discard(driver.pk)
+
+    def driver_deleted(self, driver_pk):
+        with self._lock:
+            self._available.discard(driver_pk)
+            self._loads.pop(driver_pk, None)
+            self._reserved.pop(driver_pk, None)
+
+    def _diff(self, available, loads):
+        drift = {}
+        for pk in available | self._available:
+            expected = loads.get(pk, 0) if pk in available else None
+            actual = (self._loads.get(pk, 0) - self._reserved[pk]) if pk in self._available else None
+            if expected != actual:
+                drift[pk] = {'index': actual, 'database': expected}
+        return drift
+
+    def report(self):
+        """Drift counters of this process since it started"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'built': self._built_at is not None,
+                'age_seconds': None if self._built_at is None else round(time.monotonic() - self._built_at, 1),
+                'ttl_seconds': self.ttl,
+                'rebuilds': self._rebuilds,
+                'drift_events': self._drift_events,
+                'drifted_drivers': self._drifted_drivers,
+                'last_drift': {str(pk): loads for pk, loads in self._last_drift.items()},
+            }
+
+    def drift(self):
+        """Compare the index with the database without modifying it.
+
+        Returns {driver_pk: {'index': load, 'database': load}} for every
+        driver whose availability or active count disagrees; None stands for
+        "not available". In-flight reservations are not counted as drift.
+        """
+        available = set(Driver.objects.filter(availability=True).values_list('pk', flat=True))
+        loads = Counter(
+            Delivery.objects
+            .filter(delivery_status__in=Delivery.ACTIVE_STATUSES)
+            .values_list('driver_id', flat=True)
+        )
+        with self._lock:
+            if self._built_at is None:
+                self.rebuild()
+            return self._diff(available, loads)
+
+
+load_index = DriverLoadIndex()
@@ -0,0 +1,109 @@
+import statistics
+import threading
+import time
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+
+from orders.models import Restaurant, Product
+
+# Cada modo usa su propio alias: Django guarda un pool por alias
+MODES = ('fresh', 'persistent', 'pool')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request throughput with a new connection per request, persistent "
+        "connections (CONN_MAX_AGE) and the psycopg connection pool. Each simulated "
+        "request runs a few catalog queries and then ends like a Django request does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent request threads.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode.')
+        parser.add_argument('--queries', type=int, default=3, help='Queries per request.')
+        parser.add_argument('--mode', action='append', choices=MODES, dest='modes',
+                            help='Mode to run (repeatable); all by default.')
+
+    def handle(self, *args, **options):
+        base = deepcopy(settings.DATABASES[DEFAULT_DB_ALIAS])
+        if base['ENGINE'] != 'django.db.backends.postgresql':
+            raise CommandError('Connection pooling needs PostgreSQL (start the db service of docker-compose).')
+        base.get('OPTIONS', {}).pop('pool', None)
+
+        databases = {
+            'fresh': {**base, 'CONN_MAX_AGE': 0},
+            'persistent': {**base, 'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+            'pool': {
+                **base, 'CONN_MAX_AGE': 0,
+                'OPTIONS': {**base.get('OPTIONS', {}), 'pool': {
+                    'min_size': options['threads'], 'max_size': options['threads'],
+                }},
+            },
+        }
+        handler = ConnectionHandler({f'bench_{mode}': db for mode, db in databases.items()})
+        sql = [
+            f'SELECT id, name FROM {Restaurant._meta.db_table} ORDER BY rating DESC LIMIT 20',
+            f'SELECT id, name, price FROM {Product._meta.db_table} WHERE availability ORDER BY name LIMIT 30',
+            'SELECT 1',
+        ]
+
+        self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'connects':>10}")
+        for mode in options['modes'] or MODES:
+            alias = f'bench_{mode}'
+            try:
+                rps, latencies, connects = self.run_mode(handler, alias, sql, options)
+            except Exception as e:
+                self.stderr.write(f'{mode}: {e}')
+                continue
+            if mode == 'pool':
+                # Conexiones que abrió el pool, no préstamos
+                connects = handler[alias].pool.get_stats().get('connections_num', 0)
+                handler[alias].close_pool()
+            cuts = statistics.quantiles(latencies, n=100)
+            self.stdout.write(f'{mode:<12}{rps:>10.1f}{cuts[49]:>10.2f}{cuts[94]:>10.2f}{connects:>10}')
+
+    def run_mode(self, handler, alias, sql, options):
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+        latencies = []
+        connects = [0]
+        errors = []
+
+        def worker():
+            conn = handler[alias]
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    start = time.perf_counter()
+                    if conn.connection is None:
+                        with lock:
+                            connects[0] += 1
+                    with conn.cursor() as cursor:
+                        for i in range(options['queries']):
+                            cursor.execute(sql[i % len(sql)])
+                            cursor.fetchall()
+                    # Fin de la petición: lo que hace la señal request_finished
+                    conn.close_if_unusable_or_obsolete()
+                    with lock:
+                        latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        return len(latencies) / elapsed, latencies, connects[0]
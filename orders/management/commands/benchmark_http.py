@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.benchmarks import compare, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the storefront and API end to end: p50/p95/p99 latency, "
+        "queries per request and peak allocated memory, saved as JSON. "
+        "Offline mode (default) uses the test client and rolls back its writes; "
+        "--server benchmarks the read-only pages of a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario first.')
+        parser.add_argument('--memory-iterations', type=int, default=5,
+                            help='Extra requests traced with tracemalloc (0 to skip).')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (repeatable), e.g. home or api_orders.')
+        parser.add_argument('--server', help='Base URL of a running server, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Concurrent connections in server mode.')
+        parser.add_argument('--user', help='Username for the API in server mode (basic auth).')
+        parser.add_argument('--password', help='Password for --user.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON file to compare the results with.')
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Allowed relative growth of latency/memory before flagging a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when --compare finds a regression.')
+
+    def handle(self, *args, **options):
+        try:
+            results = run(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                memory_iterations=options['memory_iterations'],
+                only=options['scenarios'],
+                base_url=options['server'],
+                username=options['user'],
+                password=options['password'],
+                concurrency=options['concurrency'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{'scenario':<20}{'status':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'queries':>9}{'KiB':>9}"
+        )
+        for name, r in results['scenarios'].items():
+            lat = r['latency_ms']
+            queries = f"{r['queries']['max']}" if r['queries'] else '-'
+            memory = f"{r['peak_memory_kib']:.0f}" if r['peak_memory_kib'] is not None else '-'
+            status = ','.join(map(str, r['status']))
+            self.stdout.write(
+                f"{name:<20}{status:>8}{lat['p50']:>9.2f}{lat['p95']:>9.2f}{lat['p99']:>9.2f}"
+                f"{r['throughput_rps']:>9.1f}{queries:>9}{memory:>9}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            rows, regressed = compare(baseline, results, options['threshold'])
+            self.stdout.write(f"\nCompared with {baseline['meta'].get('commit') or options['compare']}:")
+            for name, metric, old, new, change, worse in rows:
+                line = f'{name:<20}{metric:<12}{old:>10.2f}{new:>10.2f}{change:>+9.1%}'
+                self.stdout.write(self.style.ERROR(line) if worse else line)
+            if regressed and options['fail_on_regression']:
+                raise CommandError('Performance regression against the baseline.')
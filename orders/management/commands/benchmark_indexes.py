@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from orders.models import Restaurant, Product, Client, Order, Driver, Delivery
+from orders.seeding import seed_all
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot catalog/order/dispatch queries and print their EXPLAIN "
+        "plans with and without the composite indexes from 0006_query_indexes. "
+        "Indexes are dropped inside a transaction that is rolled back; use it "
+        "on a local database only."
+    )
+
+    # Índices creados en 0006_query_indexes, por modelo
+    INDEXED_MODELS = [Restaurant, Product, Client, Order, Delivery]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-orders', type=int, default=0,
+                            help='Create this many orders (with clients, products, deliveries) first.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated data.')
+        parser.add_argument('--repeat', type=int, default=50, help='Runs of each query.')
+        parser.add_argument('--no-explain', action='store_true', help='Only print timings.')
+
+    def handle(self, *args, **options):
+        if options['seed_orders']:
+            self.seed(options['seed_orders'], options['seed'])
+
+        # Misma semilla, mismas filas: las corridas se pueden comparar entre sí
+        rng = random.Random(options['seed'])
+        client, restaurant, driver = (self.pick(model, rng) for model in (Client, Restaurant, Driver))
+        if not (client and restaurant and driver):
+            self.stderr.write('No data to benchmark; run with --seed-orders N.')
+            return
+
+        queries = {
+            'client_orders': lambda: Order.objects.filter(client=client).order_by('-creation_date')[:20],
+            'menu': lambda: Product.objects.filter(restaurant=restaurant, availability=True).order_by('name'),
+            'top_restaurants': lambda: Restaurant.objects.order_by('-rating')[:20],
+            'client_by_email': lambda: Client.objects.filter(email=client.email),
+            'client_by_name': lambda: Client.objects.filter(name=client.name),
+            'driver_deliveries': lambda: Delivery.objects.filter(driver=driver, delivery_status='delivered'),
+            'driver_active_load': lambda: Delivery.objects.filter(
+                driver=driver, delivery_status__in=Delivery.ACTIVE_STATUSES),
+        }
+
+        with_indexes = self.measure(queries, options)
+        # SQLite only allows schema changes in a transaction with FK checks off
+        with connection.constraint_checks_disabled():
+            try:
+                with transaction.atomic():
+                    self.drop_indexes()
+                    without_indexes = self.measure(queries, options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        self.stdout.write(f"\n{'query':<22}{'without (ms)':>14}{'with (ms)':>12}{'speedup':>10}")
+        for name in queries:
+            before, after = without_indexes[name]['ms'], with_indexes[name]['ms']
+            speedup = f'{before / after:.1f}x' if after else '-'
+            self.stdout.write(f'{name:<22}{before:>14.3f}{after:>12.3f}{speedup:>10}')
+
+        if not options['no_explain']:
+            for name in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+                self.stdout.write('-- without indexes')
+                self.stdout.write(without_indexes[name]['plan'])
+                self.stdout.write('-- with indexes')
+                self.stdout.write(with_indexes[name]['plan'])
+
+    def seed(self, orders, seed):
+        """Seed a catalog, clients and drivers sized for ``orders`` orders"""
+        counts = seed_all(
+            restaurants=max(orders // 200, 5),
+            products_per_restaurant=25,
+            clients=max(orders // 10, 10),
+            drivers=max(orders // 100, 5),
+            orders=orders,
+            seed=seed,
+        )
+        self.stdout.write('Seeded ' + ', '.join(f'{n} {table}' for table, n in counts._asdict().items()) + '.')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def pick(self, model, rng):
+        """A row chosen by ``rng`` with two pk lookups instead of ORDER BY RANDOM()"""
+        bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return None
+        # Los huecos de ids borrados caen en la fila siguiente
+        pk = rng.randint(bounds['low'], bounds['high'])
+        return model.objects.filter(pk__gte=pk).order_by('pk').first()
+
+    def drop_indexes(self):
+        with connection.schema_editor(atomic=False) as editor:
+            for model in self.INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def measure(self, queries, options):
+        results = {}
+        for name, build in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                'ms': statistics.median(timings),
+                'plan': '' if options['no_explain'] else build().explain(),
+            }
+        return results
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders import catalog
+from orders.ratings import rebuild_restaurant_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the review count, sum and average rating of every restaurant "
+        "from its reviews, e.g. after bulk loads or raw updates that skip signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Restaurants per grouped query.')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_restaurant_ratings(batch_size=options['batch_size'])
+        catalog.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the rating of {rebuilt} restaurant(s).'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.dispatch import driver_load_drift, rebuild_driver_loads
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare each driver's active_delivery_count, which every worker uses to "
+        "confirm the pick of its in-memory load index, with the active deliveries "
+        "in the database. Exits with status 1 when drift is found, so it can be "
+        "alerted on; --fix rewrites the drifted counters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Recompute the counters of the drifted drivers from their deliveries.',
+        )
+
+    def handle(self, *args, **options):
+        drift = driver_load_drift()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Driver load counters are in sync with the database.'))
+            return
+
+        for pk, loads in sorted(drift.items()):
+            self.stdout.write(f"Driver {pk}: counter={loads['counter']} database={loads['database']}")
+
+        if options['fix']:
+            rebuild_driver_loads(list(drift))
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the counters of {len(drift)} driver(s).'))
+        # Código de salida 1 para alertar aunque se haya corregido
+        raise CommandError(f'{len(drift)} driver(s) drifted.', returncode=1)
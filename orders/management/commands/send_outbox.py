@@ -0,0 +1,40 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from orders.outbox import deliver_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Emails sent per SMTP connection.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads sending batches in parallel.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting when it is empty.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            sent, failed = deliver_pending(options['batch_size'], options['workers'])
+            self.stdout.write(f'Sent {sent} email(s), {failed} failed.')
+            return
+        while True:
+            try:
+                sent, failed = deliver_pending(options['batch_size'], options['workers'])
+            except Exception:
+                # Un error transitorio de la base no debe detener el envío
+                logger.exception('Error delivering the outbox; retrying in %s s', options['interval'])
+                connections.close_all()
+            else:
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent} email(s), {failed} failed.')
+            time.sleep(options['interval'])
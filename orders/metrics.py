@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Límites (segundos) del histograma de latencia, como los de Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ViewMetrics:
+    __slots__ = ('requests', 'errors', 'seconds', 'db_seconds', 'queries', 'duplicate_queries',
+                 'response_bytes', 'buckets')
+
+    def __init__(self):
+        self.requests = self.errors = self.queries = self.duplicate_queries = self.response_bytes = 0
+        self.seconds = self.db_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class RequestMetrics:
+    """Per-view request counters of this process, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(_ViewMetrics)
+
+    def record(self, view, method, status, seconds, db_seconds, queries, duplicate_queries, response_bytes):
+        with self._lock:
+            m = self._views[view, method]
+            m.requests += 1
+            m.errors += status >= 500
+            m.seconds += seconds
+            m.db_seconds += db_seconds
+            m.queries += queries
+            m.duplicate_queries += duplicate_queries
+            m.response_bytes += response_bytes
+            m.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def snapshot(self):
+        """{(view, method): dict of totals}"""
+        with self._lock:
+            return {
+                key: {name: getattr(m, name) for name in _ViewMetrics.__slots__}
+                for key, m in self._views.items()
+            }
+
+    def render(self):
+        counters = [
+            ('requests', 'requests_total', 'Requests handled.'),
+            ('errors', 'errors_total', 'Requests answered with a 5xx status.'),
+            ('db_seconds', 'db_seconds_total', 'Time spent in database queries.'),
+            ('queries', 'db_queries_total', 'Database queries executed.'),
+            ('duplicate_queries', 'db_duplicate_queries_total',
+             'Queries repeating an SQL statement already run in the same request (N+1).'),
+            ('response_bytes', 'response_bytes_total', 'Bytes of non-streaming response bodies.'),
+        ]
+        snapshot = self.snapshot()
+        lines = []
+        for field, name, help_text in counters:
+            lines += [f'# HELP rappiteso_http_{name} {help_text}', f'# TYPE rappiteso_http_{name} counter']
+            for (view, method), m in sorted(snapshot.items()):
+                lines.append(f'rappiteso_http_{name}{{{_labels(view, method)}}} {m[field]}')
+
+        lines += ['# HELP rappiteso_http_request_duration_seconds Wall time of each request.',
+                  '# TYPE rappiteso_http_request_duration_seconds histogram']
+        for (view, method), m in sorted(snapshot.items()):
+            labels = _labels(view, method)
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), m['buckets']):
+                cumulative += count
+                lines.append(f'rappiteso_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'rappiteso_http_request_duration_seconds_sum{{{labels}}} {m["seconds"]}')
+            lines.append(f'rappiteso_http_request_duration_seconds_count{{{labels}}} {m["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(view, method):
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}"'
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,164 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+from .metrics import request_metrics
+
+logger = logging.getLogger(__name__)
+
+# Cualquier otro método se cuenta como OTHER: el cliente elige el texto y
+# cada valor distinto sería una serie nueva en las métricas
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'])
+
+# Recorder of the request being handled. A context variable rather than a
+# per-connection wrapper so async views, whose queries run in worker
+# threads with their own connections, are recorded too.
+_current_recorder = ContextVar('current_query_recorder', default=None)
+
+
+class QueryRecorder:
+    """Execute wrapper counting queries, their time and repeated SQL statements"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            # El SQL lleva placeholders: la misma consulta con otros parámetros comparte huella
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self.statements.values())
+
+
+def _route_to_recorder(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Send the queries of a connection to the recorder of the current request"""
+    if _route_to_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _route_to_recorder)
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, DB queries/time, repeated queries and response size per view.
+
+    Totals go to the in-process registry in orders.metrics (served by the
+    metrics view) and, unless REQUEST_METRICS_SERVER_TIMING is False, to a
+    Server-Timing header. A request that runs one statement more than
+    REQUEST_METRICS_NPLUSONE_THRESHOLD times logs a warning. Works in
+    both sync and async stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened later are hooked by the connection_created receiver
+        for conn in connections.all(initialized_only=True):
+            install_query_recorder(conn)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._finish(request, response, recorder, time.perf_counter() - start)
+
+    def _finish(self, request, response, recorder, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        method = request.method if request.method in HTTP_METHODS else 'OTHER'
+        request_metrics.record(view, method, response.status_code, elapsed, recorder.seconds,
+                               recorder.count, recorder.duplicates, size)
+
+        threshold = getattr(settings, 'REQUEST_METRICS_NPLUSONE_THRESHOLD', 10)
+        if recorder.statements:
+            sql, repeated = recorder.statements.most_common(1)[0]
+            if repeated > threshold:
+                logger.warning('Possible N+1 in %s: statement ran %d times: %.200s', view, repeated, sql)
+
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = ', '.join([
+                f'app;dur={elapsed * 1000:.1f}',
+                f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"',
+                f'dup;desc="{recorder.duplicates} repeated queries"',
+            ])
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """Scope replica routing (orders.routers) to the request and pin writers to the primary.
+
+    A request that writes sets a short-lived cookie so the client's next
+    requests, e.g. the redirect after checkout, also read the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = routers.begin_request(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.end_request(token)
+        return self._pin(response, state)
+
+    async def __acall__(self, request):
+        token = routers.begin_request(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = routers.end_request(token)
+        return self._pin(response, state)
+
+    def _pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(routers.PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_orderitem_order_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientStats',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='orders.client')),
+                ('total_orders', models.IntegerField(default=0)),
+                ('pending_orders', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('favorite_restaurant_orders', models.IntegerField(default=0)),
+                ('favorite_restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.restaurant')),
+            ],
+            options={
+                'verbose_name': 'Client Stats',
+                'verbose_name_plural': 'Client Stats',
+            },
+        ),
+    ]
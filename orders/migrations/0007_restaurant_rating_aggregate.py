@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:44
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Restaurant = apps.get_model('orders', 'Restaurant')
+    Review = apps.get_model('orders', 'Review')
+    rows = Review.objects.order_by().values('restaurant_id').annotate(count=Count('pk'), total=Sum('rating'))
+    totals = {row['restaurant_id']: (row['count'], int(row['total'])) for row in rows}
+    restaurants = list(Restaurant.objects.only('pk', 'rating'))
+    for restaurant in restaurants:
+        count, total = totals.get(restaurant.pk, (0, 0))
+        restaurant.rating_count = count
+        restaurant.rating_sum = total
+        # Sin reseñas se conserva la calificación capturada a mano
+        if count:
+            restaurant.rating = (Decimal(total) / count).quantize(Decimal('0.01'))
+    Restaurant.objects.bulk_update(restaurants, ['rating_count', 'rating_sum', 'rating'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=4),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+# Índice de texto completo de restaurantes y productos (orders.search): columnas
+# tsvector generadas con índice GIN en Postgres, tablas FTS5 con triggers en
+# SQLite. El DDL depende del backend, así que no son campos de los modelos.
+# Copiado tal cual lo generaba orders.search en esta versión: la migración no
+# debe cambiar si el módulo cambia después.
+
+FORWARD = {
+    'postgresql': [
+        "ALTER TABLE orders_restaurant ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('spanish', coalesce(address, '')), 'B')) STORED",
+        'CREATE INDEX IF NOT EXISTS orders_restaurant_search_idx ON orders_restaurant USING gin (search_vector)',
+        "ALTER TABLE orders_product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')) STORED",
+        'CREATE INDEX IF NOT EXISTS orders_product_search_idx ON orders_product USING gin (search_vector)',
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS orders_restaurant_fts USING fts5(name, address, "
+        "content='orders_restaurant', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER IF NOT EXISTS orders_restaurant_fts_ai AFTER INSERT ON orders_restaurant BEGIN '
+        'INSERT INTO orders_restaurant_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END',
+        'CREATE TRIGGER IF NOT EXISTS orders_restaurant_fts_ad AFTER DELETE ON orders_restaurant BEGIN '
+        "INSERT INTO orders_restaurant_fts(orders_restaurant_fts, rowid, name, address) "
+        "VALUES ('delete', old.id, old.name, old.address); END",
+        'CREATE TRIGGER IF NOT EXISTS orders_restaurant_fts_au AFTER UPDATE ON orders_restaurant BEGIN '
+        "INSERT INTO orders_restaurant_fts(orders_restaurant_fts, rowid, name, address) "
+        "VALUES ('delete', old.id, old.name, old.address); "
+        'INSERT INTO orders_restaurant_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END',
+        "INSERT INTO orders_restaurant_fts(orders_restaurant_fts) VALUES ('rebuild')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS orders_product_fts USING fts5(name, description, "
+        "content='orders_product', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER IF NOT EXISTS orders_product_fts_ai AFTER INSERT ON orders_product BEGIN '
+        'INSERT INTO orders_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END',
+        'CREATE TRIGGER IF NOT EXISTS orders_product_fts_ad AFTER DELETE ON orders_product BEGIN '
+        "INSERT INTO orders_product_fts(orders_product_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        'CREATE TRIGGER IF NOT EXISTS orders_product_fts_au AFTER UPDATE ON orders_product BEGIN '
+        "INSERT INTO orders_product_fts(orders_product_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        'INSERT INTO orders_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END',
+        "INSERT INTO orders_product_fts(orders_product_fts) VALUES ('rebuild')",
+    ],
+}
+
+BACKWARD = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS orders_restaurant_search_idx',
+        'ALTER TABLE orders_restaurant DROP COLUMN IF EXISTS search_vector',
+        'DROP INDEX IF EXISTS orders_product_search_idx',
+        'ALTER TABLE orders_product DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS orders_restaurant_fts_ai',
+        'DROP TRIGGER IF EXISTS orders_restaurant_fts_ad',
+        'DROP TRIGGER IF EXISTS orders_restaurant_fts_au',
+        'DROP TABLE IF EXISTS orders_restaurant_fts',
+        'DROP TRIGGER IF EXISTS orders_product_fts_ai',
+        'DROP TRIGGER IF EXISTS orders_product_fts_ad',
+        'DROP TRIGGER IF EXISTS orders_product_fts_au',
+        'DROP TABLE IF EXISTS orders_product_fts',
+    ],
+}
+
+
+def install_search_index(apps, schema_editor):
+    # Otros backends buscan con icontains y no necesitan DDL
+    for sql in FORWARD.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql, params=None)
+
+
+def uninstall_search_index(apps, schema_editor):
+    for sql in BACKWARD.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_restaurant_rating_aggregate'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def link_batch(Client, users):
+    # El checkout anterior buscaba el cliente por nombre completo o username;
+    # si no hay coincidencia se intenta con el email
+    keys = {user.pk: f'{user.first_name} {user.last_name}'.strip() or user.username for user in users}
+    free = Client.objects.filter(user__isnull=True).order_by('pk')
+    by_name, by_email = {}, {}
+    for pk, name in free.filter(name__in=set(keys.values())).values_list('pk', 'name'):
+        by_name.setdefault(name, pk)
+    for pk, email in free.filter(email__in={u.email for u in users if u.email}).values_list('pk', 'email'):
+        by_email.setdefault(email, pk)
+
+    taken = set()
+    links = []
+    for user in users:
+        for pk in (by_name.get(keys[user.pk]), by_email.get(user.email) if user.email else None):
+            if pk is not None and pk not in taken:
+                taken.add(pk)
+                links.append(Client(pk=pk, user_id=user.pk))
+                break
+    Client.objects.bulk_update(links, ['user'])
+
+
+def link_clients_to_users(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Client = apps.get_model('orders', 'Client')
+    users = User.objects.order_by('pk').only('pk', 'username', 'first_name', 'last_name', 'email')
+    batch = []
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        batch.append(user)
+        if len(batch) == BATCH_SIZE:
+            link_batch(Client, batch)
+            batch = []
+    if batch:
+        link_batch(Client, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_client_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(link_clients_to_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_history_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
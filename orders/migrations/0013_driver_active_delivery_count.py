@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_active_delivery_count(apps, schema_editor):
+    Driver = apps.get_model('orders', 'Driver')
+    Delivery = apps.get_model('orders', 'Delivery')
+    active = (
+        Delivery.objects
+        .filter(driver=OuterRef('pk'), delivery_status__in=['pending', 'in_transit'])
+        .order_by()
+        .values('driver')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Driver.objects.update(active_delivery_count=Coalesce(Subquery(active, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_state_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='active_delivery_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_active_delivery_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_driver_active_delivery_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='restaurant',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Editable only while the restaurant has no reviews.', max_digits=4),
+        ),
+    ]
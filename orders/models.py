@@ -1,4 +1,6 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 
 # Create your models here.
 class Restaurant(models.Model):
@@ -7,14 +9,27 @@ class Restaurant(models.Model):
     phone_number = models.CharField(max_length=20)
     opening_time = models.TimeField()
     closing_time = models.TimeField()
-    rating = models.DecimalField(max_digits=4, decimal_places=2)
+    # Promedio de las reseñas, mantenido por orders.ratings al escribir Review;
+    # sin reseñas conserva la calificación capturada en el admin
+    rating = models.DecimalField(max_digits=4, decimal_places=2, default=0,
+                                 help_text='Editable only while the restaurant has no reviews.')
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    @property
+    def has_reviews(self):
+        return self.rating_count > 0
+
     class Meta:
         verbose_name = "Restaurant"
         verbose_name_plural = "Restaurants"
+        indexes = [
+            # Listados del catálogo ordenados por calificación
+            models.Index(fields=['-rating'], name='restaurant_rating_idx'),
+        ]
 
 class Product(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
@@ -29,8 +44,17 @@ class Product(models.Model):
     class Meta:
         verbose_name = "Product"
         verbose_name_plural = "Products"
+        indexes = [
+            # Menú de un restaurante: solo productos disponibles, por nombre
+            models.Index(fields=['restaurant', 'name'], name='product_menu_idx',
+                         condition=models.Q(availability=True)),
+        ]
 
 class Client(models.Model):
+    # Cuenta dueña del cliente; los clientes cargados sin cuenta quedan en NULL
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='client'
+    )
     name = models.CharField(max_length=200)
     email = models.EmailField()
     address = models.CharField(max_length=300)
@@ -43,6 +67,10 @@ class Client(models.Model):
     class Meta:
         verbose_name = "Client"
         verbose_name_plural = "Clients"
+        indexes = [
+            models.Index(fields=['email'], name='client_email_idx'),
+            models.Index(fields=['name'], name='client_name_idx'),
+        ]
 
 class Order(models.Model):
 
@@ -53,6 +81,9 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
+    # Estados que cuentan como pedidos pendientes del cliente
+    OPEN_STATUSES = ('pending', 'in_progress')
+
     PAYMENT_METHOD_CHOICES = [
         ('credit_card', 'Credit Card'),
         ('debit_card', 'Debit Card'),
@@ -63,6 +94,8 @@ class Order(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
     creation_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Sube en cada cambio de estado; ver orders.lifecycle
+    version = models.PositiveIntegerField(default=0, editable=False)
     total = models.DecimalField(max_digits=8, decimal_places=2)
     delivery_date = models.DateTimeField()
     delivery_address = models.CharField(max_length=300)
@@ -73,9 +106,19 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.id} - {self.client.name}"
 
+    def save(self, *args, **kwargs):
+        # Las estadísticas del cliente se mueven con la fila anterior bloqueada (orders.signals)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        indexes = [
+            # Historial de pedidos de un cliente, más recientes primero; el id
+            # desempata la paginación por llave (creation_date, id)
+            models.Index(fields=['client', '-creation_date', '-id'], name='order_client_created_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -96,6 +139,8 @@ class Driver(models.Model):
     phone_number = models.CharField(max_length=20)
     vehicle_type = models.CharField(max_length=100)
     availability = models.BooleanField(default=True)
+    # Entregas en ACTIVE_STATUSES, mantenido por orders.dispatch con UPDATEs F()
+    active_delivery_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -113,18 +158,34 @@ class Delivery(models.Model):
         ('failed', 'Failed'),
     ]
 
+    # Estados que cuentan como carga activa del conductor
+    ACTIVE_STATUSES = ('pending', 'in_transit')
+
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
     driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
     delivery_date = models.DateTimeField()
     delivery_time = models.TimeField()
     delivery_status = models.CharField(max_length=30, choices=DELIVERY_STATUS_CHOICES, default='pending')
+    # Sube en cada cambio de estado; ver orders.lifecycle
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Delivery {self.id} - {self.order.id}"
 
+    def save(self, *args, **kwargs):
+        # La carga del conductor se mueve con la fila anterior bloqueada (orders.signals)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Delivery"
         verbose_name_plural = "Deliveries"
+        indexes = [
+            models.Index(fields=['driver', 'delivery_status'], name='delivery_driver_status_idx'),
+            # Carga activa de los conductores; solo indexa ACTIVE_STATUSES
+            models.Index(fields=['driver'], name='delivery_active_driver_idx',
+                         condition=models.Q(delivery_status__in=['pending', 'in_transit'])),
+        ]
 
 class Review(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
@@ -141,4 +202,59 @@ class Review(models.Model):
         verbose_name = "Review"
         verbose_name_plural = "Reviews"
 
+class ClientStats(models.Model):
+    """Profile statistics of a client, kept up to date on every Order write"""
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_orders = models.IntegerField(default=0)
+    pending_orders = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    favorite_restaurant = models.ForeignKey(
+        Restaurant, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    favorite_restaurant_orders = models.IntegerField(default=0)
+
+    @property
+    def average_ticket(self):
+        if not self.total_orders:
+            return 0
+        return self.total_spent / self.total_orders
+
+    def __str__(self):
+        return f"Stats of {self.client.name}"
+
+    class Meta:
+        verbose_name = "Client Stats"
+        verbose_name_plural = "Client Stats"
+
+class OutboundEmail(models.Model):
+    """Email queued in the sender's transaction and delivered by the send_outbox command"""
 
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Próximo intento; para correos en 'sending' es el fin del bloqueo del worker
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+    class Meta:
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
@@ -0,0 +1,144 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db.models import Prefetch
+from django.template.loader import get_template
+
+from .models import Order, OrderItem
+from .outbox import enqueue_emails
+
+CONFIRMATION_TEMPLATE = 'email/order_confirmation.html'
+
+RenderedEmail = namedtuple('RenderedEmail', 'order to subject body html_body')
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    """Compiled template, loaded and parsed once per process"""
+    return get_template(name)
+
+
+def clear_template_cache():
+    _template.cache_clear()
+
+
+def _customer(order, user):
+    """(name, email) of the recipient: the user when given, else the order's client"""
+    if user is not None:
+        return user.get_full_name() or user.username, user.email
+    return order.client.name, order.client.email
+
+
+def order_lines(order):
+    """Line dicts of an order from its (prefetched) items"""
+    return [
+        {
+            'product': item.product,
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'subtotal': item.unit_price * item.quantity,
+        }
+        for item in order.items.all()
+    ]
+
+
+def _delivery(order):
+    try:
+        return order.delivery
+    except Order.delivery.RelatedObjectDoesNotExist:
+        return None
+
+
+def confirmation_text(order, customer_name, order_items, delivery=None):
+    """Plain-text body of the confirmation, built with a single join"""
+    lines = [
+        '',
+        f'Hola {customer_name},',
+        '',
+        'Gracias por tu pedido en RAPPITESO.',
+        '',
+        'Detalles del pedido:',
+        f'Número de pedido: #{order.id}',
+        f'Restaurante: {order.restaurant.name}',
+        f"Fecha: {order.creation_date.strftime('%d/%m/%Y %H:%M')}",
+        f'Estado: {order.get_status_display()}',
+        '',
+        'Productos:',
+    ]
+    lines += [
+        f"- {item['product'].name} x{item['quantity']} - ${item['subtotal']:.2f}"
+        for item in order_items
+    ]
+    lines += [
+        '',
+        f'Total: ${order.total:.2f}',
+        '',
+        f'Dirección de entrega: {order.delivery_address}',
+        f'Método de pago: {order.get_payment_method_display()}',
+    ]
+    if order.comments:
+        lines.append(f'Comentarios: {order.comments}')
+    if delivery is not None:
+        lines += ['', f'Conductor asignado: {delivery.driver.name}']
+    lines += ['', 'Gracias por elegir RAPPITESO!', '', 'El equipo de RAPPITESO', '']
+    return '\n'.join(lines)
+
+
+def render_order_confirmation(order, user=None, order_items=None, delivery=None):
+    """Render the confirmation email of an order.
+
+    ``order_items`` and ``delivery`` can be passed when the caller already
+    has them (checkout does) to avoid querying them again.
+    """
+    if order_items is None:
+        order_items = order_lines(order)
+    if delivery is None:
+        delivery = _delivery(order)
+    name, email = _customer(order, user)
+    html = _template(CONFIRMATION_TEMPLATE).render({
+        'order': order,
+        'customer_name': name,
+        'order_items': order_items,
+        'restaurant': order.restaurant,
+        'delivery': delivery,
+    })
+    return RenderedEmail(
+        order=order,
+        to=[email],
+        subject=f'Confirmación de Pedido #{order.id} - RAPPITESO',
+        body=confirmation_text(order, name, order_items, delivery),
+        html_body=html,
+    )
+
+
+def orders_for_rendering(order_ids):
+    """Orders with everything the email needs: one join plus one items prefetch"""
+    return (
+        Order.objects
+        .filter(pk__in=order_ids)
+        .select_related('restaurant', 'client', 'delivery__driver')
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+        .order_by('pk')
+    )
+
+
+def render_order_confirmations(order_ids, users=None):
+    """Render the confirmation of many orders with two queries in total.
+
+    ``users`` optionally maps order ids to the user that should be greeted;
+    other orders are addressed to their client.
+    """
+    users = users or {}
+    return [
+        render_order_confirmation(order, users.get(order.pk))
+        for order in orders_for_rendering(order_ids)
+    ]
+
+
+def queue_order_confirmations(order_ids, users=None):
+    """Render and queue the confirmations of many orders in one insert"""
+    rendered = render_order_confirmations(order_ids, users)
+    return enqueue_emails(
+        {'subject': r.subject, 'body': r.body, 'to': r.to, 'html_body': r.html_body}
+        for r in rendered
+    )
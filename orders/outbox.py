@@ -0,0 +1,163 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, body, to, html_body='', from_email=None):
+    """Persist an email in the outbox; it is sent once the current transaction commits"""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def enqueue_emails(messages):
+    """Persist many emails with a single insert.
+
+    ``messages`` is an iterable of dicts with the arguments of enqueue_email.
+    """
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            subject=m['subject'],
+            body=m['body'],
+            html_body=m.get('html_body') or '',
+            from_email=m.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+            to=list(m['to']),
+        )
+        for m in messages
+    ])
+
+
+def _lease_seconds():
+    return getattr(settings, 'OUTBOX_LEASE_SECONDS', 300)
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 30)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size):
+    """Lease up to batch_size due emails to this worker.
+
+    Claimed rows move to 'sending' with next_attempt_at set to the end of the
+    lease, so a worker that dies mid-batch only delays them. Rows locked by
+    another worker are skipped where the backend supports SKIP LOCKED;
+    elsewhere each row is claimed with an UPDATE conditioned on the status
+    and lease it was read with, so no two workers send the same email.
+    """
+    now = timezone.now()
+    lease = now + timedelta(seconds=_lease_seconds())
+    due = (
+        OutboundEmail.objects
+        .filter(status__in=['pending', 'sending'], next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'pk')
+    )
+    if not connection.features.has_select_for_update_skip_locked:
+        return [
+            email for email in due[:batch_size]
+            if OutboundEmail.objects.filter(
+                pk=email.pk, status=email.status, next_attempt_at=email.next_attempt_at
+            ).update(status='sending', next_attempt_at=lease)
+        ]
+    with transaction.atomic():
+        batch = list(due.select_for_update(skip_locked=True)[:batch_size])
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[e.pk for e in batch]).update(
+                status='sending', next_attempt_at=lease
+            )
+    return batch
+
+
+def send_batch(batch):
+    """Send a claimed batch over a single backend connection; returns (sent, failed)"""
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    backend = get_connection(getattr(settings, 'OUTBOX_EMAIL_BACKEND', None))
+    sent, failed = [], []
+    try:
+        backend.open()
+        for email in batch:
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.to,
+                connection=backend,
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, 'text/html')
+            try:
+                message.send()
+            except Exception as e:
+                failed.append((email, str(e)))
+            else:
+                sent.append(email)
+    except Exception as e:
+        # The connection itself failed: nothing in the batch went out
+        failed = [(email, str(e)) for email in batch if email not in sent]
+    finally:
+        backend.close()
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(pk__in=[e.pk for e in sent]).update(
+            status='sent', sent_at=now, last_error=''
+        )
+    for email, error in failed:
+        attempts = email.attempts + 1
+        give_up = attempts >= max_attempts
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status='failed' if give_up else 'pending',
+            attempts=attempts,
+            next_attempt_at=now + _retry_delay(attempts),
+            last_error=error,
+        )
+        logger.warning('Error sending outbox email %s (attempt %d): %s', email.pk, attempts, error)
+    return len(sent), len(failed)
+
+
+def _send_due(batch_size):
+    sent = failed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return sent, failed
+        s, f = send_batch(batch)
+        sent += s
+        failed += f
+
+
+def _worker(batch_size):
+    try:
+        return _send_due(batch_size)
+    finally:
+        # Worker threads own their database connections
+        connections.close_all()
+
+
+def deliver_pending(batch_size=50, workers=1):
+    """Send every due email; returns the (sent, failed) totals.
+
+    With workers > 1 each thread claims and sends its own batches over its
+    own connection until the queue is drained. Backends without SKIP LOCKED
+    (SQLite) take a single writer, so they always use one worker.
+    """
+    if workers > 1 and not connection.features.has_select_for_update_skip_locked:
+        workers = 1
+    if workers <= 1:
+        return _send_due(batch_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_worker, [batch_size] * workers))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
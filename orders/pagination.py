@@ -0,0 +1,160 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.utils.encoders import JSONEncoder
+
+from .routers import reporting_db
+from .search import SEARCH_RANK
+
+
+class StableCursorPagination(CursorPagination):
+    """Keyset pagination on (ordering field, pk) that is stable under inserts.
+
+    DRF's CursorPagination keys on the first ordering field only and falls
+    back to OFFSETs among rows sharing that value, so an insert can shift a
+    page. Here the cursor position is the (value, pk) pair of the boundary
+    row, which is unique: pages are plain index range scans with no OFFSET
+    and no COUNT(*). The first field comes from the view's OrderingFilter
+    (creation_date for orders), or is the rank of a full-text search, and
+    pk follows in the same direction.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-pk'
+
+    def get_ordering(self, request, queryset, view):
+        if SEARCH_RANK in queryset.query.annotations:
+            # Resultados de la búsqueda de texto completo: por relevancia
+            return (f'-{SEARCH_RANK}', '-pk')
+        first = super().get_ordering(request, queryset, view)[0]
+        if first.lstrip('-') in ('pk', 'id'):
+            return (first,)
+        return (first, '-pk' if first.startswith('-') else 'pk')
+
+    def _get_position_from_instance(self, instance, ordering):
+        value = getattr(instance, ordering[0].lstrip('-'))
+        return json.dumps([str(value), instance.pk])
+
+    def _keyset_filter(self, position, reverse):
+        value, pk = json.loads(position)
+        first = self.ordering[0]
+        attr = first.lstrip('-')
+        # Test for: (cursor reversed) XOR (queryset reversed)
+        lookup = 'lt' if reverse != first.startswith('-') else 'gt'
+        if attr in ('pk', 'id'):
+            return Q(**{f'pk__{lookup}': pk})
+        return Q(**{f'{attr}__{lookup}': value}) | Q(**{attr: value, f'pk__{lookup}': pk})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self._keyset_filter(current_position, reverse))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Positions are unique, so the cursor offset is always zero here
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+def keyset_page(queryset, cursor, page_size, field='creation_date'):
+    """One page of queryset, newest first on (field, pk), after an opaque cursor.
+
+    The plain-view counterpart of StableCursorPagination: a page is an index
+    range scan with no OFFSET and no COUNT(*). Returns ``(rows, next_cursor)``
+    where next_cursor is None on the last page; a malformed cursor is a 404.
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if cursor:
+        try:
+            value, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+            value = queryset.model._meta.get_field(field).to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise Http404('Cursor inválido')
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    position = json.dumps([getattr(last, field).isoformat(), last.pk])
+    return rows, urlsafe_b64encode(position.encode()).decode()
+
+
+class NDJSONExportMixin:
+    """Adds ``GET <list>/export/`` streaming the filtered list as NDJSON.
+
+    Rows are read with ``.iterator(chunk_size=...)`` and written one line at a
+    time, so memory stays flat regardless of the table size.
+    """
+    export_chunk_size = 2000
+
+    def _export_lines(self, queryset):
+        encoder = JSONEncoder(ensure_ascii=False)
+        for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+            yield encoder.encode(self.get_serializer(obj).data) + '\n'
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        # Reporte: se lee de la réplica si la hay (la respuesta se genera fuera de la vista)
+        queryset = self.filter_queryset(self.get_queryset()).using(reporting_db())
+        response = StreamingHttpResponse(
+            self._export_lines(queryset), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}.ndjson"'
+        return response
@@ -0,0 +1,101 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Restaurant, Review
+
+# Los campos de una reseña que afectan la calificación del restaurante
+ReviewSnapshot = namedtuple('ReviewSnapshot', 'restaurant_id rating')
+
+
+def snapshot(review):
+    return ReviewSnapshot(review.restaurant_id, int(review.rating))
+
+
+def _average(rating_sum, rating_count):
+    # Sin reseñas la fila conserva la calificación que ya tenía
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)),
+        F('rating'),
+        output_field=FloatField(),
+    )
+
+
+def record_review_change(old, new):
+    """Apply the difference between two review snapshots to the restaurants.
+
+    ``old`` is None for new reviews and ``new`` is None for deleted ones.
+    Count and sum move with F() expressions and the average is recomputed in
+    the same UPDATE, so concurrent reviews of a restaurant never overwrite
+    each other. Returns the ids of the restaurants whose rating changed.
+    """
+    deltas = {}
+    for snap, sign in ((old, -1), (new, 1)):
+        if snap is None:
+            continue
+        count, total = deltas.get(snap.restaurant_id, (0, 0))
+        deltas[snap.restaurant_id] = (count + sign, total + sign * snap.rating)
+
+    changed = []
+    for restaurant_id, (count, total) in deltas.items():
+        if not (count or total):
+            continue
+        # SET evalúa todas las expresiones con los valores previos de la fila
+        new_count = F('rating_count') + count
+        new_sum = F('rating_sum') + total
+        Restaurant.objects.filter(pk=restaurant_id).update(
+            rating_count=new_count,
+            rating_sum=new_sum,
+            rating=_average(new_sum, new_count),
+        )
+        changed.append(restaurant_id)
+    return changed
+
+
+def rebuild_restaurant_ratings(restaurant_ids=None, batch_size=1000):
+    """Recompute rating count, sum and average of many restaurants (all by default).
+
+    For bulk loads and raw updates that skip the Review signals. Each batch
+    of restaurants costs one grouped query and one bulk update. Restaurants
+    without reviews keep the rating they have.
+    """
+    if restaurant_ids is None:
+        restaurant_ids = (
+            Restaurant.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        )
+    rebuilt = 0
+    batch = []
+    for restaurant_id in restaurant_ids:
+        batch.append(restaurant_id)
+        if len(batch) == batch_size:
+            rebuilt += _rebuild_batch(batch)
+            batch = []
+    if batch:
+        rebuilt += _rebuild_batch(batch)
+    return rebuilt
+
+
+def _rebuild_batch(restaurant_ids):
+    totals = {}
+    rows = (
+        Review.objects
+        .filter(restaurant_id__in=restaurant_ids)
+        .order_by()
+        .values('restaurant_id')
+        .annotate(count=Count('pk'), total=Sum('rating'))
+    )
+    for row in rows:
+        totals[row['restaurant_id']] = (row['count'], int(row['total']))
+
+    restaurants = [
+        Restaurant(pk=pk, rating_count=count, rating_sum=total,
+                   rating=(Decimal(total) / count).quantize(Decimal('0.01')))
+        for pk, (count, total) in totals.items()
+    ]
+    Restaurant.objects.bulk_update(restaurants, ['rating_count', 'rating_sum', 'rating'])
+    # Sin reseñas solo se limpian los contadores; la calificación no se toca
+    unreviewed = [pk for pk in restaurant_ids if pk not in totals]
+    Restaurant.objects.filter(pk__in=unreviewed).update(rating_count=0, rating_sum=0)
+    return len(restaurant_ids)
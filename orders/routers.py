@@ -0,0 +1,96 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Modelos del catálogo que se pueden leer de la réplica
+REPLICA_MODELS = {'orders.restaurant', 'orders.product', 'orders.review'}
+
+# Escrituras que no fijan la petición al primario (el guardado de la sesión)
+UNPINNED_APPS = {'sessions'}
+
+PIN_COOKIE = 'db_pin_primary'
+
+
+class RoutingState:
+    """Per-request routing state, shared with the threads of async views"""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def replica_alias():
+    """The configured replica alias, or None when there is no replica"""
+    alias = getattr(settings, 'REPLICA_DB_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def _can_use_replica():
+    """Replica reads are for requests that haven't written and aren't in a transaction"""
+    state = _state.get()
+    if state is None or state.pinned:
+        return False
+    # Reads inside a transaction on the primary must see its writes
+    return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def reporting_db():
+    """Alias for reporting reads (exports) of the current request"""
+    alias = replica_alias()
+    return alias if alias and _can_use_replica() else DEFAULT_DB_ALIAS
+
+
+def begin_request(pinned=False):
+    return _state.set(RoutingState(pinned))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+class ReplicaRouter:
+    """Send catalog reads of a request to the replica; everything else to the primary.
+
+    Only reads made while handling a request (see ReplicaPinningMiddleware)
+    are routed, so management commands and workers always read the primary.
+    Once a request writes, the rest of it and the client's next requests for
+    REPLICA_PIN_SECONDS read the primary, so users see their own writes
+    despite replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias is None:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == alias and _can_use_replica():
+            # Related objects of a replica row come from the same database
+            return alias
+        if model._meta.label_lower in REPLICA_MODELS and _can_use_replica():
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in UNPINNED_APPS:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema por replicación
+        if db == replica_alias():
+            return False
+        return None
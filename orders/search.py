@@ -0,0 +1,201 @@
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Product, Restaurant
+
+# Columnas indexadas por modelo, de mayor a menor peso
+INDEXED_FIELDS = {
+    Restaurant: ('name', 'address'),
+    Product: ('name', 'description'),
+}
+
+# Configuración de Postgres: stemming y stopwords en español
+TEXT_SEARCH_CONFIG = 'spanish'
+
+# Peso del segundo campo frente al primero, el de ts_rank para B frente a A
+SECONDARY_WEIGHT = 0.4
+
+SEARCH_RANK = 'search_rank'
+
+MAX_QUERY_LENGTH = 100
+
+
+class PostgresIndex:
+    """tsvector column generated by Postgres itself plus a GIN index.
+
+    The column is STORED and GENERATED, so every insert and update keeps it
+    current, bulk loads included; the ORM never reads or writes it.
+    """
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for model, (primary, secondary) in INDEXED_FIELDS.items():
+                table = model._meta.db_table
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+                    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({primary}, '')), 'A') || "
+                    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({secondary}, '')), 'B')"
+                    f") STORED"
+                )
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING gin (search_vector)')
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for model in INDEXED_FIELDS:
+                table = model._meta.db_table
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_search_idx')
+                cursor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+    def repair(self, connection):
+        pass
+
+    def match(self, model, query):
+        table = model._meta.db_table
+        tsquery = f"websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s)"
+        return (
+            RawSQL(f'{table}.search_vector @@ {tsquery}', [query], output_field=BooleanField()),
+            RawSQL(f'ts_rank({table}.search_vector, {tsquery})', [query], output_field=FloatField()),
+        )
+
+
+class SQLiteIndex:
+    """FTS5 external content table kept in sync by triggers (tests and local use).
+
+    The porter tokenizer only approximates Postgres' Spanish stemming
+    (plurals, mostly), which is enough for a development fallback.
+    """
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for model, fields in INDEXED_FIELDS.items():
+                table = model._meta.db_table
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({', '.join(fields)}, "
+                    f"content='{table}', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')"
+                )
+                self._create_triggers(cursor, table, fields)
+                cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for model in INDEXED_FIELDS:
+                table = model._meta.db_table
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+    def repair(self, connection):
+        """Recreate the triggers lost when a migration rebuilt an indexed table"""
+        with connection.cursor() as cursor:
+            for model, fields in INDEXED_FIELDS.items():
+                table = model._meta.db_table
+                cursor.execute("SELECT name FROM sqlite_master WHERE name IN (%s, %s)",
+                               [f'{table}_fts', f'{table}_fts_ai'])
+                existing = {row[0] for row in cursor.fetchall()}
+                if f'{table}_fts' in existing and f'{table}_fts_ai' not in existing:
+                    self._create_triggers(cursor, table, fields)
+                    cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+    def _create_triggers(self, cursor, table, fields):
+        columns = ', '.join(fields)
+        new = ', '.join(f'new.{f}' for f in fields)
+        old = ', '.join(f'old.{f}' for f in fields)
+        delete = f"INSERT INTO {table}_fts({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old});"
+        insert = f"INSERT INTO {table}_fts(rowid, {columns}) VALUES (new.id, {new});"
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN {insert} END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN {delete} END')
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END'
+        )
+
+    def match(self, model, query):
+        table = model._meta.db_table
+        # Cada palabra como frase entre comillas: la entrada del usuario no es sintaxis FTS5
+        terms = ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+        return (
+            RawSQL(f'{table}.id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s)', [terms],
+                   output_field=BooleanField()),
+            # bm25 es menor cuanto más relevante
+            RawSQL(f'(SELECT -bm25({table}_fts, 1.0, {SECONDARY_WEIGHT}) FROM {table}_fts '
+                   f'WHERE {table}_fts MATCH %s AND rowid = {table}.id)', [terms], output_field=FloatField()),
+        )
+
+
+class FallbackIndex:
+    """Unranked icontains scans for backends without a full-text index"""
+
+    def install(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+    def repair(self, connection):
+        pass
+
+    def match(self, model, query):
+        condition = Q()
+        for field in INDEXED_FIELDS[model]:
+            condition |= Q(**{f'{field}__icontains': query})
+        return condition, Value(0.0, output_field=FloatField())
+
+
+_INDEXES = {'postgresql': PostgresIndex(), 'sqlite': SQLiteIndex()}
+
+
+def index_for(connection):
+    return _INDEXES.get(connection.vendor, FallbackIndex())
+
+
+def install(connection):
+    index_for(connection).install(connection)
+
+
+def uninstall(connection):
+    index_for(connection).uninstall(connection)
+
+
+def repair(connection):
+    index_for(connection).repair(connection)
+
+
+def search(queryset, query):
+    """Filter a Restaurant or Product queryset by a full-text query, best matches first.
+
+    Rows get a ``search_rank`` annotation; the queryset's own ordering only
+    breaks ties. An empty query matches nothing.
+    """
+    query = ' '.join(query.split())[:MAX_QUERY_LENGTH]
+    if not query:
+        return queryset.none()
+    condition, rank = index_for(connections[queryset.db]).match(queryset.model, query)
+    return (
+        queryset.filter(condition)
+        .annotate(**{SEARCH_RANK: rank})
+        .order_by(f'-{SEARCH_RANK}', *queryset.query.order_by)
+    )
+
+
+def restaurants(query):
+    return search(Restaurant.objects.order_by('-rating'), query)
+
+
+def products(query):
+    """Available products matching query, with their restaurant"""
+    return search(Product.objects.filter(availability=True).select_related('restaurant').order_by('name'), query)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """DRF filter answering ``?search=`` from the full-text index, ranked by relevance.
+
+    Drop-in for SearchFilter on the viewsets of INDEXED_FIELDS models; the
+    indexed columns are fixed, so the view needs no ``search_fields``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search(queryset, ' '.join(terms))
@@ -0,0 +1,161 @@
+"""Bulk generation of realistic data for load tests and benchmarks.
+
+Rows are built with the factories in orders.factories and written with
+bulk_create in chunks, so signals do not run; ``seed_all`` rebuilds the
+derived state (ClientStats, ratings, driver loads, catalog cache) at the end. Every chunk reseeds
+the random generators from (seed, table, chunk number), so the output for a
+given seed is the same whether chunks run serially or in a process pool.
+"""
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import factory.random
+from django.apps import apps
+from django.db import connections, transaction
+
+from . import catalog
+from .dispatch import rebuild_driver_loads
+from .factories import (
+    RestaurantFactory, ProductFactory, ClientFactory, DriverFactory, OrderFactory, OrderItemFactory,
+    DeliveryFactory, ReviewFactory,
+)
+from .models import Restaurant, Product, Client, Driver, Order, OrderItem, Delivery, Review
+from .ratings import rebuild_restaurant_ratings
+from .stats import rebuild_client_stats
+
+SeedCounts = namedtuple('SeedCounts', 'restaurants products clients drivers orders items deliveries reviews')
+
+
+def _reseed(seed, table, chunk):
+    factory.random.reseed_random(f'{seed}:{table}:{chunk}')
+    return factory.random.randgen
+
+
+def _chunks(total, size):
+    for number, start in enumerate(range(0, total, size)):
+        yield number, min(size, total - start)
+
+
+def _bulk(model_factory, total, seed, batch_size):
+    """Create ``total`` rows with model_factory, one bulk insert per chunk"""
+    model = model_factory._meta.model
+    created = []
+    for number, count in _chunks(total, batch_size):
+        _reseed(seed, model._meta.model_name, number)
+        created += model.objects.bulk_create(model_factory.build_batch(count))
+    return created
+
+
+def seed_catalog(restaurants, products_per_restaurant, clients, drivers, seed=0, batch_size=5000):
+    """Restaurants with their menus, clients and drivers; returns their counts"""
+    with transaction.atomic():
+        new_restaurants = _bulk(RestaurantFactory, restaurants, seed, batch_size)
+        products = 0
+        per_chunk = max(batch_size // max(products_per_restaurant, 1), 1)
+        for number, start in enumerate(range(0, len(new_restaurants), per_chunk)):
+            _reseed(seed, 'product', number)
+            products += len(Product.objects.bulk_create([
+                ProductFactory.build(restaurant=r)
+                for r in new_restaurants[start:start + per_chunk]
+                for _ in range(products_per_restaurant)
+            ]))
+        new_clients = _bulk(ClientFactory, clients, seed, batch_size)
+        new_drivers = _bulk(DriverFactory, drivers, seed, batch_size)
+    return len(new_restaurants), products, len(new_clients), len(new_drivers)
+
+
+# Ids que necesita cada proceso del pool para generar pedidos
+_context = None
+
+
+def _load_context():
+    menus = defaultdict(list)
+    for pk, restaurant_id, price in Product.objects.filter(availability=True).order_by('pk').values_list(
+            'pk', 'restaurant_id', 'price').iterator():
+        menus[restaurant_id].append((pk, price))
+    return {
+        'clients': list(Client.objects.order_by('pk').values_list('pk', flat=True)),
+        'drivers': list(Driver.objects.order_by('pk').values_list('pk', flat=True)),
+        'menus': dict(menus),
+    }
+
+
+def _init_worker(context):
+    global _context
+    # Spawned processes start without Django; forked ones inherit it
+    if not apps.ready:
+        django.setup()
+    _context = context
+
+
+def _seed_order_chunk(seed, number, count, review_rate):
+    """Orders with their items, delivery and sometimes a review; returns row counts"""
+    rng = _reseed(seed, 'order', number)
+    clients, drivers, menus = _context['clients'], _context['drivers'], _context['menus']
+    restaurant_ids = list(menus)
+
+    orders, lines = [], []
+    for _ in range(count):
+        restaurant_id = rng.choice(restaurant_ids)
+        menu = rng.sample(menus[restaurant_id], min(len(menus[restaurant_id]), rng.randint(1, 4)))
+        items = [
+            OrderItemFactory.build(order=None, product=Product(pk=pk, price=price))
+            for pk, price in menu
+        ]
+        order = OrderFactory.build(
+            client=Client(pk=rng.choice(clients)),
+            restaurant=Restaurant(pk=restaurant_id),
+            total=sum(item.unit_price * item.quantity for item in items),
+        )
+        orders.append(order)
+        lines.append(items)
+
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        items = []
+        for order, order_items in zip(orders, lines):
+            for item in order_items:
+                item.order = order
+                items.append(item)
+        OrderItem.objects.bulk_create(items)
+        deliveries = Delivery.objects.bulk_create([
+            DeliveryFactory.build(order=order, driver=Driver(pk=rng.choice(drivers))) for order in orders
+        ])
+        reviews = Review.objects.bulk_create([
+            ReviewFactory.build(order=order)
+            for order in orders
+            if order.status == 'delivered' and rng.random() < review_rate
+        ])
+    return len(orders), len(items), len(deliveries), len(reviews)
+
+
+def seed_orders(orders, seed=0, batch_size=5000, workers=1, review_rate=0.3):
+    """Generate orders for the existing catalog; returns (orders, items, deliveries, reviews)"""
+    global _context
+    context = _load_context()
+    if not (context['clients'] and context['drivers'] and context['menus']):
+        raise ValueError('Seed the catalog (restaurants, products, clients and drivers) first.')
+    tasks = [(seed, number, count, review_rate) for number, count in _chunks(orders, batch_size)]
+
+    if workers <= 1:
+        _context = context
+        results = [_seed_order_chunk(*task) for task in tasks]
+    else:
+        # Child processes open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(context,)) as pool:
+            results = list(pool.map(_seed_order_chunk, *zip(*tasks)))
+    return tuple(sum(column) for column in zip(*results)) if results else (0, 0, 0, 0)
+
+
+def seed_all(restaurants, products_per_restaurant, clients, drivers, orders,
+             seed=0, batch_size=5000, workers=1, review_rate=0.3):
+    """Seed a full data set and rebuild the state that bulk inserts skip"""
+    catalog_counts = seed_catalog(restaurants, products_per_restaurant, clients, drivers, seed, batch_size)
+    order_counts = seed_orders(orders, seed, batch_size, workers, review_rate)
+    rebuild_client_stats(batch_size=min(batch_size, 1000))
+    rebuild_restaurant_ratings(batch_size=min(batch_size, 1000))
+    rebuild_driver_loads()
+    catalog.invalidate_all()
+    return SeedCounts(*catalog_counts, *order_counts)
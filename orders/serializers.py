@@ -1,24 +1,56 @@
 from rest_framework import serializers
+from rest_framework.serializers import raise_errors_on_nested_writes
+from .lifecycle import MAX_BULK_TRANSITION
 from .models import Order, Product, Restaurant, Client, Driver, Review, Delivery
 
+class OrderTransitionSerializer(serializers.Serializer):
+    """Body of the bulk status transition: the order ids and the target status"""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                max_length=MAX_BULK_TRANSITION)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+class OrderStatusSerializer(serializers.Serializer):
+    """Body of a single order transition: the target status and the version it was read at"""
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    version = serializers.IntegerField(min_value=0)
+
+class DeliveryTransitionSerializer(serializers.Serializer):
+    """Body of a single delivery transition: the target status and the version it was read at"""
+    status = serializers.ChoiceField(choices=Delivery.DELIVERY_STATUS_CHOICES)
+    version = serializers.IntegerField(min_value=0)
+
+class PartialSaveMixin:
+    """Update only the columns in the request, so a concurrent transition is never written back"""
+
+    def update(self, instance, validated_data):
+        raise_errors_on_nested_writes('update', self, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'description', 'availability']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(PartialSaveMixin, serializers.ModelSerializer):
     client = serializers.StringRelatedField()  # Muestra el nombre del cliente
     restaurant = serializers.StringRelatedField()  # Muestra el nombre del restaurante
     products = ProductSerializer(many=True)  # Relaciona productos con el pedido
 
     class Meta:
         model = Order
-        fields = ['id', 'client', 'restaurant', 'creation_date', 'status', 'total', 'delivery_date', 'delivery_address', 'payment_method', 'comments', 'products']
+        fields = ['id', 'client', 'restaurant', 'creation_date', 'status', 'version', 'total', 'delivery_date', 'delivery_address', 'payment_method', 'comments', 'products']
+        # El estado solo cambia por orders.lifecycle
+        read_only_fields = ['status']
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(PartialSaveMixin, serializers.ModelSerializer):
     class Meta:
         model = Restaurant
-        fields = ['id', 'name', 'address', 'phone_number', 'opening_time', 'closing_time', 'rating']
+        fields = ['id', 'name', 'address', 'phone_number', 'opening_time', 'closing_time', 'rating', 'rating_count']
+        # La calificación manual solo se captura en el admin (orders.admin.RestaurantAdmin)
+        read_only_fields = ['rating']
 
 class ClientSerializer(serializers.ModelSerializer):
     class Meta:
@@ -38,12 +70,14 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'client', 'restaurant', 'order', 'rating', 'comment']
 
-class DeliverySerializer(serializers.ModelSerializer):
+class DeliverySerializer(PartialSaveMixin, serializers.ModelSerializer):
     order = OrderSerializer()  # Información del pedido
     driver = DriverSerializer()  # Información del conductor
 
     class Meta:
         model = Delivery
-        fields = ['id', 'order', 'driver', 'delivery_date', 'delivery_time', 'delivery_status']
+        fields = ['id', 'order', 'driver', 'delivery_date', 'delivery_time', 'delivery_status', 'version']
+        # El estado solo cambia por orders.lifecycle
+        read_only_fields = ['delivery_status']
 
 
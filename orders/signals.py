@@ -0,0 +1,157 @@
+# orders/signals.py
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from . import catalog, dispatch, ratings, search
+from .load_index import load_index
+from .middleware import install_query_recorder
+from .models import Delivery, Driver, Order, Restaurant, Product, Review
+from .stats import OrderSnapshot, snapshot, record_order_change
+
+# The load index is only updated once the write is committed, so a rolled
+# back checkout never leaves a phantom delivery behind.
+
+@receiver(post_save, sender=Delivery)
+def track_delivery_saved(sender, instance, update_fields=None, **kwargs):
+    # Un guardado parcial sin estado ni conductor no cambia la carga (y el
+    # estado en memoria puede ser viejo)
+    if update_fields is not None and not {'delivery_status', 'driver', 'driver_id'} & update_fields:
+        return
+    transaction.on_commit(lambda: load_index.delivery_saved(instance), using=kwargs.get('using'))
+
+@receiver(post_delete, sender=Delivery)
+def track_delivery_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: load_index.delivery_deleted(pk), using=kwargs.get('using'))
+
+@receiver(post_save, sender=Driver)
+def track_driver_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: load_index.driver_saved(instance), using=kwargs.get('using'))
+
+@receiver(post_delete, sender=Driver)
+def track_driver_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: load_index.driver_deleted(pk), using=kwargs.get('using'))
+
+# Driver load counters move in the same transaction as the delivery itself.
+
+@receiver(pre_save, sender=Delivery)
+def remember_delivery_snapshot(sender, instance, using=None, **kwargs):
+    instance._load_snapshot = None
+    if instance.pk is not None and not instance._state.adding:
+        # Delivery.save() abre la transacción: el candado dura hasta el UPDATE del contador
+        instance._load_snapshot = (
+            Delivery.objects.using(using).select_for_update()
+            .filter(pk=instance.pk).values_list('driver_id', 'delivery_status').first()
+        )
+
+@receiver(post_save, sender=Delivery)
+def update_driver_load(sender, instance, update_fields=None, **kwargs):
+    old = getattr(instance, '_load_snapshot', None)
+    new = (instance.driver_id, instance.delivery_status)
+    if old is not None and update_fields is not None:
+        # Las columnas que no se guardaron conservan el valor de la base
+        new = (new[0] if {'driver', 'driver_id'} & update_fields else old[0],
+               new[1] if 'delivery_status' in update_fields else old[1])
+    dispatch.record_delivery_change(old, new)
+
+@receiver(post_delete, sender=Delivery)
+def remove_driver_load(sender, instance, **kwargs):
+    dispatch.record_delivery_change((instance.driver_id, instance.delivery_status), None)
+
+# Client statistics are written in the same transaction as the order itself.
+
+@receiver(pre_save, sender=Order)
+def remember_order_snapshot(sender, instance, using=None, **kwargs):
+    instance._stats_snapshot = None
+    if instance.pk is not None and not instance._state.adding:
+        # Order.save() abre la transacción: otro guardado espera hasta que
+        # los contadores ya se movieron, y su foto no queda vieja
+        old = (
+            Order.objects.using(using).select_for_update().filter(pk=instance.pk)
+            .values_list('client_id', 'restaurant_id', 'status', 'total')
+            .first()
+        )
+        if old is not None:
+            instance._stats_snapshot = OrderSnapshot(*old)
+
+def _saved_snapshot(old, instance, update_fields):
+    """Snapshot of the row after a save that may have written only some columns"""
+    new = snapshot(instance)
+    if old is None or update_fields is None:
+        return new
+    # Las columnas que no se guardaron conservan el valor de la base
+    return OrderSnapshot(*(
+        value if name in update_fields or name.removesuffix('_id') in update_fields else previous
+        for name, value, previous in zip(OrderSnapshot._fields, new, old)
+    ))
+
+@receiver(post_save, sender=Order)
+def update_client_stats(sender, instance, update_fields=None, **kwargs):
+    old = getattr(instance, '_stats_snapshot', None)
+    record_order_change(old, _saved_snapshot(old, instance, update_fields))
+
+@receiver(post_delete, sender=Order)
+def remove_from_client_stats(sender, instance, **kwargs):
+    record_order_change(snapshot(instance), None)
+
+# Catalog cache entries are dropped once the change is committed, so a
+# concurrent request cannot re-cache the old rows in between.
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_cache(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: catalog.invalidate_restaurant(pk), using=kwargs.get('using'))
+
+@receiver(pre_save, sender=Product)
+def remember_product_restaurant(sender, instance, **kwargs):
+    instance._catalog_restaurant_id = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._catalog_restaurant_id = (
+            Product.objects.filter(pk=instance.pk).values_list('restaurant_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_menu_cache(sender, instance, **kwargs):
+    # A product moved to another restaurant leaves two stale menus
+    ids = [instance.restaurant_id, getattr(instance, '_catalog_restaurant_id', None)]
+    ids = [pk for pk in ids if pk is not None]
+    transaction.on_commit(lambda: catalog.invalidate_menu(*ids), using=kwargs.get('using'))
+
+# Restaurant ratings move in the same transaction as the review; the
+# listings sorted by rating are dropped from the cache once it commits.
+
+@receiver(pre_save, sender=Review)
+def remember_review_snapshot(sender, instance, **kwargs):
+    instance._rating_snapshot = None
+    if instance.pk is not None and not instance._state.adding:
+        old = Review.objects.filter(pk=instance.pk).values_list('restaurant_id', 'rating').first()
+        if old is not None:
+            instance._rating_snapshot = ratings.ReviewSnapshot(old[0], int(old[1]))
+
+def _apply_review_change(old, new, using):
+    for pk in ratings.record_review_change(old, new):
+        transaction.on_commit(lambda pk=pk: catalog.invalidate_restaurant(pk), using=using)
+
+@receiver(post_save, sender=Review)
+def update_restaurant_rating(sender, instance, **kwargs):
+    _apply_review_change(getattr(instance, '_rating_snapshot', None), ratings.snapshot(instance),
+                         kwargs.get('using'))
+
+@receiver(post_delete, sender=Review)
+def remove_from_restaurant_rating(sender, instance, **kwargs):
+    _apply_review_change(ratings.snapshot(instance), None, kwargs.get('using'))
+
+@receiver(connection_created)
+def hook_request_metrics(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+@receiver(post_migrate)
+def repair_search_index(sender, using, **kwargs):
+    # SQLite recrea la tabla al alterar sus columnas y con ella pierde los triggers de FTS5
+    if sender.name == 'orders':
+        search.repair(connections[using])
@@ -0,0 +1,169 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, F, Q, Sum
+
+from .models import Client, Order, ClientStats
+
+# Los campos de un pedido que afectan las estadísticas del cliente
+OrderSnapshot = namedtuple('OrderSnapshot', 'client_id restaurant_id status total')
+
+
+def snapshot(order):
+    return OrderSnapshot(order.client_id, order.restaurant_id, order.status, order.total or Decimal('0'))
+
+
+def _empty_stats():
+    return {
+        'total_orders': 0,
+        'pending_orders': 0,
+        'total_spent': Decimal('0'),
+        'favorite_restaurant_id': None,
+        'favorite_restaurant_orders': 0,
+    }
+
+
+def _add_row(stats, row):
+    stats['total_orders'] += row['orders']
+    stats['pending_orders'] += row['pending']
+    stats['total_spent'] += row['spent'] or 0
+    if row['orders'] > stats['favorite_restaurant_orders']:
+        stats['favorite_restaurant_id'] = row['restaurant_id']
+        stats['favorite_restaurant_orders'] = row['orders']
+
+
+def _grouped_orders(client_ids, *group_by):
+    return (
+        Order.objects
+        .filter(client_id__in=client_ids)
+        .order_by()
+        .values(*group_by, 'restaurant_id')
+        .annotate(
+            orders=Count('pk'),
+            pending=Count('pk', filter=Q(status__in=Order.OPEN_STATUSES)),
+            spent=Sum('total'),
+        )
+    )
+
+
+def compute_client_stats(client_ids):
+    """Compute profile statistics for the given clients with a single query.
+
+    Orders are grouped by restaurant with conditional Count/Sum, so the
+    result has one row per restaurant the clients ordered from rather than
+    one row per order.
+    """
+    stats = _empty_stats()
+    for row in _grouped_orders(client_ids):
+        _add_row(stats, row)
+    return stats
+
+
+def rebuild_client_stats(client_ids=None, batch_size=1000):
+    """Recompute the ClientStats rows of many clients (all by default).
+
+    For bulk loads that skip the Order signals. Each batch of clients costs
+    one grouped query and one upsert.
+    """
+    if client_ids is None:
+        client_ids = Client.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+    fields = list(_empty_stats())
+    rebuilt = 0
+    batch = []
+    for client_id in client_ids:
+        batch.append(client_id)
+        if len(batch) == batch_size:
+            rebuilt += _rebuild_batch(batch, fields)
+            batch = []
+    if batch:
+        rebuilt += _rebuild_batch(batch, fields)
+    return rebuilt
+
+
+def _rebuild_batch(client_ids, fields):
+    by_client = {pk: _empty_stats() for pk in client_ids}
+    for row in _grouped_orders(client_ids, 'client_id'):
+        _add_row(by_client[row['client_id']], row)
+    ClientStats.objects.bulk_create(
+        [ClientStats(client_id=pk, **stats) for pk, stats in by_client.items()],
+        update_conflicts=True, unique_fields=['client'], update_fields=fields,
+    )
+    return len(by_client)
+
+
+def refresh_client_stats(client_id):
+    """Recompute and store the ClientStats row of a client from its orders"""
+    stats, _ = ClientStats.objects.update_or_create(
+        client_id=client_id, defaults=compute_client_stats([client_id])
+    )
+    return stats
+
+
+def _refresh_favorite(client_id, restaurant_id, grew):
+    stats = ClientStats.objects.filter(client_id=client_id)
+    if grew:
+        # A new order can only promote the restaurant it was placed at
+        count = Order.objects.filter(client_id=client_id, restaurant_id=restaurant_id).count()
+        stats.filter(favorite_restaurant_orders__lt=count).update(
+            favorite_restaurant_id=restaurant_id, favorite_restaurant_orders=count
+        )
+    elif stats.filter(favorite_restaurant_id=restaurant_id).exists():
+        # The favorite lost an order; another restaurant may have overtaken it
+        fresh = compute_client_stats([client_id])
+        stats.update(
+            favorite_restaurant_id=fresh['favorite_restaurant_id'],
+            favorite_restaurant_orders=fresh['favorite_restaurant_orders'],
+        )
+
+
+def record_order_change(old, new):
+    """Apply the difference between two order snapshots to ClientStats.
+
+    ``old`` is None for new orders and ``new`` is None for deleted ones.
+    Counters are moved with F() expressions so concurrent orders of the same
+    client never overwrite each other; a client without a stats row yet gets
+    one computed from scratch.
+    """
+    deltas = {}
+    for snap, sign in ((old, -1), (new, 1)):
+        if snap is None:
+            continue
+        orders, pending, spent = deltas.get(snap.client_id, (0, 0, Decimal('0')))
+        deltas[snap.client_id] = (
+            orders + sign,
+            pending + sign * (snap.status in Order.OPEN_STATUSES),
+            spent + sign * snap.total,
+        )
+
+    for client_id, (orders, pending, spent) in deltas.items():
+        if not (orders or pending or spent):
+            continue
+        updated = ClientStats.objects.filter(client_id=client_id).update(
+            total_orders=F('total_orders') + orders,
+            pending_orders=F('pending_orders') + pending,
+            total_spent=F('total_spent') + spent,
+        )
+        if not updated:
+            refresh_client_stats(client_id)
+
+    moved = old is None or new is None or old[:2] != new[:2]
+    if moved and old is not None:
+        _refresh_favorite(old.client_id, old.restaurant_id, grew=False)
+    if moved and new is not None:
+        _refresh_favorite(new.client_id, new.restaurant_id, grew=True)
+
+
+def profile_stats(client):
+    """Read the materialized statistics of a user's client (or None) for the profile page"""
+    row = None
+    if client is not None:
+        row = getattr(client, 'stats', None) or refresh_client_stats(client.pk)
+    total_orders = row.total_orders if row else 0
+    total_spent = row.total_spent if row else Decimal('0')
+    return {
+        'total_orders': total_orders,
+        'pending_orders': row.pending_orders if row else 0,
+        'total_spent': total_spent,
+        'favorite_restaurant': row.favorite_restaurant if row else None,
+        'average_ticket': total_spent / total_orders if total_orders else 0,
+    }
@@ -0,0 +1,30 @@
+from django import template
+
+from orders import catalog
+
+register = template.Library()
+
+
+class CatalogFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = catalog.fragment_key(self.name, *(v.resolve(context) for v in self.vary_on))
+        return catalog.get_or_set(key, lambda: self.nodelist.render(context), 'fragment')
+
+
+@register.tag
+def catalog_fragment(parser, token):
+    """
+    Cachea un fragmento del catálogo; se invalida al modificar restaurantes o productos.
+    Uso en plantilla: {% catalog_fragment menu restaurant.id %} ... {% endcatalog_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endcatalog_fragment',))
+    parser.delete_first_token()
+    return CatalogFragmentNode(nodelist, bits[1], [parser.compile_filter(b) for b in bits[2:]])
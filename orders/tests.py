@@ -1,3 +1,1786 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import warnings
+from datetime import time
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count, Sum
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalog, routers, search
+from .dispatch import assign_driver, driver_load_drift, drivers_by_load, least_loaded_driver
+from .lifecycle import (InvalidTransition, TransitionConflict, bulk_transition, transition_delivery,
+                        transition_order)
+from .load_index import load_index
+from .models import (Product, Order, Restaurant, Client, ClientStats, Driver, Delivery, OrderItem, Review,
+                     OutboundEmail)
+from .notifications import _template, clear_template_cache, render_order_confirmations, queue_order_confirmations
+from .outbox import claim_batch, deliver_pending, enqueue_email
+from .metrics import request_metrics
+from .middleware import QueryRecorder
+from .benchmarks import compare, run as run_benchmarks
+from .ratings import rebuild_restaurant_ratings
+from .seeding import seed_all
+from .serializers import OrderSerializer
+from .stats import compute_client_stats, rebuild_client_stats
+
+
+def make_restaurant(**kwargs):
+    defaults = dict(name='Tacos ITESO', address='Periférico Sur 8585', phone_number='3333333333',
+                    opening_time=time(9), closing_time=time(22), rating=Decimal('4.50'))
+    defaults.update(kwargs)
+    return Restaurant.objects.create(**defaults)
+
+
+def make_orders(count, restaurant, client=None):
+    if client is None:
+        client = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                       address='Calle 1', phone_number='555')
+    return Order.objects.bulk_create([
+        Order(client=client, restaurant=restaurant, total=Decimal('100.00'),
+              delivery_date=timezone.now(), delivery_address='Calle 1',
+              payment_method='cash', comments='')
+        for _ in range(count)
+    ])
+
+
+def make_drivers(count):
+    return Driver.objects.bulk_create([
+        Driver(name=f'Conductor {i}', email=f'driver{i}@example.com', phone_number='555',
+               vehicle_type='Moto')
+        for i in range(count)
+    ])
+
+
+def deliver(order, driver, status='pending'):
+    now = timezone.now()
+    return Delivery.objects.create(order=order, driver=driver, delivery_date=now,
+                                   delivery_time=now.time(), delivery_status=status)
+
+
+class CheckoutTests(TestCase):
+    """Checkout writes the whole order atomically with a cart-size independent query count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.products = Product.objects.bulk_create([
+            Product(restaurant=cls.restaurant, name=f'Platillo {i}', price=Decimal('10.00') + i,
+                    description='Delicioso')
+            for i in range(20)
+        ])
+        Driver.objects.create(name='Ana', email='ana@example.com', phone_number='555',
+                              vehicle_type='Moto')
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+
+    def setUp(self):
+        load_index.invalidate()
+        self.client.force_login(self.user)
+
+    def _set_cart(self, products, quantity=2):
+        session = self.client.session
+        session['cart'] = {str(p.id): quantity for p in products}
+        session.save()
+
+    def _checkout(self):
+        return self.client.post(reverse('checkout'), {
+            'delivery_address': 'Calle 1 #23',
+            'payment_method': 'cash',
+            'comments': '',
+        })
+
+    def _checkout_queries(self, size):
+        self._set_cart(self.products[:size])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._checkout()
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries)
+
+    def test_checkout_creates_order_items_and_delivery(self):
+        self._set_cart(self.products[:3], quantity=2)
+        response = self._checkout()
+
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('checkout_success', args=[order.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(order.total, sum(p.price * 2 for p in self.products[:3]))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertTrue(Delivery.objects.filter(order=order).exists())
+        self.assertEqual(self.client.session['cart'], {})
+
+    def test_query_count_is_constant_in_cart_size(self):
+        # The first checkout also creates the Client row
+        self._checkout_queries(1)
+        baseline = self._checkout_queries(1)
+        for size in (5, 20):
+            self.assertEqual(self._checkout_queries(size), baseline)
+
+    def test_unknown_product_aborts_checkout(self):
+        session = self.client.session
+        session['cart'] = {str(self.products[0].id): 1, '999999': 1}
+        session.save()
+        response = self._checkout()
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+    def test_rolled_back_checkout_gives_the_driver_back(self):
+        driver = Driver.objects.get()
+        self._set_cart(self.products[:1])
+        with mock.patch('orders.views.send_order_confirmation_email', side_effect=RuntimeError('SMTP')), \
+                self.assertLogs('orders.views', 'ERROR'):
+            response = self._checkout()
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Delivery.objects.exists())
+        self.assertEqual(Driver.objects.get().active_delivery_count, 0)
+        self.assertEqual(load_index.load(driver.pk), 0)
+        self.assertEqual(load_index.drift(), {})
+
+
+class DispatchTests(TestCase):
+    """Least-loaded driver selection is one query regardless of fleet size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+
+    def setUp(self):
+        load_index.invalidate()
+
+    def test_picks_driver_with_fewest_active_deliveries(self):
+        busy, idle = make_drivers(2)
+        orders = make_orders(3, self.restaurant)
+        deliver(orders[0], busy)
+        deliver(orders[1], idle, status='delivered')
+        deliver(orders[2], idle, status='failed')
+        with transaction.atomic():
+            self.assertEqual(least_loaded_driver(), idle)
+
+    def test_unavailable_drivers_are_fallback_only(self):
+        driver = Driver.objects.create(name='Off', email='off@example.com', phone_number='555',
+                                       vehicle_type='Bici', availability=False)
+        with transaction.atomic():
+            self.assertEqual(assign_driver(), (driver, False))
+
+    def test_creates_emergency_driver_when_fleet_is_empty(self):
+        with transaction.atomic():
+            driver, created = assign_driver()
+        self.assertTrue(created)
+        self.assertEqual(Driver.objects.get(), driver)
+
+    def test_load_spreads_across_thousands_of_drivers(self):
+        make_drivers(2000)
+        orders = make_orders(300, self.restaurant)
+        with transaction.atomic():
+            with self.assertNumQueries(1):
+                least_loaded_driver()
+        load_index.rebuild()
+        with transaction.atomic():
+            # Indexed assignment only locks the chosen Driver row and reads its counter
+            with self.assertNumQueries(1):
+                driver, _ = assign_driver()
+            load_index.release(driver.pk)
+        for order in orders:
+            with transaction.atomic():
+                driver, _ = assign_driver()
+                deliver(order, driver)
+        loads = drivers_by_load().values_list('active_deliveries', flat=True)
+        self.assertEqual(sum(loads), 300)
+        self.assertEqual(max(loads), 1)
+
+
+class DriverLoadIndexTests(TestCase):
+    """The in-memory index follows committed Delivery/Driver writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+
+    def setUp(self):
+        load_index.invalidate()
+        self.busy, self.idle = make_drivers(2)
+        self.orders = make_orders(3, self.restaurant)
+        load_index.rebuild()
+
+    def test_pop_skips_driver_with_committed_delivery(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver(self.orders[0], self.busy)
+        self.assertEqual(load_index.load(self.busy.pk), 1)
+        self.assertEqual(load_index.pop(), self.idle.pk)
+        self.assertEqual(load_index.pop(), self.busy.pk)
+
+    def test_reservation_is_not_counted_twice(self):
+        pk = load_index.pop()
+        driver = Driver.objects.get(pk=pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver(self.orders[0], driver)
+        self.assertEqual(load_index.load(pk), 1)
+        self.assertEqual(load_index.drift(), {})
+
+    def test_finished_or_deleted_deliveries_free_the_driver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = deliver(self.orders[0], self.busy)
+            second = deliver(self.orders[1], self.busy)
+        self.assertEqual(load_index.load(self.busy.pk), 2)
+        first.delivery_status = 'delivered'
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+            second.delete()
+        self.assertEqual(load_index.load(self.busy.pk), 0)
+
+    def test_unavailable_driver_is_never_popped(self):
+        self.idle.availability = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.idle.save()
+            deliver(self.orders[0], self.busy)
+        self.assertEqual(load_index.pop(), self.busy.pk)
+
+    def test_ttl_rebuild_counts_drift_and_reports_it_to_staff(self):
+        url = reverse('driver_load_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user('ops', 'ops@example.com', 'secret123', is_staff=True)
+        self.client.force_login(staff)
+        events = self.client.get(url).json()['drift_events']
+
+        # Uncommitted callbacks never reach the index, like a delivery made by another process
+        deliver(self.orders[0], self.busy)
+        report = self.client.get(url).json()
+        self.assertEqual(report['drift'], {str(self.busy.pk): {'index': 0, 'database': 1}})
+        self.assertEqual(report['drift_events'], events)
+
+        with self.assertLogs('orders.load_index', 'WARNING'):
+            load_index.rebuild()
+        report = self.client.get(url).json()
+        self.assertEqual(report['drift'], {})
+        self.assertEqual(report['drift_events'], events + 1)
+        self.assertEqual(report['last_drift'], {str(self.busy.pk): {'index': 0, 'database': 1}})
+
+    def test_stale_index_is_corrected_from_the_driver_counter(self):
+        events = load_index.report()['drift_events']
+        # Another process gave the first driver in the heap two deliveries
+        deliver(self.orders[0], self.busy)
+        deliver(self.orders[1], self.busy)
+        self.assertEqual(Driver.objects.get(pk=self.busy.pk).active_delivery_count, 2)
+        with self.assertLogs('orders.load_index', 'WARNING'), transaction.atomic():
+            driver, _ = assign_driver()
+        self.assertEqual(driver, self.idle)
+        self.assertEqual(load_index.load(self.busy.pk), 2)
+        self.assertEqual(load_index.report()['drift_events'], events + 1)
+
+    def test_counters_follow_saves_transitions_and_deletes(self):
+        first = deliver(self.orders[0], self.busy)
+        second = deliver(self.orders[1], self.busy)
+        first.delivery_status = 'in_transit'
+        first.save()
+        self.assertEqual(Driver.objects.get(pk=self.busy.pk).active_delivery_count, 2)
+        transition_delivery(first, 'delivered')
+        bulk_transition([self.orders[1].pk], 'cancelled')
+        self.assertEqual(Driver.objects.get(pk=self.busy.pk).active_delivery_count, 0)
+        third = deliver(self.orders[2], self.busy)
+        third.driver = self.idle
+        third.save()
+        self.assertEqual(list(Driver.objects.order_by('pk').values_list('active_delivery_count', flat=True)),
+                         [0, 1])
+        third.delete()
+        second.delete()
+        self.assertEqual(driver_load_drift(), {})
+
+    def test_reconcile_command_detects_and_fixes_counter_drift(self):
+        deliver(self.orders[0], self.busy)
+        Driver.objects.filter(pk=self.idle.pk).update(active_delivery_count=3)
+        out = StringIO()
+        with self.assertRaises(CommandError) as raised:
+            call_command('reconcile_driver_loads', stdout=out)
+        self.assertEqual(raised.exception.returncode, 1)
+        self.assertIn(f'Driver {self.idle.pk}: counter=3 database=0', out.getvalue())
+        self.assertEqual(Driver.objects.get(pk=self.idle.pk).active_delivery_count, 3)
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_driver_loads', '--fix', stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_driver_loads', stdout=out)
+        self.assertIn('in sync', out.getvalue())
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentDispatchTests(TransactionTestCase):
+    """Parallel checkouts do not pile onto the same driver (row locks need Postgres)"""
+
+    @override_settings(DRIVER_LOAD_INDEX_ENABLED=False)
+    def test_concurrent_locked_assignments_spread_load(self):
+        self._assign_concurrently()
+
+    def test_concurrent_indexed_assignments_spread_load(self):
+        load_index.invalidate()
+        self._assign_concurrently()
+
+    def _assign_concurrently(self):
+        workers = 8
+        make_drivers(workers * 4)
+        orders = make_orders(workers * 4, make_restaurant())
+        pending = list(orders)
+        lock = threading.Lock()
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def worker():
+            barrier.wait()
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        order = pending.pop()
+                    with transaction.atomic():
+                        driver, _ = assign_driver()
+                        deliver(order, driver)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        loads = Delivery.objects.values('driver').annotate(n=Count('pk')).values_list('n', flat=True)
+        self.assertEqual(sum(loads), len(orders))
+        self.assertLessEqual(max(loads), 2)
+
+
+class APIQueryCountTests(TestCase):
+    """Every /api/ list endpoint runs a fixed number of queries however many rows it returns"""
+
+    EXPECTED_QUERIES = {
+        'product-list': 1,
+        'order-list': 2,
+        'restaurant-list': 1,
+        'client-list': 1,
+        'driver-list': 1,
+        'review-list': 1,
+        'delivery-list': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ops', 'ops@example.com', 'secret123')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _seed(self, count):
+        for i in range(count):
+            restaurant = make_restaurant(name=f'Restaurante {i}')
+            client = Client.objects.create(name=f'Cliente {i}', email=f'c{i}@example.com',
+                                           address='Calle 1', phone_number='555')
+            products = Product.objects.bulk_create([
+                Product(restaurant=restaurant, name=f'Platillo {j}', price=Decimal('50.00'),
+                        description='Delicioso')
+                for j in range(3)
+            ])
+            order, = make_orders(1, restaurant, client)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=p, quantity=1, unit_price=p.price) for p in products
+            ])
+            driver, = make_drivers(1)
+            deliver(order, driver)
+            Review.objects.create(client=client, restaurant=restaurant, order=order,
+                                  rating=5, comment='Excelente')
+
+    def _list_queries(self, name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        # Session and user lookups of the authenticated request are not part of the plan
+        return len([q for q in ctx.captured_queries if 'django_session' not in q['sql']
+                    and 'auth_user' not in q['sql']])
+
+    def test_list_endpoints_have_constant_query_count(self):
+        self._seed(1)
+        small = {name: self._list_queries(name) for name in self.EXPECTED_QUERIES}
+        self._seed(10)
+        large = {name: self._list_queries(name) for name in self.EXPECTED_QUERIES}
+        self.assertEqual(small, self.EXPECTED_QUERIES)
+        self.assertEqual(large, self.EXPECTED_QUERIES)
+
+
+class APIPaginationTests(TestCase):
+    """List endpoints are cursor paginated and big tables can be exported as NDJSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ops', 'ops@example.com', 'secret123')
+        cls.restaurant = make_restaurant()
+        cls.client_record = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                                  address='Calle 1', phone_number='555')
+        cls.orders = make_orders(7, cls.restaurant, cls.client_record)
+        # Identical creation dates exercise the pk tie-breaker
+        Order.objects.update(creation_date=timezone.now() - timezone.timedelta(days=1))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        seen = []
+        url = reverse('order-list') + '?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            seen.extend(row['id'] for row in data['results'])
+            if len(seen) == 3:
+                # A new order lands on the already consumed side of the cursor
+                make_orders(1, self.restaurant, self.client_record)
+            url = data['next']
+        self.assertEqual(seen, sorted((o.id for o in self.orders), reverse=True))
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get(reverse('order-list') + '?page_size=3').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([r['id'] for r in back['results']], [r['id'] for r in first['results']])
+
+    def test_export_streams_one_json_document_per_row(self):
+        response = self.client.get(reverse('order-export'), {'status': 'pending'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['id'] for line in lines),
+                         sorted(o.id for o in self.orders))
+
+
+class ClientStatsTests(TestCase):
+    """Profile statistics are materialized incrementally on every Order write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+        cls.tacos = make_restaurant(name='Tacos')
+        cls.sushi = make_restaurant(name='Sushi')
+
+    def setUp(self):
+        self.client_record = Client.objects.create(user=self.user, name='Cliente', email='cliente@example.com',
+                                                   address='Calle 1', phone_number='555')
+
+    def _order(self, restaurant, total, status='pending'):
+        return Order.objects.create(client=self.client_record, restaurant=restaurant, status=status,
+                                    total=Decimal(total), delivery_date=timezone.now(),
+                                    delivery_address='Calle 1', payment_method='cash', comments='')
+
+    def _assert_in_sync(self):
+        stats = ClientStats.objects.get(client=self.client_record)
+        expected = compute_client_stats([self.client_record.pk])
+        self.assertEqual(
+            {key: getattr(stats, key) for key in expected}, expected
+        )
+        return stats
+
+    def test_stats_follow_creates_updates_and_deletes(self):
+        self._order(self.tacos, '100.00')
+        sushi = [self._order(self.sushi, '50.00') for _ in range(2)]
+        stats = self._assert_in_sync()
+        self.assertEqual((stats.total_orders, stats.pending_orders, stats.total_spent),
+                         (3, 3, Decimal('200.00')))
+        self.assertEqual(stats.favorite_restaurant, self.sushi)
+
+        sushi[0].status = 'delivered'
+        sushi[0].total = Decimal('70.00')
+        sushi[0].save()
+        self.assertEqual(self._assert_in_sync().pending_orders, 2)
+
+        sushi[1].delete()
+        sushi[0].restaurant = self.tacos
+        sushi[0].save()
+        stats = self._assert_in_sync()
+        self.assertEqual(stats.favorite_restaurant, self.tacos)
+        self.assertEqual(stats.average_ticket, Decimal('85.00'))
+
+    def test_order_row_and_stats_are_saved_together(self):
+        order = self._order(self.tacos, '100.00')
+        order.status = 'delivered'
+        with CaptureQueriesContext(connection) as ctx, \
+                mock.patch('orders.signals.record_order_change', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            order.save()
+        # La fila no cambia si los contadores no se movieron
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'pending')
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', ctx.captured_queries[1]['sql'])
+        self._assert_in_sync()
+
+    def _perfil_queries(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('perfil'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_perfil_query_count_does_not_grow_with_history(self):
+        self._order(self.tacos, '10.00')
+        _, few = self._perfil_queries()
+        for _ in range(30):
+            self._order(self.sushi, '20.00')
+        response, many = self._perfil_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(response.context['total_orders'], 31)
+        self.assertEqual(response.context['total_spent'], Decimal('610.00'))
+        self.assertEqual(response.context['favorite_restaurant'], self.sushi)
+
+    def test_perfil_reads_client_and_stats_in_one_query(self):
+        self._order(self.tacos, '10.00')
+        _, with_client = self._perfil_queries()
+        self.user = User.objects.create_user('nuevo', 'nuevo@example.com', 'secret123')
+        response, without_client = self._perfil_queries()
+        # Sesión y usuario, más una sola consulta de cliente con sus estadísticas
+        self.assertEqual(with_client, without_client)
+        self.assertIsNone(response.context['client'])
+        self.assertEqual((response.context['total_orders'], response.context['average_ticket']), (0, 0))
+
+    def test_missing_stats_row_is_backfilled(self):
+        make_orders(4, self.tacos, self.client_record)
+        ClientStats.objects.all().delete()
+        response, _ = self._perfil_queries()
+        self.assertEqual(response.context['total_orders'], 4)
+        self._assert_in_sync()
+
+
+class OrderHistoryTests(TestCase):
+    """Order history is keyset paginated with a fixed number of queries per page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+        cls.restaurant = make_restaurant()
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Taco al pastor',
+                                             price=Decimal('25.00'), description='Con piña')
+        cls.client_record = Client.objects.create(user=cls.user, name='Cliente', email='cliente@example.com',
+                                                  address='Calle 1', phone_number='555')
+        cls.orders = make_orders(45, cls.restaurant, cls.client_record)
+        # Identical creation dates exercise the pk tie-breaker
+        Order.objects.update(creation_date=timezone.now() - timezone.timedelta(days=1))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=cls.product, quantity=2, unit_price=cls.product.price)
+            for order in cls.orders
+        ])
+        driver, = make_drivers(1)
+        for order in cls.orders[:10]:
+            deliver(order, driver)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pages_follow_the_cursor_with_constant_queries(self):
+        seen = []
+        url = reverse('order_list')
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            # Session, user, the page of orders and its items
+            self.assertEqual(len(ctx.captured_queries), 4)
+            page = response.context['orders']
+            self.assertLessEqual(len(page), 20)
+            seen += [order.pk for order in page]
+            url = response.context['next_page'] and reverse('order_list') + response.context['next_page']
+        self.assertEqual(seen, sorted((o.pk for o in self.orders), reverse=True))
+        self.assertContains(response, '2 x Taco al pastor')
+
+    def test_infinite_scroll_endpoint(self):
+        first = self.client.get(reverse('order_list'))
+        data = self.client.get(first.context['next_api']).json()
+        self.assertEqual(data['count'], 20)
+        self.assertIn(f'Pedido #{self.orders[24].pk}', data['html'])
+        last = self.client.get(data['next']).json()
+        self.assertEqual(last['count'], 5)
+        self.assertIsNone(last['next'])
+
+    def test_other_users_and_bad_cursors(self):
+        other = User.objects.create_user('otro', 'otro@example.com', 'secret123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('order_history_api')).json()['count'], 0)
+        self.assertEqual(self.client.get(reverse('order_list'), {'cursor': 'no-es-un-cursor'}).status_code, 404)
+
+
+class ClientLinkTests(TestCase):
+    """Each account owns at most one Client, found by key rather than by name or email"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.ana = User.objects.create_user('ana', 'ana@example.com', 'secret123',
+                                           first_name='Ana', last_name='López')
+        cls.homonym = User.objects.create_user('ana2', 'ana2@example.com', 'secret123',
+                                               first_name='Ana', last_name='López')
+
+    def test_users_with_the_same_name_do_not_share_orders(self):
+        client = Client.objects.create(user=self.ana, name='Ana López', email='ana@example.com',
+                                       address='Calle 1', phone_number='555')
+        make_orders(2, self.restaurant, client)
+
+        self.client.force_login(self.homonym)
+        self.assertEqual(len(self.client.get(reverse('order_list')).context['orders']), 0)
+        self.assertIsNone(self.client.get(reverse('perfil')).context['client'])
+
+        self.client.force_login(self.ana)
+        with self.assertNumQueries(4):
+            # Session, user, the orders joined through the client key and their items
+            orders = list(self.client.get(reverse('order_list')).context['orders'])
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(self.client.get(reverse('perfil')).context['client'], client)
+
+    def test_backfill_links_by_checkout_name_then_email(self):
+        from django.apps import apps
+        backfill = import_module('orders.migrations.0010_backfill_client_user')
+        by_name = Client.objects.create(name='Ana López', email='otro@example.com',
+                                        address='Calle 1', phone_number='555')
+        by_email = Client.objects.create(name='Otra persona', email='ana2@example.com',
+                                         address='Calle 2', phone_number='555')
+        stranger = Client.objects.create(name='Nadie', email='nadie@example.com',
+                                         address='Calle 3', phone_number='555')
+
+        backfill.link_clients_to_users(apps, None)
+
+        by_name.refresh_from_db()
+        by_email.refresh_from_db()
+        stranger.refresh_from_db()
+        self.assertEqual(by_name.user, self.ana)
+        # The homonym can't take Ana's client and falls back to the email
+        self.assertEqual(by_email.user, self.homonym)
+        self.assertIsNone(stranger.user)
+
+
+class BulkTransitionTests(TestCase):
+    """Many orders change status in one transaction with a fixed number of statements"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.staff = User.objects.create_user('ops', 'ops@example.com', 'secret123', is_staff=True,
+                                             is_superuser=True)
+
+    def setUp(self):
+        load_index.invalidate()
+        self.driver, = make_drivers(1)
+        self.client_record = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                                   address='Calle 1', phone_number='555')
+        self.orders = make_orders(6, self.restaurant, self.client_record)
+        self.deliveries = [deliver(order, self.driver) for order in self.orders]
+        # make_orders uses bulk_create, which skips the stats signals
+        rebuild_client_stats([self.client_record.pk])
+        load_index.rebuild()
+
+    def test_valid_invalid_and_missing_orders_are_reported_per_id(self):
+        self.orders[0].status = 'delivered'
+        self.orders[0].save()
+        ids = [o.pk for o in self.orders[:3]] + [999999]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = bulk_transition(ids, 'cancelled')
+
+        self.assertEqual(results[self.orders[0].pk], {'ok': False, 'from': 'delivered',
+                                                      'error': 'invalid_transition'})
+        self.assertEqual(results[self.orders[1].pk], {'ok': True, 'from': 'pending', 'error': None})
+        self.assertEqual(results[999999], {'ok': False, 'from': None, 'error': 'not_found'})
+        self.assertEqual(
+            list(Order.objects.filter(pk__in=ids).order_by('pk').values_list('status', flat=True)),
+            ['delivered', 'cancelled', 'cancelled'],
+        )
+        self.assertEqual(
+            list(Delivery.objects.filter(order__in=self.orders[:3]).order_by('order')
+                 .values_list('delivery_status', flat=True)),
+            ['pending', 'failed', 'failed'],
+        )
+        self.assertEqual(load_index.load(self.driver.pk), 4)
+        self.assertEqual(load_index.drift(), {})
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders,
+                         compute_client_stats([self.client_record.pk])['pending_orders'])
+
+    def test_statement_count_does_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            bulk_transition([self.orders[0].pk], 'in_progress')
+        with CaptureQueriesContext(connection) as large:
+            bulk_transition([o.pk for o in self.orders[1:]], 'in_progress')
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders, 6)
+
+        with CaptureQueriesContext(connection) as finished:
+            bulk_transition([o.pk for o in self.orders], 'delivered')
+        # Lock and read, UPDATE orders, lock and UPDATE deliveries, UPDATE driver loads and stats
+        self.assertEqual(len([q for q in finished.captured_queries
+                              if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]), 6)
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders, 0)
+
+    def test_api_endpoint_is_staff_only(self):
+        url = reverse('order-transition')
+        body = {'ids': [self.orders[0].pk, self.orders[1].pk], 'status': 'in_progress'}
+        customer = User.objects.create_user('cliente', 'c@example.com', 'secret123')
+        self.client.force_login(customer)
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(url, {'ids': [], 'status': 'flying'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'ids', 'status'})
+
+        data = self.client.post(url, body, content_type='application/json').json()
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual([r['id'] for r in data['results']], body['ids'])
+
+    def test_admin_action(self):
+        self.client.force_login(self.staff)
+        Order.objects.filter(pk=self.orders[0].pk).update(status='cancelled')
+        response = self.client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'mark_delivered',
+            '_selected_action': [o.pk for o in self.orders[:2]],
+        }, follow=True)
+        self.assertContains(response, 'no admiten esa transición')
+        self.assertEqual(Order.objects.get(pk=self.orders[1].pk).status, 'pending')
+        bulk_transition([self.orders[1].pk], 'in_progress')
+        self.client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'mark_delivered', '_selected_action': [self.orders[1].pk],
+        })
+        self.assertEqual(Order.objects.get(pk=self.orders[1].pk).status, 'delivered')
+
+
+class StateTransitionTests(TestCase):
+    """Single transitions are one conditional UPDATE and never overwrite a newer version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.user = User.objects.create_user('driver', 'driver@example.com', 'secret123')
+        cls.staff = User.objects.create_user('ops', 'ops@example.com', 'secret123', is_staff=True)
+
+    def setUp(self):
+        load_index.invalidate()
+        self.driver, = make_drivers(1)
+        self.client_record = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                                   address='Calle 1', phone_number='555')
+        self.order, = make_orders(1, self.restaurant, self.client_record)
+        self.delivery = deliver(self.order, self.driver)
+        rebuild_client_stats([self.client_record.pk])
+        load_index.rebuild()
+
+    def _read_order(self):
+        return Order.objects.only('pk', 'client_id', 'status', 'version').get(pk=self.order.pk)
+
+    def test_order_transition_is_a_single_conditional_update(self):
+        order = self._read_order()
+        with CaptureQueriesContext(connection) as ctx:
+            transition_order(order, 'in_progress')
+        sql = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(sql), 1)
+        self.assertTrue(sql[0].startswith('UPDATE "orders_order"'))
+        self.assertIn('"version"', sql[0].split('WHERE')[1])
+        self.assertEqual((order.status, order.version), ('in_progress', 1))
+        self.assertEqual(Order.objects.values_list('status', 'version').get(pk=order.pk), ('in_progress', 1))
+
+    def test_stale_version_raises_and_keeps_the_newer_write(self):
+        stale, fresh = self._read_order(), self._read_order()
+        transition_order(fresh, 'in_progress')
+        with self.assertRaises(TransitionConflict):
+            transition_order(stale, 'cancelled')
+        self.assertEqual(Order.objects.values_list('status', 'version').get(pk=self.order.pk), ('in_progress', 1))
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders, 1)
+        with self.assertRaises(InvalidTransition), self.assertNumQueries(0):
+            transition_order(fresh, 'pending')
+
+    def test_cancelling_fails_the_delivery_and_frees_the_driver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_order(self._read_order(), 'cancelled')
+        self.assertEqual(Delivery.objects.values_list('delivery_status', 'version').get(pk=self.delivery.pk),
+                         ('failed', 1))
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders, 0)
+        self.assertEqual(load_index.load(self.driver.pk), 0)
+        self.assertEqual(load_index.drift(), {})
+
+    def test_delivery_transition_and_api(self):
+        delivery = Delivery.objects.only('pk', 'driver_id', 'delivery_status', 'version').get(pk=self.delivery.pk)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            transition_delivery(delivery, 'in_transit')
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries
+                          if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))], ['UPDATE'])
+        self.assertEqual(load_index.load(self.driver.pk), 1)
+
+        url = reverse('delivery-transition', args=[delivery.pk])
+        self.client.force_login(self.user)
+        response = self.client.post(url, {'status': 'failed', 'version': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(url, {'status': 'delivered', 'version': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'error': 'conflict', 'delivery_status': 'in_transit', 'version': 1})
+        response = self.client.post(url, {'status': 'pending', 'version': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'status': 'delivered', 'version': 1},
+                                        content_type='application/json')
+        self.assertEqual(response.json(), {'id': delivery.pk, 'delivery_status': 'delivered', 'version': 2})
+        self.assertEqual(load_index.load(self.driver.pk), 0)
+
+    def test_order_transition_api(self):
+        url = reverse('order-transition-detail', args=[self.order.pk])
+        self.client.force_login(self.user)
+        response = self.client.post(url, {'status': 'cancelled', 'version': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.staff)
+        transition_order(self._read_order(), 'in_progress')
+        response = self.client.post(url, {'status': 'cancelled', 'version': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'error': 'conflict', 'status': 'in_progress', 'version': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'status': 'cancelled', 'version': 1},
+                                        content_type='application/json')
+        self.assertEqual(response.json(), {'id': self.order.pk, 'status': 'cancelled', 'version': 2})
+        self.assertEqual(Delivery.objects.get(pk=self.delivery.pk).delivery_status, 'failed')
+        self.assertEqual(ClientStats.objects.get(client=self.client_record).pending_orders, 0)
+
+    def test_api_edits_leave_the_status_alone(self):
+        self.client.force_login(self.user)
+        response = self.client.patch(reverse('order-detail', args=[self.order.pk]),
+                                     {'status': 'delivered', 'comments': 'Sin cebolla'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.values_list('status', 'version', 'comments').get(pk=self.order.pk),
+                         ('pending', 0, 'Sin cebolla'))
+
+    def test_edits_loaded_before_a_transition_do_not_write_it_back(self):
+        stale_api = Order.objects.get(pk=self.order.pk)
+        stale_admin = Order.objects.get(pk=self.order.pk)
+        stale_delivery = Delivery.objects.get(pk=self.delivery.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_order(self._read_order(), 'cancelled')
+
+        serializer = OrderSerializer(stale_api, data={'comments': 'Sin cebolla'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        stale_admin.total = Decimal('150.00')
+        admin.site._registry[Order].save_model(None, stale_admin, mock.Mock(changed_data=['total']), True)
+        stale_delivery.delivery_time = time(14)
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site._registry[Delivery].save_model(
+                None, stale_delivery, mock.Mock(changed_data=['delivery_time']), True)
+
+        self.assertEqual(
+            Order.objects.values_list('status', 'version', 'comments', 'total').get(pk=self.order.pk),
+            ('cancelled', 1, 'Sin cebolla', Decimal('150.00')),
+        )
+        self.assertEqual(Delivery.objects.values_list('delivery_status', 'version').get(pk=self.delivery.pk),
+                         ('failed', 1))
+        stats = ClientStats.objects.get(client=self.client_record)
+        expected = compute_client_stats([self.client_record.pk])
+        self.assertEqual((stats.pending_orders, stats.total_spent),
+                         (expected['pending_orders'], expected['total_spent']))
+        self.assertEqual(load_index.load(self.driver.pk), 0)
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    """Parallel transitions from the same read: one wins per row, the rest conflict without reading"""
+
+    def setUp(self):
+        # Runs on Postgres and on SQLite with a file test database
+        # (DATABASES['default']['TEST']['NAME']); an in-memory one fails any concurrent write
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('the in-memory SQLite test database takes no concurrent writers')
+
+    def test_no_lost_updates(self):
+        workers, rows = 6, 4
+        restaurant = make_restaurant()
+        client = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                       address='Calle 1', phone_number='555')
+        orders = make_orders(rows, restaurant, client)
+        driver, = make_drivers(1)
+        for order in orders:
+            deliver(order, driver)
+        rebuild_client_stats([client.pk])
+        barrier = threading.Barrier(workers)
+        won, lost, errors = [], [], []
+        reads = []
+
+        def worker(n):
+            # Cada hilo parte de su propia lectura; la mitad cancela y la otra mitad acepta
+            target = 'cancelled' if n % 2 else 'in_progress'
+            snapshot = list(Order.objects.only('pk', 'client_id', 'status', 'version')
+                            .filter(pk__in=[o.pk for o in orders]).order_by('pk'))
+            barrier.wait()
+            try:
+                with CaptureQueriesContext(connections['default']) as ctx:
+                    for order in snapshot:
+                        try:
+                            transition_order(order, target)
+                            won.append((order.pk, target))
+                        except TransitionConflict:
+                            lost.append(order.pk)
+                reads.extend(q['sql'] for q in ctx.captured_queries
+                             if q['sql'].startswith('SELECT') and '"orders_order"' in q['sql'])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(pk for pk, _ in won), [o.pk for o in orders])
+        self.assertEqual(len(lost), rows * (workers - 1))
+        # Ninguna transición volvió a leer el pedido
+        self.assertEqual(reads, [])
+        final = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual({pk: final[pk] for pk, _ in won}, dict(won))
+        self.assertEqual(set(Order.objects.values_list('version', flat=True)), {1})
+        cancelled = sum(target == 'cancelled' for _, target in won)
+        self.assertEqual(ClientStats.objects.get(client=client).pending_orders, rows - cancelled)
+        self.assertEqual(Delivery.objects.filter(delivery_status='failed').count(), cancelled)
+
+
+class RestaurantRatingTests(TestCase):
+    """Restaurant rating aggregates follow every Review write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tacos = make_restaurant()
+        cls.sushi = make_restaurant(name='Sushi Gdl')
+        cls.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com',
+                                               address='Calle 1', phone_number='555')
+        cls.order, = make_orders(1, cls.tacos, cls.client_obj)
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def review(self, restaurant, rating):
+        return Review.objects.create(client=self.client_obj, restaurant=restaurant, order=self.order,
+                                     rating=rating, comment='')
+
+    def assertRating(self, restaurant, count, total, rating):
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.rating_count, restaurant.rating_sum, restaurant.rating),
+                         (count, total, Decimal(rating)))
+
+    def test_create_edit_move_and_delete(self):
+        first = self.review(self.tacos, 5)
+        self.review(self.tacos, 4)
+        self.assertRating(self.tacos, 2, 9, '4.50')
+
+        first.rating = 2
+        first.save()
+        self.assertRating(self.tacos, 2, 6, '3.00')
+
+        first.restaurant = self.sushi
+        first.save()
+        self.assertRating(self.tacos, 1, 4, '4.00')
+        self.assertRating(self.sushi, 1, 2, '2.00')
+
+        first.delete()
+        # Sin reseñas se queda con la última calificación
+        self.assertRating(self.sushi, 0, 0, '2.00')
+
+    def test_listings_follow_the_live_rating(self):
+        self.review(self.tacos, 3)
+        self.review(self.sushi, 4)
+        self.assertEqual([r.name for r in catalog.restaurants()], ['Sushi Gdl', 'Tacos ITESO'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review(self.tacos, 5)
+            self.review(self.tacos, 5)
+        self.assertEqual([r.name for r in catalog.restaurants()], ['Tacos ITESO', 'Sushi Gdl'])
+
+    def test_rebuild_after_bulk_insert(self):
+        Review.objects.bulk_create([
+            Review(client=self.client_obj, restaurant=self.tacos, order=self.order, rating=rating, comment='')
+            for rating in (5, 4, 4)
+        ])
+        self.assertRating(self.tacos, 0, 0, '4.50')
+        call_command('rebuild_restaurant_ratings', stdout=StringIO())
+        self.assertRating(self.tacos, 3, 13, '4.33')
+        self.assertRating(self.sushi, 0, 0, '4.50')
+        self.assertEqual(rebuild_restaurant_ratings([self.tacos.pk]), 1)
+
+    def test_unreviewed_restaurants_keep_their_curated_rating(self):
+        from django.apps import apps
+        backfill = import_module('orders.migrations.0007_restaurant_rating_aggregate')
+        self.review(self.tacos, 2)
+        Restaurant.objects.filter(pk=self.sushi.pk).update(rating=Decimal('3.80'), rating_count=7)
+        backfill.backfill_ratings(apps, None)
+        self.assertRating(self.tacos, 1, 2, '2.00')
+        self.assertRating(self.sushi, 0, 0, '3.80')
+
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'secret123')
+        self.client.force_login(staff)
+        url = reverse('admin:orders_restaurant_change', args=[self.sushi.pk])
+        self.assertContains(self.client.get(reverse('admin:orders_restaurant_changelist')), 'sin reseñas')
+        data = {field: getattr(self.sushi, field) for field in
+                ('name', 'address', 'phone_number', 'opening_time', 'closing_time')}
+        self.assertRedirects(self.client.post(url, {**data, 'rating': '4.10'}),
+                             reverse('admin:orders_restaurant_changelist'))
+        self.assertRating(self.sushi, 0, 0, '4.10')
+
+        # Con reseñas la calificación es solo lectura y la manda el promedio
+        self.review(self.sushi, 5)
+        self.client.post(url, {**data, 'rating': '1.00'})
+        self.assertRating(self.sushi, 1, 5, '5.00')
+
+
+class SearchMigrationTests(TransactionTestCase):
+    """Migration 0008 carries its own DDL instead of calling orders.search"""
+
+    def test_frozen_ddl_reinstalls_a_working_index(self):
+        from django.apps import apps
+        migration = import_module('orders.migrations.0008_search_index')
+        Product.objects.create(restaurant=make_restaurant(), name='Taco al pastor',
+                               price=Decimal('25.00'), description='Con piña')
+        # Revertir DDL de FTS5 dentro del savepoint de TestCase rompe la conexión
+        with connection.schema_editor() as editor:
+            migration.uninstall_search_index(apps, editor)
+            migration.install_search_index(apps, editor)
+        self.assertEqual([p.name for p in search.products('pina')], ['Taco al pastor'])
+
+
+class SearchTests(TestCase):
+    """Full-text search over restaurants and products, maintained by the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+        cls.tacos = make_restaurant()
+        cls.sushi = make_restaurant(name='Sushi Gdl', address='Avenida Chapultepec 15')
+        cls.pastor = Product.objects.create(restaurant=cls.tacos, name='Taco al pastor',
+                                            price=Decimal('25.00'), description='Con piña')
+        cls.ramen = Product.objects.create(restaurant=cls.sushi, name='Ramen',
+                                           price=Decimal('120.00'), description='Incluye un taco de regalo')
+        cls.hidden = Product.objects.create(restaurant=cls.tacos, name='Taco de lengua',
+                                            price=Decimal('30.00'), description='', availability=False)
+
+    def names(self, queryset):
+        return [obj.name for obj in queryset]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.names(search.products('taco')), ['Taco al pastor', 'Ramen'])
+        self.assertEqual(self.names(search.restaurants('chapultepec')), ['Sushi Gdl'])
+
+    def test_accents_and_query_syntax_are_ignored(self):
+        self.assertEqual(self.names(search.products('PINA')), ['Taco al pastor'])
+        self.assertEqual(self.names(search.products('taco" OR (NEAR')), [])
+        self.assertEqual(self.names(search.products('   ')), [])
+
+    def test_index_follows_writes_and_bulk_loads(self):
+        self.ramen.name = 'Ramen tonkotsu'
+        self.ramen.save()
+        self.assertEqual(self.names(search.products('tonkotsu')), ['Ramen tonkotsu'])
+        self.pastor.delete()
+        self.assertEqual(self.names(search.products('pastor')), [])
+        Product.objects.bulk_create([
+            Product(restaurant=self.sushi, name='Nigiri de salmón', price=Decimal('90.00'), description='')
+        ])
+        self.assertEqual(self.names(search.products('salmon')), ['Nigiri de salmón'])
+
+    def test_storefront_page_and_json(self):
+        response = self.client.get(reverse('search'), {'q': 'taco'})
+        self.assertContains(response, 'Taco al pastor')
+        self.assertContains(response, 'Ramen')
+        self.assertNotContains(response, 'Taco de lengua')
+
+        data = self.client.get(reverse('search_api'), {'q': 'taco'}).json()
+        self.assertEqual([p['name'] for p in data['products']], ['Taco al pastor', 'Ramen'])
+        self.assertEqual([r['name'] for r in data['restaurants']], ['Tacos ITESO'])
+        self.assertGreater(data['products'][0]['rank'], data['products'][1]['rank'])
+
+    def test_api_search_pages_by_rank(self):
+        self.client.force_login(self.user)
+        url = reverse('product-list') + '?search=taco&page_size=1'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['name'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, self.names(search.search(Product.objects.all(), 'taco')))
+        self.assertEqual(sorted(seen[:2]), ['Taco al pastor', 'Taco de lengua'])
+        self.assertEqual(seen[2], 'Ramen')
+
+
+class CatalogCacheTests(TestCase):
+    """Catalog pages are served from cache and invalidated by Restaurant/Product writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Taco al pastor',
+                                             price=Decimal('25.00'), description='Con piña')
+
+    def setUp(self):
+        caches['catalog'].clear()
+        catalog.reset_cache_stats()
+
+    def test_cached_pages_do_not_query_the_database(self):
+        for name, args in (('home', []), ('restaurant_list', []),
+                           ('restaurant_detail', [self.restaurant.id])):
+            self.client.get(reverse(name, args=args))
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(name, args=args))
+            self.assertContains(response, self.restaurant.name)
+
+    def test_product_change_invalidates_its_menu(self):
+        url = reverse('restaurant_detail', args=[self.restaurant.id])
+        self.assertContains(self.client.get(url), 'Taco al pastor')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Taco de suadero'
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Taco de suadero')
+
+    def test_restaurant_change_invalidates_listings(self):
+        self.assertContains(self.client.get(reverse('home')), 'Tacos ITESO')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_restaurant(name='Sushi Gdl', rating=Decimal('4.90'))
+        self.assertContains(self.client.get(reverse('home')), 'Sushi Gdl')
+        self.assertContains(self.client.get(reverse('restaurant_list')), 'Sushi Gdl')
+
+    def test_unknown_restaurant_is_404(self):
+        response = self.client.get(reverse('restaurant_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_hit_and_miss_counters_are_exposed_to_staff(self):
+        url = reverse('restaurant_detail', args=[self.restaurant.id])
+        self.client.get(url)
+        self.client.get(url)
+        staff = User.objects.create_user('staff', 'staff@example.com', 'secret123', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(reverse('catalog_cache_stats')).json()
+        self.assertEqual(stats['restaurant'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['fragment'], {'hits': 1, 'misses': 1})
+        # The async view loads the menu before rendering, so it is read from cache too
+        self.assertEqual(stats['menu'], {'hits': 1, 'misses': 1})
+
+
+class CartTests(TestCase):
+    """The session cart is priced with one query and reused until it goes stale"""
+
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = make_restaurant()
+        cls.products = Product.objects.bulk_create([
+            Product(restaurant=restaurant, name=f'Platillo {i}', price=Decimal('10.00'),
+                    description='Delicioso')
+            for i in range(10)
+        ])
+
+    def _product_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data)
+        return response, len([q for q in ctx.captured_queries if 'orders_product' in q['sql']])
+
+    def _fill(self, products):
+        session = self.client.session
+        session['cart'] = {str(p.id): 1 for p in products}
+        session.save()
+
+    def test_cart_page_prices_all_items_with_one_query(self):
+        self._fill(self.products)
+        response, queries = self._product_queries('get', reverse('view_cart'))
+        self.assertEqual(queries, 1)
+        self.assertEqual(response.context['total'], Decimal('100.00'))
+        _, queries = self._product_queries('get', reverse('view_cart'))
+        self.assertEqual(queries, 0)
+
+    def test_mutating_known_lines_does_not_query_products(self):
+        self._fill(self.products[:3])
+        self.client.get(reverse('view_cart'))
+        product = self.products[0]
+        for method, name, data in (('get', 'increment_cart', None),
+                                   ('get', 'decrement_cart', None),
+                                   ('post', 'set_cart_quantity', {'quantity': 4}),
+                                   ('get', 'remove_from_cart', None)):
+            _, queries = self._product_queries(method, reverse(name, args=[product.id]), data)
+            self.assertEqual(queries, 0, name)
+        _, queries = self._product_queries('get', reverse('add_to_cart', args=[self.products[5].id]))
+        self.assertEqual(queries, 1)
+        self.assertEqual(self.client.session['cart'],
+                         {str(self.products[1].id): 1, str(self.products[2].id): 1,
+                          str(self.products[5].id): 1})
+
+    def test_unknown_product_cannot_be_added(self):
+        response = self.client.get(reverse('add_to_cart', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(CART_SNAPSHOT_TTL=0)
+    def test_stale_snapshot_is_repriced(self):
+        self._fill(self.products[:1])
+        self.client.get(reverse('view_cart'))
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('12.50'))
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['total'], Decimal('12.50'))
+
+    def test_deleted_products_are_dropped_from_the_cart(self):
+        self._fill(self.products[:2])
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(len(response.context['items']), 1)
+        self.assertEqual(self.client.session['cart'], {str(self.products[1].id): 1})
+
+
+class CartAPITests(TestCase):
+    """The JSON cart API returns the updated line and totals instead of redirecting"""
+
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = make_restaurant()
+        cls.products = Product.objects.bulk_create([
+            Product(restaurant=restaurant, name=f'Platillo {i}', price=Decimal('10.00') + i,
+                    description='Delicioso')
+            for i in range(5)
+        ])
+
+    def _post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_add_set_and_remove_a_line(self):
+        product = self.products[1]
+        url = reverse('cart_api_line', args=[product.id])
+        data = self._post(url, {'delta': 2}).json()
+        self.assertEqual(data['lines'][str(product.id)]['quantity'], 2)
+        self.assertEqual(data['total'], '22.00')
+
+        data = self._post(url, {'quantity': 5}).json()
+        self.assertEqual(data['lines'][str(product.id)]['subtotal'], '55.00')
+        self.assertEqual(data['count'], 5)
+
+        data = self.client.delete(url).json()
+        self.assertIsNone(data['lines'][str(product.id)])
+        self.assertEqual((data['count'], data['total']), (0, '0'))
+
+    def test_batch_update_prices_all_lines_with_one_query(self):
+        lines = [{'product_id': p.id, 'quantity': 1} for p in self.products]
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._post(reverse('cart_api_batch'), {'lines': lines}).json()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'orders_product' in q['sql']]), 1)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['total'], '60.00')
+
+        data = self._post(reverse('cart_api_batch'), {'lines': [
+            {'product_id': self.products[0].id, 'quantity': 0},
+            {'product_id': self.products[1].id, 'quantity': 3},
+        ]}).json()
+        self.assertIsNone(data['lines'][str(self.products[0].id)])
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(self.client.get(reverse('cart_api')).json()['count'], 6)
+
+    def test_invalid_requests_leave_the_cart_untouched(self):
+        self._post(reverse('cart_api_line', args=[self.products[0].id]), {'quantity': 1})
+        url = reverse('cart_api_line', args=[self.products[0].id])
+        self.assertEqual(self._post(url, {'quantity': -1}).status_code, 400)
+        self.assertEqual(self.client.post(url, 'nope', content_type='application/json').status_code, 400)
+        response = self._post(reverse('cart_api_batch'), {'lines': [
+            {'product_id': self.products[0].id, 'quantity': 9},
+            {'product_id': 999999, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.session['cart'], {str(self.products[0].id): 1})
+
+    def test_booleans_and_fractions_are_not_quantities(self):
+        url = reverse('cart_api_line', args=[self.products[0].id])
+        self._post(url, {'quantity': 1})
+        for body in ({'delta': True}, {'delta': 1.5}, {'quantity': True}, {'quantity': 2.5}):
+            with self.subTest(body=body):
+                self.assertEqual(self._post(url, body).status_code, 400)
+        response = self._post(reverse('cart_api_batch'), {'lines': [{'product_id': True, 'quantity': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.session['cart'], {str(self.products[0].id): 1})
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP no disponible')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   OUTBOX_EMAIL_BACKEND=None, OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BACKOFF=30)
+class OutboxTests(TestCase):
+    """Emails are queued with the request's transaction and sent by the worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Taco',
+                                             price=Decimal('25.00'), description='Pastor')
+        Driver.objects.create(name='Ana', email='ana@example.com', phone_number='555',
+                              vehicle_type='Moto')
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+
+    def setUp(self):
+        load_index.invalidate()
+
+    def test_checkout_queues_confirmation_without_sending(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['cart'] = {str(self.product.id): 2}
+        session.save()
+        self.client.post(reverse('checkout'), {
+            'delivery_address': 'Calle 1 #23', 'payment_method': 'cash', 'comments': '',
+        })
+
+        queued = OutboundEmail.objects.get()
+        self.assertEqual((queued.status, queued.to), ('pending', ['cliente@example.com']))
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('send_outbox', '--workers', '1', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(f'Pedido #{Order.objects.get().id}', mail.outbox[0].subject)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'sent')
+        self.assertIsNotNone(queued.sent_at)
+
+    def test_rolled_back_transaction_drops_the_email(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue_email('Hola', 'Cuerpo', ['a@example.com'])
+                raise RuntimeError
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_failures_back_off_and_give_up(self):
+        email = enqueue_email('Hola', 'Cuerpo', ['a@example.com'])
+        with override_settings(OUTBOX_EMAIL_BACKEND='orders.tests.FailingBackend'):
+            with self.assertLogs('orders.outbox', 'WARNING'):
+                self.assertEqual(deliver_pending(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertIn('SMTP no disponible', email.last_error)
+            # Not due again until the backoff has passed
+            self.assertEqual(deliver_pending(), (0, 0))
+
+            for attempts in (2, 3):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now())
+                with self.assertLogs('orders.outbox', 'WARNING'):
+                    deliver_pending()
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempts)
+            self.assertEqual(email.status, 'failed')
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+    def test_rows_claimed_by_another_worker_are_not_sent_twice(self):
+        first = enqueue_email('Hola', 'Cuerpo', ['a@example.com'])
+        second = enqueue_email('Hola', 'Cuerpo', ['b@example.com'])
+        manager = OutboundEmail.objects
+        filter_ = manager.filter
+
+        def racing_filter(*args, **kwargs):
+            # Otro worker reclama el primer correo entre la lectura y el UPDATE
+            if kwargs.get('pk') == first.pk:
+                filter_(pk=first.pk).update(status='sending', next_attempt_at=timezone.now())
+            return filter_(*args, **kwargs)
+
+        with mock.patch.object(manager, 'filter', side_effect=racing_filter):
+            batch = claim_batch(10)
+        self.assertEqual(batch, [second])
+
+    def test_backends_without_skip_locked_use_one_worker(self):
+        enqueue_email('Hola', 'Cuerpo', ['a@example.com'])
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            self.assertEqual(deliver_pending(workers=4), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class SendOutboxLoopTests(SimpleTestCase):
+    """The --loop sender logs database errors and keeps polling"""
+
+    def test_loop_survives_errors(self):
+        from django.db import OperationalError
+
+        results = [OperationalError('database is locked'), (2, 0)]
+
+        def deliver(*args):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        command = 'orders.management.commands.send_outbox'
+        out = StringIO()
+        with mock.patch(f'{command}.deliver_pending', side_effect=deliver), \
+                mock.patch(f'{command}.connections'), \
+                mock.patch(f'{command}.time.sleep', side_effect=[None, KeyboardInterrupt]), \
+                self.assertLogs(command, 'ERROR'):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('send_outbox', '--loop', stdout=out)
+        self.assertEqual(results, [])
+        self.assertIn('Sent 2 email(s), 0 failed.', out.getvalue())
+
+
+class NotificationRenderingTests(TestCase):
+    """Confirmations of many orders render with a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        products = Product.objects.bulk_create([
+            Product(restaurant=cls.restaurant, name=f'Platillo {i}', price=Decimal('10.00'),
+                    description='Delicioso')
+            for i in range(3)
+        ])
+        cls.orders = make_orders(10, cls.restaurant)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, unit_price=product.price)
+            for order in cls.orders for product in products
+        ])
+        driver = make_drivers(1)[0]
+        for order in cls.orders[:5]:
+            deliver(order, driver)
+
+    def setUp(self):
+        clear_template_cache()
+
+    def test_batch_render_uses_two_queries(self):
+        ids = [o.pk for o in self.orders]
+        with self.assertNumQueries(2):
+            rendered = render_order_confirmations(ids)
+        self.assertEqual(len(rendered), 10)
+        first = rendered[0]
+        self.assertEqual(first.to, ['cliente@example.com'])
+        self.assertIn(f'Número de pedido: #{first.order.id}', first.body)
+        self.assertIn('- Platillo 0 x2 - $20.00', first.body)
+        self.assertIn('Conductor asignado: Conductor 0', first.body)
+        self.assertNotIn('Conductor asignado', rendered[-1].body)
+        self.assertIn('Hola <strong>Cliente</strong>', first.html_body)
+
+    def test_template_is_compiled_once(self):
+        render_order_confirmations([o.pk for o in self.orders])
+        info = _template.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 9))
+
+    def test_queue_confirmations_inserts_once(self):
+        with self.assertNumQueries(3):
+            queue_order_confirmations([o.pk for o in self.orders[:4]])
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 4)
+
+
+class SeedLoadTests(TestCase):
+    """seed_load generates consistent, reproducible data"""
+
+    def _seed(self):
+        return seed_all(restaurants=3, products_per_restaurant=4, clients=5, drivers=2,
+                        orders=30, seed=7, batch_size=8)
+
+    def _snapshot(self):
+        return (
+            list(Client.objects.order_by('pk').values_list('name', 'email')),
+            list(Order.objects.order_by('pk').values_list('status', 'total')),
+            list(OrderItem.objects.order_by('pk').values_list('quantity', 'unit_price')),
+        )
+
+    def test_seed_is_consistent_and_reproducible(self):
+        counts = self._seed()
+        self.assertEqual((counts.products, counts.orders, counts.deliveries), (12, 30, 30))
+        self.assertEqual(Delivery.objects.count(), Order.objects.count())
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total, sum(i.unit_price * i.quantity for i in order.items.all()))
+        stats = ClientStats.objects.aggregate(orders=Sum('total_orders'))
+        self.assertEqual(stats['orders'], 30)
+
+        first = self._snapshot()
+        for model in (Order, Client, Product, Restaurant, Driver):
+            model.objects.all().delete()
+        self._seed()
+        self.assertEqual(self._snapshot(), first)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """The HTTP benchmark covers every scenario and leaves no data behind"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_all(restaurants=2, products_per_restaurant=5, clients=3, drivers=2, orders=10, seed=1)
+
+    def test_offline_run_reports_every_scenario_and_rolls_back(self):
+        orders = Order.objects.count()
+        results = run_benchmarks(iterations=2, warmup=1, memory_iterations=1)
+        self.assertEqual(Order.objects.count(), orders)
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+        scenarios = results['scenarios']
+        self.assertIn('checkout', scenarios)
+        self.assertIn('api_deliveries', scenarios)
+        self.assertEqual(scenarios['checkout']['status'], [302])
+        self.assertEqual(scenarios['api_orders']['status'], [200])
+        self.assertGreater(scenarios['home']['peak_memory_kib'], 0)
+        self.assertEqual(json.loads(json.dumps(results)), results)
+
+    def test_compare_flags_regressions(self):
+        def result(p50, queries):
+            return {'scenarios': {'home': {
+                'latency_ms': {'p50': p50, 'p95': p50}, 'queries': {'max': queries}, 'peak_memory_kib': None,
+            }}}
+
+        _, regressed = compare(result(10, 2), result(10.5, 2))
+        self.assertFalse(regressed)
+        _, regressed = compare(result(10, 2), result(10, 3))
+        self.assertTrue(regressed)
+        _, regressed = compare(result(10, 2), result(12, 2), threshold=0.1)
+        self.assertTrue(regressed)
+
+
+class RequestMetricsTests(TestCase):
+    """The metrics middleware times views, counts queries and spots repeated ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.staff = User.objects.create_user('admin', 'admin@example.com', 'secret123', is_staff=True)
+
+    def setUp(self):
+        request_metrics.reset()
+        caches['catalog'].clear()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"')
+
+        metrics = request_metrics.snapshot()[('restaurant_detail', 'GET')]
+        self.assertEqual(metrics['requests'], 1)
+        self.assertGreater(metrics['queries'], 0)
+        self.assertEqual(metrics['response_bytes'], len(response.content))
+
+    def test_repeated_statements_count_as_duplicates(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in range(3):
+                list(Restaurant.objects.filter(pk=pk))
+            list(Product.objects.all())
+        self.assertEqual((recorder.count, recorder.duplicates), (4, 2))
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('rappiteso_http_requests_total{view="home",method="GET"} 1', body)
+        self.assertIn('rappiteso_http_request_duration_seconds_bucket{view="home",method="GET",le="+Inf"} 1', body)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_unknown_methods_share_one_label(self):
+        url = reverse('home')
+        for method in ('PURGE', 'X-RANDOM-1', 'X-RANDOM-2'):
+            self.client.generic(method, url)
+        self.client.options(url)
+        self.assertEqual(sorted(request_metrics.snapshot()), [('home', 'OPTIONS'), ('home', 'OTHER')])
+        self.assertEqual(request_metrics.snapshot()[('home', 'OTHER')]['requests'], 3)
+
+
+class AsyncViewTests(TestCase):
+    """Read-heavy views run natively on the async stack"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        Product.objects.create(restaurant=cls.restaurant, name='Taco al pastor',
+                               price=Decimal('25.00'), description='Con piña')
+        cls.order = make_orders(1, cls.restaurant)[0]
+        deliver(cls.order, make_drivers(1)[0])
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+
+    def setUp(self):
+        caches['catalog'].clear()
+        request_metrics.reset()
+
+    async def test_catalog_pages(self):
+        client = AsyncClient()
+        for name, args, text in (('home', [], 'Tacos ITESO'), ('restaurant_list', [], 'Tacos ITESO'),
+                                 ('restaurant_detail', [self.restaurant.id], 'Taco al pastor')):
+            response = await client.get(reverse(name, args=args))
+            self.assertContains(response, text)
+        response = await client.get(reverse('restaurant_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_queries_of_async_views_are_recorded(self):
+        response = await AsyncClient().get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        metrics = request_metrics.snapshot()[('restaurant_detail', 'GET')]
+        self.assertEqual(metrics['queries'], 2)
+
+    async def test_checkout_success_requires_login(self):
+        client = AsyncClient()
+        url = reverse('checkout_success', args=[self.order.id])
+        self.assertEqual((await client.get(url)).status_code, 302)
+        await client.aforce_login(self.user)
+        response = await client.get(url)
+        self.assertContains(response, f'#{self.order.id}')
+        self.assertContains(response, 'Conductor 0')
+
+
+@mock.patch('orders.routers.replica_alias', return_value='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    """Catalog reads of a request go to the replica until the request writes"""
+
+    router = routers.ReplicaRouter()
+
+    def _request(self, pinned=False):
+        token = routers.begin_request(pinned)
+        self.addCleanup(routers.end_request, token)
+
+    def test_no_replica_configured(self, replica_alias):
+        replica_alias.return_value = None
+        self._request()
+        self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_reads_outside_requests_use_the_primary(self, replica_alias):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(routers.reporting_db(), 'default')
+
+    def test_catalog_reads_go_to_replica_until_a_write(self, replica_alias):
+        self._request()
+        self.assertEqual(self.router.db_for_read(Product), 'replica')
+        self.assertEqual(self.router.db_for_read(Review), 'replica')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(routers.reporting_db(), 'replica')
+
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(routers.reporting_db(), 'default')
+
+    def test_session_writes_do_not_pin(self, replica_alias):
+        from django.contrib.sessions.models import Session
+        self._request()
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(Restaurant), 'replica')
+
+    def test_pinned_request_and_open_transaction_read_the_primary(self, replica_alias):
+        self._request(pinned=True)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        routers.end_request(routers.begin_request())
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self._request()
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_replica_is_never_migrated(self, replica_alias):
+        self.assertFalse(self.router.allow_migrate('replica', 'orders'))
+        self.assertIsNone(self.router.allow_migrate('default', 'orders'))
+
+
+@mock.patch('orders.routers.replica_alias', return_value='replica')
+class ReplicaPinningTests(TestCase):
+    """A request that writes pins the client to the primary for a few seconds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Taco',
+                                             price=Decimal('25.00'), description='Pastor')
+        Driver.objects.create(name='Ana', email='ana@example.com', phone_number='555',
+                              vehicle_type='Moto')
+        cls.user = User.objects.create_user('cliente', 'cliente@example.com', 'secret123')
+
+    def setUp(self):
+        load_index.invalidate()
+
+    def test_checkout_sets_the_pin_cookie(self, replica_alias):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('cart_api_line', args=[self.product.id]),
+                                    json.dumps({'quantity': 1}), content_type='application/json')
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('checkout'), {
+            'delivery_address': 'Calle 1 #23', 'payment_method': 'cash', 'comments': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    """With a real second database, catalog reads hit the replica until the request writes"""
+
+    @classmethod
+    def setUpClass(cls):
+        # La réplica solo existe durante esta clase: el runner no la conoce al arrancar
+        cls.databases = {'default', 'replica'}
+        cls._tmp = tempfile.TemporaryDirectory()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls._tmp.name, 'replica.sqlite3')}
+        connections.settings['replica'] = connections.configure_settings({'default': {}, 'replica': replica})['replica']
+        cls._override = override_settings(DATABASES={**settings.DATABASES, 'replica': replica})
+        with warnings.catch_warnings():
+            # Las conexiones ya se registraron arriba; solo replica_alias() lee el setting
+            warnings.simplefilter('ignore')
+            cls._override.enable()
+        # allow_migrate excluye la réplica: se crea solo el esquema del catálogo
+        with connections['replica'].schema_editor() as editor:
+            editor.create_model(Restaurant)
+            editor.create_model(Product)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls._override.disable()
+        cls._tmp.cleanup()
+
+    def setUp(self):
+        # Los mismos datos con nombres distintos revelan qué base respondió
+        make_restaurant(name='Primario')
+        Restaurant.objects.using('replica').create(
+            name='Réplica', address='Periférico Sur 8585', phone_number='3333333333',
+            opening_time=time(9), closing_time=time(22),
+        )
+        self.user = User.objects.create_user('ops', 'ops@example.com', 'secret123')
+
+    def tearDown(self):
+        # flush respeta allow_migrate y nunca vacía la réplica
+        with connections['replica'].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Restaurant._meta.db_table}')
+
+    def _names(self):
+        return list(Restaurant.objects.values_list('name', flat=True))
+
+    def test_router_reads_replica_until_the_request_writes(self):
+        self.assertEqual(self._names(), ['Primario'])
+        token = routers.begin_request()
+        try:
+            self.assertEqual(self._names(), ['Réplica'])
+            with transaction.atomic():
+                self.assertEqual(self._names(), ['Primario'])
+            Client.objects.create(name='Cliente', email='c@example.com', address='Calle 1', phone_number='555')
+            self.assertEqual(Client.objects.using('default').count(), 1)
+            self.assertEqual(self._names(), ['Primario'])
+        finally:
+            routers.end_request(token)
+
+    def test_pin_cookie_sends_the_next_request_to_the_primary(self):
+        self.client.force_login(self.user)
+        url = reverse('restaurant-list')
+        self.assertEqual([r['name'] for r in self.client.get(url).json()['results']], ['Réplica'])
+
+        response = self.client.post(reverse('client-list'), {
+            'name': 'Cliente', 'email': 'c@example.com', 'address': 'Calle 1', 'phone_number': '555',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertTrue(Client.objects.using('default').filter(email='c@example.com').exists())
+        self.assertEqual([r['name'] for r in self.client.get(url).json()['results']], ['Primario'])
@@ -5,8 +5,16 @@ urlpatterns = [
     path('', views.index, name='home'),
     path('restaurants/', views.restaurant_list, name='restaurant_list'),
     path('restaurants/<int:restaurant_id>/', views.restaurant_detail, name='restaurant_detail'),
+    # Búsqueda de texto completo de restaurantes y productos
+    path('search/', views.search_catalog, name='search'),
+    path('search/api/', views.search_api, name='search_api'),
+    path('catalog/cache-stats/', views.catalog_cache_stats, name='catalog_cache_stats'),
+    path('dispatch/load-stats/', views.driver_load_stats, name='driver_load_stats'),
+    # Métricas por vista en formato Prometheus
+    path('metrics/', views.metrics, name='metrics'),
     # Mis pedidos (de la sesión actual)
     path('orders/', views.my_orders, name='order_list'),
+    path('orders/api/', views.order_history_api, name='order_history_api'),
     path('login/', views.iniciar_sesion, name='login'),
     path('logout/', views.cerrar_sesion, name='logout'),
     path('registro/', views.registro, name='registro'),
@@ -19,6 +27,10 @@ urlpatterns = [
     path('cart/inc/<int:product_id>/', views.increment_cart, name='increment_cart'),
     path('cart/dec/<int:product_id>/', views.decrement_cart, name='decrement_cart'),
     path('cart/set/<int:product_id>/', views.set_cart_quantity, name='set_cart_quantity'),
+    # API JSON del carrito (actualización en sitio, sin redirecciones)
+    path('cart/api/', views.cart_api, name='cart_api'),
+    path('cart/api/lines/<int:product_id>/', views.cart_api_line, name='cart_api_line'),
+    path('cart/api/batch/', views.cart_api_batch, name='cart_api_batch'),
     path('checkout/', views.checkout, name='checkout'),
     path('checkout/success/<int:order_id>/', views.checkout_success, name='checkout_success'),
 ]
@@ -1,6 +1,13 @@
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect
+from django.http import Http404, HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.urls import reverse
 from rest_framework import viewsets, permissions
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.shortcuts import render, redirect
@@ -9,15 +16,29 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.core.mail import send_mail, EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.conf import settings
-from django.utils.crypto import get_random_string
+from django.utils.crypto import constant_time_compare, get_random_string
 from django.utils import timezone
 from django.utils.html import strip_tags
+from asgiref.sync import sync_to_async
 import hashlib
+import json
+import logging
+from decimal import Decimal
 from .forms import RegistroForm, CheckoutForm
+from .cart import Cart
+from .notifications import render_order_confirmation
+from .outbox import enqueue_email
+from . import catalog, search
+from .dispatch import assign_driver, release_driver
+from .load_index import load_index
+from .lifecycle import InvalidTransition, TransitionConflict, bulk_transition, transition_delivery, transition_order
+from .metrics import request_metrics
+from .pagination import NDJSONExportMixin, keyset_page
+from .stats import profile_stats
 
 from .models import (
     Product,
@@ -37,8 +58,13 @@ from .serializers import (
     DriverSerializer,
     ReviewSerializer,
     DeliverySerializer,
+    OrderTransitionSerializer,
+    OrderStatusSerializer,
+    DeliveryTransitionSerializer,
 )
 
+logger = logging.getLogger(__name__)
+
 def _generate_verification_token(user):
     """Generate a verification token for a user"""
     # Create a token based on user id, email, and secret key
@@ -52,83 +78,24 @@ def _verify_token(user, token):
     expected_token = _generate_verification_token(user)
     return token == expected_token
 
-def send_order_confirmation_email(order, user):
-    """Send order confirmation email to the user"""
+def send_order_confirmation_email(order, user, order_items=None, delivery=None):
+    """Queue the order confirmation email for the user in the outbox"""
     try:
-        # Get order items with calculated subtotals
-        order_items = []
-        for item in order.items.select_related('product').all():
-            order_items.append({
-                'product': item.product,
-                'quantity': item.quantity,
-                'unit_price': item.unit_price,
-                'subtotal': item.unit_price * item.quantity,
-            })
-        
-        # Prepare context for email template
-        context = {
-            'order': order,
-            'user': user,
-            'order_items': order_items,
-            'restaurant': order.restaurant,
-            'delivery': order.delivery if hasattr(order, 'delivery') else None,
-        }
-        
-        # Render HTML email template
-        html_message = render_to_string('email/order_confirmation.html', context)
-        
-        # Create plain text version
-        plain_message = f"""
-Hola {user.get_full_name() or user.username},
-
-Gracias por tu pedido en RAPPITESO.
-
-Detalles del pedido:
-Número de pedido: #{order.id}
-Restaurante: {order.restaurant.name}
-Fecha: {order.creation_date.strftime('%d/%m/%Y %H:%M')}
-Estado: {order.get_status_display()}
-
-Productos:
-"""
-        for item in order_items:
-            plain_message += f"- {item['product'].name} x{item['quantity']} - ${item['subtotal']:.2f}\n"
-        
-        plain_message += f"""
-Total: ${order.total:.2f}
-
-Dirección de entrega: {order.delivery_address}
-Método de pago: {order.get_payment_method_display()}
-"""
-        if order.comments:
-            plain_message += f"Comentarios: {order.comments}\n"
-        
-        if context['delivery']:
-            plain_message += f"\nConductor asignado: {context['delivery'].driver.name}\n"
-        
-        plain_message += """
-Gracias por elegir RAPPITESO!
-
-El equipo de RAPPITESO
-        """
-        
-        # Send email
-        subject = f'Confirmación de Pedido #{order.id} - RAPPITESO'
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[user.email],
-        )
-        email.attach_alternative(html_message, "text/html")
-        email.send()
+        email = render_order_confirmation(order, user, order_items, delivery)
+        # Savepoint so a failed insert doesn't break the caller's transaction
+        with transaction.atomic():
+            # Queue email; the send_outbox worker delivers it after commit
+            enqueue_email(
+                subject=email.subject,
+                body=email.body,
+                to=email.to,
+                html_body=email.html_body,
+            )
         
         return True
     except Exception as e:
         # Log the error but don't break the order creation process
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f'Error sending order confirmation email: {str(e)}')
+        logger.error(f'Error queueing order confirmation email: {str(e)}')
         return False
 
 def registro(request):
@@ -138,8 +105,8 @@ def registro(request):
     if request.method == 'POST':
         form = RegistroForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            # Set user as inactive until email is verified
+            # Set user as inactive until email is verified (a single INSERT)
+            user = form.save(commit=False)
             user.is_active = False
             user.save()
             
@@ -151,11 +118,11 @@ def registro(request):
                 f'/activate/{user.id}/{verification_token}/'
             )
             
-            # Send verification email
+            # Queue verification email (delivered by the send_outbox worker)
             try:
-                send_mail(
+                enqueue_email(
                     subject='Verifica tu cuenta en RAPPITESO',
-                    message=f'''
+                    body=f'''
 Hola {user.get_full_name() or user.username},
 
 Gracias por registrarte en RAPPITESO.
@@ -168,9 +135,7 @@ Si no creaste esta cuenta, puedes ignorar este mensaje.
 Saludos,
 El equipo de RAPPITESO
                     ''',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
+                    to=[user.email],
                 )
                 messages.success(
                     request, 
@@ -186,7 +151,7 @@ El equipo de RAPPITESO
                 # In development, you might want to activate the user anyway
                 if settings.DEBUG:
                     user.is_active = True
-                    user.save()
+                    user.save(update_fields=['is_active'])
                     messages.info(request, 'En modo DEBUG: cuenta activada automáticamente.')
             
             return redirect('login')
@@ -223,39 +188,13 @@ def iniciar_sesion(request):
 
 @login_required
 def perfil(request):
-    # Inicializar estadísticas
-    total_orders = 0
-    pending_orders = 0
-    total_spent = 0
-    
-    # Buscar clientes por email (asumiendo que el email del usuario es único)
-    client_email = request.user.email
-    
-    # Obtener todos los clientes con este email (puede haber múltiples)
-    clients = Client.objects.filter(email=client_email)
-    
-    if clients.exists():
-        # Si hay múltiples clientes con el mismo email, tomamos el primero
-        # En una implementación real, podrías querer fusionar estos registros
-        client = clients.first()
-        
-        # Obtener todos los pedidos de los clientes con este email
-        orders = Order.objects.filter(client__in=clients)
-        total_orders = orders.count()
-        
-        # Contar pedidos pendientes
-        pending_orders = orders.filter(status__in=['pending', 'in_progress']).count()
-        
-        # Calcular el total gastado
-        total_spent = sum(order.total for order in orders if order.total)
-    
-    context = {
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
-        'total_spent': total_spent,
-        'client': client if 'client' in locals() else None,
-    }
-    
+    # Cliente enlazado a la cuenta (llave única) con sus estadísticas materializadas
+    client = (
+        Client.objects.select_related('stats__favorite_restaurant').filter(user=request.user).first()
+    )
+    context = profile_stats(client)
+    context['client'] = client
+
     return render(request, 'user/perfil.html', context)
 
 
@@ -264,36 +203,137 @@ def cerrar_sesion(request):
     return redirect('home')
 
 
-def index(request):
+# Render in a worker thread: the templates read the session and request.user,
+# which load lazily through the sync ORM
+arender = sync_to_async(render)
+
+
+async def index(request):
     # Show up to 20 restaurants on the home page
-    restaurants = Restaurant.objects.all().order_by('-rating')[:20]
-    return render(request, 'index.html', {'restaurants': restaurants})
+    restaurants = await catalog.atop_restaurants()
+    return await arender(request, 'index.html', {'restaurants': restaurants})
 
 
-def restaurant_list(request):
+async def restaurant_list(request):
     """Display a list of all restaurants"""
-    restaurants = Restaurant.objects.all().order_by('-rating')
-    return render(request, 'restaurant_list.html', {'restaurants': restaurants})
+    restaurants = await catalog.arestaurants()
+    return await arender(request, 'restaurant_list.html', {'restaurants': restaurants})
 
-def restaurant_detail(request, restaurant_id):
+async def restaurant_detail(request, restaurant_id):
     """Display a restaurant menu (products)"""
-    restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
-    products = Product.objects.filter(restaurant=restaurant, availability=True).order_by('name')
-    return render(request, 'restaurant_detail.html', {
+    restaurant = await catalog.arestaurant(restaurant_id)
+    if restaurant is None:
+        raise Http404('Restaurante no encontrado')
+    products = await catalog.amenu(restaurant_id)
+    return await arender(request, 'restaurant_detail.html', {
         'restaurant': restaurant,
         'products': products,
     })
 
 
+# Resultados por tipo en la búsqueda de la tienda y su API
+SEARCH_LIMIT = 20
+
+
+async def _search_results(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return query, [], []
+    restaurants = [r async for r in search.restaurants(query)[:SEARCH_LIMIT]]
+    products = [p async for p in search.products(query)[:SEARCH_LIMIT]]
+    return query, restaurants, products
+
+
+async def search_catalog(request):
+    """Restaurants and available products matching ?q=, best matches first"""
+    query, restaurants, products = await _search_results(request)
+    return await arender(request, 'search.html', {
+        'query': query,
+        'restaurants': restaurants,
+        'products': products,
+    })
+
+
+async def search_api(request):
+    """JSON version of search_catalog for the storefront's instant search"""
+    query, restaurants, products = await _search_results(request)
+    return JsonResponse({
+        'query': query,
+        'restaurants': [
+            {'id': r.id, 'name': r.name, 'address': r.address, 'rating': str(r.rating),
+             'rank': r.search_rank}
+            for r in restaurants
+        ],
+        'products': [
+            {'id': p.id, 'name': p.name, 'price': str(p.price), 'restaurant_id': p.restaurant_id,
+             'restaurant': p.restaurant.name, 'rank': p.search_rank}
+            for p in products
+        ],
+    })
+
+
+@staff_member_required
+def catalog_cache_stats(request):
+    """Hit/miss counters of the catalog cache in this process"""
+    return JsonResponse(catalog.cache_stats())
+
+
+@staff_member_required
+def driver_load_stats(request):
+    """Drift counters of the driver load index in the process answering the request.
+
+    ``drift`` compares that index with the database right now, without
+    rebuilding it.
+    """
+    report = load_index.report()
+    report['drift'] = {str(pk): loads for pk, loads in load_index.drift().items()}
+    return JsonResponse(report)
+
+
+def metrics(request):
+    """Request metrics of this process in Prometheus text format.
+
+    Staff only, or any client sending ``Authorization: Bearer <METRICS_TOKEN>``
+    when that setting is configured (for the Prometheus scraper).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = request.user.is_active and request.user.is_staff
+    if token and not authorized:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Pedidos por página del historial (la página y el scroll infinito)
+ORDER_HISTORY_PAGE_SIZE = 20
+
+
+def _order_history(queryset, cursor):
+    """A page of orders with everything order_list.html shows: two queries per page"""
+    queryset = queryset.select_related('client', 'restaurant', 'delivery__driver').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('pk'))
+    )
+    return keyset_page(queryset, cursor, ORDER_HISTORY_PAGE_SIZE)
+
+
+def _render_order_history(request, queryset, api_url=None):
+    orders, next_cursor = _order_history(queryset, request.GET.get('cursor'))
+    return render(request, 'order_list.html', {
+        'orders': orders,
+        'next_page': f'?cursor={next_cursor}' if next_cursor else None,
+        'next_api': f'{api_url}?cursor={next_cursor}' if next_cursor and api_url else None,
+    })
+
+
 def order_list(request):
     """Display a list of all orders"""
-    orders = Order.objects.all().order_by('-creation_date')
-    return render(request, 'order_list.html', {'orders': orders})
+    return _render_order_history(request, Order.objects.all())
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(NDJSONExportMixin, viewsets.ModelViewSet):
     """ViewSet for Order model"""
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related('client', 'restaurant').prefetch_related('products')
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -302,14 +342,62 @@ class OrderViewSet(viewsets.ModelViewSet):
     ordering_fields = ['creation_date', 'status', 'total']
     ordering = ['-creation_date']
 
-class ProductViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser],
+            serializer_class=OrderTransitionSerializer)
+    def transition(self, request):
+        """Move many orders to one status in a single transaction (staff only).
+
+        Body: ``{"ids": [...], "status": "delivered"}``. Orders that don't
+        exist or can't make the transition are reported per id and left as
+        they are; the rest are updated together.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_transition(serializer.validated_data['ids'], serializer.validated_data['status'])
+        return Response({
+            'status': serializer.validated_data['status'],
+            'updated': sum(result['ok'] for result in results.values()),
+            'results': [{'id': pk, **result} for pk, result in results.items()],
+        })
+
+    @action(detail=True, methods=['post'], url_path='transition', url_name='transition-detail',
+            permission_classes=[IsAdminUser], serializer_class=OrderStatusSerializer)
+    def transition_one(self, request, pk=None):
+        """Move one order to another status if it is still at the given version (staff only).
+
+        Body: ``{"status": "cancelled", "version": 2}``; answers like the
+        delivery transition (409 on a conflict, 400 on an invalid move).
+        """
+        return _versioned_transition(
+            self, Order.objects.only('pk', 'client_id', 'status', 'version'), pk, 'status', transition_order,
+        )
+
+
+def _versioned_transition(view, queryset, pk, status_field, transition):
+    """Shared body of the single-row transition actions (orders.lifecycle)"""
+    serializer = view.get_serializer(data=view.request.data)
+    serializer.is_valid(raise_exception=True)
+    obj = get_object_or_404(queryset, pk=pk)
+    if obj.version == serializer.validated_data['version']:
+        try:
+            transition(obj, serializer.validated_data['status'])
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=400)
+        except TransitionConflict:
+            obj.refresh_from_db(fields=[status_field, 'version'])
+        else:
+            return Response({'id': obj.pk, status_field: getattr(obj, status_field), 'version': obj.version})
+    return Response({'error': 'conflict', status_field: getattr(obj, status_field), 'version': obj.version},
+                    status=409)
+
+
+class ProductViewSet(NDJSONExportMixin, viewsets.ModelViewSet):
     """ViewSet for Product model"""
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, search.FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['restaurant', 'availability']
-    search_fields = ['name']
     ordering_fields = ['price', 'availability']
     ordering = ['-price']
     
@@ -318,10 +406,9 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, search.FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['name', 'opening_time', 'closing_time']
-    search_fields = ['name']
-    ordering_fields = ['rating', 'opening_time', 'closing_time']
+    ordering_fields = ['rating', 'rating_count', 'opening_time', 'closing_time']
     ordering = ['-rating']
 
 class ClientViewSet(viewsets.ModelViewSet):
@@ -349,18 +436,20 @@ class DriverViewSet(viewsets.ModelViewSet):
     
 class ReviewViewSet(viewsets.ModelViewSet):
     """ViewSet for Review model"""
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related('client', 'restaurant')
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['client', 'restaurant', 'order', 'rating']
     search_fields = ['comment']
-    ordering_fields = ['creation_date', 'rating']
-    ordering = ['-creation_date']
+    ordering_fields = ['review_date', 'rating']
+    ordering = ['-review_date']
     
-class DeliveryViewSet(viewsets.ModelViewSet):
+class DeliveryViewSet(NDJSONExportMixin, viewsets.ModelViewSet):
     """ViewSet for Delivery model"""
-    queryset = Delivery.objects.all()
+    queryset = Delivery.objects.select_related(
+        'order__client', 'order__restaurant', 'driver'
+    ).prefetch_related('order__products')
     serializer_class = DeliverySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -369,6 +458,20 @@ class DeliveryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['delivery_date', 'delivery_time', 'delivery_status']
     ordering = ['-delivery_date']
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser],
+            serializer_class=DeliveryTransitionSerializer)
+    def transition(self, request, pk=None):
+        """Move one delivery to another status if it is still at the given version (staff only).
+
+        Body: ``{"status": "in_transit", "version": 3}``. Answers 409 with
+        the current status and version when someone else changed the
+        delivery first, and 400 when its status doesn't allow the move.
+        """
+        return _versioned_transition(
+            self, Delivery.objects.only('pk', 'driver_id', 'delivery_status', 'version'), pk,
+            'delivery_status', transition_delivery,
+        )
+
 def activate_account(request, user_id, token):
     user = get_object_or_404(User, pk=user_id)
     
@@ -380,217 +483,270 @@ def activate_account(request, user_id, token):
     # Activate the user if not already active
     if not user.is_active:
         user.is_active = True
-        user.save()
+        user.save(update_fields=['is_active'])
         messages.success(request, '¡Tu cuenta ha sido verificada exitosamente! Ahora puedes iniciar sesión.')
     else:
         messages.info(request, 'Tu cuenta ya está verificada.')
     return redirect('login')
 
-def _get_cart(request):
-    cart = request.session.get('cart', {})
-    return cart
-
-
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    cart = _get_cart(request)
-    pid = str(product_id)
-    cart[pid] = cart.get(pid, 0) + 1
-    request.session['cart'] = cart
-    messages.success(request, f"Agregado al carrito: {product.name}")
+    cart = Cart(request)
+    product = cart.add(product_id)
+    messages.success(request, f"Agregado al carrito: {product['name']}")
     return redirect('view_cart')
 
 
 def remove_from_cart(request, product_id):
-    cart = _get_cart(request)
-    pid = str(product_id)
-    if pid in cart:
-        del cart[pid]
-        request.session['cart'] = cart
+    cart = Cart(request)
+    if cart.remove(product_id):
         messages.info(request, "Producto removido del carrito")
     return redirect('view_cart')
 
 
 def view_cart(request):
-    cart = _get_cart(request)
-    items = []
-    total = 0
-    for pid, qty in cart.items():
-        product = get_object_or_404(Product, pk=int(pid))
-        subtotal = product.price * qty
-        total += subtotal
-        items.append({
-            'product': product,
-            'quantity': qty,
-            'subtotal': subtotal,
-        })
+    cart = Cart(request)
+    items = cart.items()
+    total = sum((it['subtotal'] for it in items), 0)
     return render(request, 'cart.html', {'items': items, 'total': total})
 
 
 def increment_cart(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    cart = _get_cart(request)
-    pid = str(product_id)
-    cart[pid] = cart.get(pid, 0) + 1
-    request.session['cart'] = cart
-    messages.success(request, f"Se aumentó la cantidad de {product.name}")
+    cart = Cart(request)
+    product = cart.add(product_id)
+    messages.success(request, f"Se aumentó la cantidad de {product['name']}")
     return redirect('view_cart')
 
 
 def decrement_cart(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    cart = _get_cart(request)
-    pid = str(product_id)
-    if pid in cart:
-        cart[pid] = max(0, cart[pid] - 1)
-        if cart[pid] == 0:
-            del cart[pid]
-            messages.info(request, f"{product.name} removido del carrito")
+    cart = Cart(request)
+    qty = cart.quantity(product_id)
+    if qty:
+        product = cart.set(product_id, qty - 1)
+        if qty == 1:
+            messages.info(request, f"{product['name']} removido del carrito")
         else:
-            messages.success(request, f"Se redujo la cantidad de {product.name}")
-        request.session['cart'] = cart
+            messages.success(request, f"Se redujo la cantidad de {product['name']}")
     return redirect('view_cart')
 
 
 def set_cart_quantity(request, product_id):
     if request.method != 'POST':
         return redirect('view_cart')
-    product = get_object_or_404(Product, pk=product_id)
     try:
         qty = int(request.POST.get('quantity', '1'))
     except ValueError:
         qty = 1
     qty = max(0, qty)
-    cart = _get_cart(request)
-    pid = str(product_id)
+    cart = Cart(request)
+    product = cart.set(product_id, qty)
     if qty == 0:
-        cart.pop(pid, None)
-        messages.info(request, f"{product.name} removido del carrito")
+        messages.info(request, f"{product['name']} removido del carrito")
     else:
-        cart[pid] = qty
-        messages.success(request, f"Cantidad de {product.name} actualizada a {qty}")
-    request.session['cart'] = cart
+        messages.success(request, f"Cantidad de {product['name']} actualizada a {qty}")
     return redirect('view_cart')
 
 
-@login_required
-def checkout(request):
-    cart = _get_cart(request)
-    if not cart:
-        messages.warning(request, 'Tu carrito está vacío')
-        return redirect('view_cart')
-
-    # Build order data
-    products = []
-    for pid, qty in cart.items():
-        product = get_object_or_404(Product, pk=int(pid))
-        products.append((product, qty))
-
-    # Choose restaurant from first product
-    restaurant = products[0][0].restaurant
-    total = sum(p.price * qty for p, qty in products)
-
-    if request.method == 'POST':
-        form = CheckoutForm(request.POST)
-        if form.is_valid():
-            # Get or create Client for this user
-            user = request.user
+def _place_order(request, form, products, restaurant, total):
+    """Write the Client, Order, OrderItems and Delivery in a single transaction"""
+    user = request.user
+    delivery_address = form.cleaned_data['delivery_address']
+    driver = None
+    try:
+        with transaction.atomic():
+            # Get or create the Client linked to this user
             client, _ = Client.objects.get_or_create(
-                name=user.get_full_name() or user.username,
+                user=user,
                 defaults={
+                    'name': user.get_full_name() or user.username,
                     'email': user.email or 'no-email@example.com',
-                    'address': form.cleaned_data['delivery_address'],
+                    'address': delivery_address,
                     'phone_number': '',
                 }
             )
-            
+
             # Update client address if it's different
-            if client.address != form.cleaned_data['delivery_address']:
-                client.address = form.cleaned_data['delivery_address']
-                client.save()
+            if client.address != delivery_address:
+                client.address = delivery_address
+                client.save(update_fields=['address'])
 
-            # Create the order
             order = Order.objects.create(
                 client=client,
                 restaurant=restaurant,
                 status='pending',
                 total=total,
                 delivery_date=timezone.now(),
-                delivery_address=form.cleaned_data['delivery_address'],
+                delivery_address=delivery_address,
                 payment_method=form.cleaned_data['payment_method'],
                 comments=form.cleaned_data['comments'],
             )
-            
-            # Create OrderItems
-            for p, qty in products:
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    quantity=qty,
-                    unit_price=p.price,
-                )
-            
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=p, quantity=qty, unit_price=p.price)
+                for p, qty in products
+            ])
+
             # Asignar conductor automáticamente
+            driver, emergency = assign_driver()
+            if emergency:
+                messages.warning(request, 'Se ha creado un conductor de emergencia para tu pedido.')
+            now = timezone.now()
+            delivery = Delivery.objects.create(
+                order=order,
+                driver=driver,
+                delivery_date=now,
+                delivery_time=now.time(),
+                delivery_status='pending',
+            )
+
+            # Queued in the same transaction: no email for a rolled back order
+            if user.email:
+                order_items = [
+                    {'product': p, 'quantity': qty, 'unit_price': p.price, 'subtotal': p.price * qty}
+                    for p, qty in products
+                ]
+                email_queued = send_order_confirmation_email(order, user, order_items, delivery)
+                if not email_queued:
+                    # Log warning but don't break the flow
+                    logger.warning(f'Could not queue order confirmation email for order #{order.id}')
+    except Exception:
+        # Revertido: la reserva del índice nunca llegará por on_commit
+        if driver is not None:
+            release_driver(driver)
+        raise
+    return order, delivery
+
+
+def _cart_json(cart, product_ids=()):
+    """Updated lines for product_ids plus the cart totals"""
+    items = cart.items()
+    by_id = {str(it['product']['id']): it for it in items}
+    lines = {}
+    for pid in map(str, product_ids):
+        it = by_id.get(pid)
+        lines[pid] = None if it is None else {
+            'product_id': it['product']['id'],
+            'name': it['product']['name'],
+            'quantity': it['quantity'],
+            'unit_price': str(it['unit_price']),
+            'subtotal': str(it['subtotal']),
+        }
+    return {
+        'lines': lines,
+        'count': sum(it['quantity'] for it in items),
+        'total': str(sum((it['subtotal'] for it in items), Decimal('0'))),
+    }
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _is_int(value):
+    # bool es subclase de int: true no es una cantidad
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _quantity(value):
+    # Texto de formulario o entero JSON; 2.5 o true no se redondean a una cantidad
+    if isinstance(value, (bool, float)):
+        return None
+    try:
+        qty = int(value)
+    except (TypeError, ValueError):
+        return None
+    return qty if qty >= 0 else None
+
+
+@require_http_methods(['GET'])
+def cart_api(request):
+    """Cart totals and every line as JSON"""
+    cart = Cart(request)
+    return JsonResponse(_cart_json(cart, list(cart.lines)))
+
+
+@require_http_methods(['POST', 'DELETE'])
+def cart_api_line(request, product_id):
+    """Add to ({"delta": n}), set ({"quantity": n}) or DELETE one cart line"""
+    cart = Cart(request)
+    if request.method == 'DELETE':
+        cart.remove(product_id)
+        return JsonResponse(_cart_json(cart, [product_id]))
+
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    if 'quantity' in data:
+        qty = _quantity(data['quantity'])
+    else:
+        delta = data.get('delta', 1)
+        qty = max(0, cart.quantity(product_id) + delta) if _is_int(delta) else None
+    if qty is None:
+        return JsonResponse({'error': 'Cantidad inválida'}, status=400)
+    try:
+        cart.set(product_id, qty)
+    except Http404:
+        return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    return JsonResponse(_cart_json(cart, [product_id]))
+
+
+@require_http_methods(['POST'])
+def cart_api_batch(request):
+    """Set several lines at once: {"lines": [{"product_id": 1, "quantity": 2}, ...]}"""
+    data = _json_body(request)
+    lines = data.get('lines') if data else None
+    if not isinstance(lines, list):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    quantities = {}
+    for line in lines:
+        pid = line.get('product_id') if isinstance(line, dict) else None
+        qty = _quantity(line.get('quantity')) if isinstance(line, dict) else None
+        if not _is_int(pid) or qty is None:
+            return JsonResponse({'error': 'Línea inválida', 'line': line}, status=400)
+        quantities[pid] = qty
+    cart = Cart(request)
+    try:
+        cart.update(quantities)
+    except Http404:
+        return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    return JsonResponse(_cart_json(cart, quantities))
+
+
+@login_required
+def checkout(request):
+    cart = Cart(request)
+    if not cart:
+        messages.warning(request, 'Tu carrito está vacío')
+        return redirect('view_cart')
+
+    # Build order data (precios frescos de la base de datos)
+    products = cart.products()
+
+    # Choose restaurant from first product
+    restaurant = products[0][0].restaurant
+    total = sum(p.price * qty for p, qty in products)
+
+    if request.method == 'POST':
+        form = CheckoutForm(request.POST)
+        if form.is_valid():
+            user = request.user
             try:
-                # Buscar el conductor con menos entregas pendientes
-                driver = Driver.objects.filter(availability=True)
-                if not driver.exists():
-                    # Si no hay conductores disponibles, buscar cualquier conductor
-                    driver = Driver.objects.first()
-                    if driver is None:
-                        # Si no hay conductores en el sistema, crear uno de emergencia
-                        driver = Driver.objects.create(
-                            name='Conductor de Emergencia',
-                            email='emergencia@example.com',
-                            phone_number='555-0000',
-                            vehicle_type='Moto',
-                            availability=True
-                        )
-                        messages.warning(request, 'Se ha creado un conductor de emergencia para tu pedido.')
-                else:
-                    # Seleccionar el conductor con menos entregas pendientes
-                    driver = min(
-                        driver,
-                        key=lambda d: Delivery.objects.filter(
-                            driver=d, 
-                            delivery_status__in=['pending', 'in_transit']
-                        ).count()
-                    )
-                
-                # Crear la entrega
-                delivery = Delivery.objects.create(
-                    order=order,
-                    driver=driver,
-                    delivery_date=timezone.now(),
-                    delivery_time=timezone.now().time(),
-                    delivery_status='pending',
-                )
-                
-                # Send order confirmation email
-                if user.email:
-                    email_sent = send_order_confirmation_email(order, user)
-                    if not email_sent:
-                        # Log warning but don't break the flow
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.warning(f'Could not send order confirmation email for order #{order.id}')
-                
-                messages.success(request, f'Pedido #{order.id} creado exitosamente. Conductor asignado: {driver.name}.')
-                if user.email:
-                    messages.info(request, 'Se ha enviado un correo de confirmación a tu email.')
-                
-                # Clear cart
-                request.session['cart'] = {}
-                return redirect('checkout_success', order_id=order.id)
-                
+                order, delivery = _place_order(request, form, products, restaurant, total)
             except Exception as e:
-                # En caso de error, registrar y notificar
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Error asignando conductor al pedido {order.id}: {str(e)}')
+                # La transacción se revierte completa; registrar y notificar
+                logger.error(f'Error procesando el pedido: {str(e)}')
                 messages.error(request, 'Hubo un error al procesar tu pedido. Por favor intenta de nuevo.')
-                order.delete()  # Eliminar el pedido si hay un error
                 return redirect('view_cart')
+
+            messages.success(request, f'Pedido #{order.id} creado exitosamente. Conductor asignado: {delivery.driver.name}.')
+            if user.email:
+                messages.info(request, 'Se ha enviado un correo de confirmación a tu email.')
+
+            # Clear cart
+            cart.clear()
+            return redirect('checkout_success', order_id=order.id)
     else:
         initial_data = {}
         if request.user.is_authenticated and hasattr(request.user, 'client'):
@@ -610,85 +766,34 @@ def checkout(request):
     }
     return render(request, 'checkout_form.html', context)
 
-    # Create OrderItems
-    for p, qty in products:
-        OrderItem.objects.create(
-            order=order,
-            product=p,
-            quantity=qty,
-            unit_price=p.price,
-        )
 
-    # Asignar conductor automáticamente
-    try:
-        # Buscar el conductor con menos entregas pendientes
-        driver = Driver.objects.filter(availability=True)
-        if not driver.exists():
-            # Si no hay conductores disponibles, buscar cualquier conductor
-            driver = Driver.objects.first()
-            if driver is None:
-                # Si no hay conductores en el sistema, crear uno de emergencia
-                driver = Driver.objects.create(
-                    name='Conductor de Emergencia',
-                    email='emergencia@example.com',
-                    phone_number='555-0000',
-                    vehicle_type='Moto',
-                    availability=True
-                )
-                messages.warning(request, 'Se ha creado un conductor de emergencia para tu pedido.')
-        else:
-            # Seleccionar el conductor con menos entregas pendientes
-            driver = min(
-                driver,
-                key=lambda d: Delivery.objects.filter(
-                    driver=d, 
-                    delivery_status__in=['pending', 'in_transit']
-                ).count()
-            )
-        
-        # Crear la entrega
-        delivery = Delivery.objects.create(
-            order=order,
-            driver=driver,
-            delivery_date=timezone.now(),
-            delivery_time=timezone.now().time(),
-            delivery_status='pending',  # Cambiado a 'pending' en lugar de 'in_transit'
-        )
-        
-        # Actualizar el estado del pedido
-        order.status = 'in_progress'
-        order.save()
-        
-        messages.success(request, f'Pedido #{order.id} creado exitosamente. Conductor asignado: {driver.name}.')
-        
-    except Exception as e:
-        # En caso de error, registrar y notificar
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f'Error asignando conductor al pedido {order.id}: {str(e)}')
-        messages.error(request, 'Hubo un error al asignar un conductor. Por favor contacta al soporte.')
-
-    # Clear cart
-    request.session['cart'] = {}
-    messages.success(request, f'Pago realizado con éxito. Pedido #{order.id} creado y conductor asignado.')
-    return redirect('checkout_success', order_id=order.id)
+@login_required
+def my_orders(request):
+    # Orders of the Client linked to this user, one keyset page at a time
+    orders = Order.objects.filter(client__user=request.user)
+    return _render_order_history(request, orders, reverse('order_history_api'))
 
 
 @login_required
-def my_orders(request):
-    # Retrieve orders for the implicit Client created for this user
-    name_key = request.user.get_full_name() or request.user.username
-    orders = Order.objects.filter(client__name=name_key).order_by('-creation_date')
-    return render(request, 'order_list.html', {'orders': orders})
+@require_http_methods(['GET'])
+def order_history_api(request):
+    """Next page of my_orders for infinite scroll: the rendered rows and the next URL"""
+    orders, next_cursor = _order_history(Order.objects.filter(client__user=request.user),
+                                         request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('partials/order_rows.html', {'orders': orders}, request=request),
+        'count': len(orders),
+        'next': f"{reverse('order_history_api')}?cursor={next_cursor}" if next_cursor else None,
+    })
 
 
 @login_required
-def checkout_success(request, order_id: int):
-    order = get_object_or_404(Order, pk=order_id)
-    items = order.items.select_related('product').all()
-    delivery = Delivery.objects.filter(order=order).select_related('driver').first()
-    return render(request, 'checkout.html', {
+async def checkout_success(request, order_id: int):
+    order = await aget_object_or_404(Order.objects.select_related('restaurant'), pk=order_id)
+    items = [item async for item in order.items.select_related('product')]
+    delivery = await Delivery.objects.filter(order=order).select_related('driver').afirst()
+    return await arender(request, 'checkout.html', {
         'order': order,
         'items': items,
         'delivery': delivery,
-    })
\ No newline at end of file
+    })
@@ -5,13 +5,7 @@ class CustomSignupForm(SignupForm):
     # extra profile fields from template
     def save(self, request):
         user = super().save(request)
-        phone = request.POST.get("phone", "").strip()
-        default_address = request.POST.get("default_address", "").strip()
-        # profile is created by signal; update values
-        prof = user.profile
-        if phone:
-            prof.phone = phone
-        if default_address:
-            prof.default_address = default_address
-        prof.save()
+        fields = {name: request.POST.get(name, "").strip() for name in ("phone", "default_address")}
+        # profile is created by signal; only write the values that were given
+        user.profile.update(**{name: value for name, value in fields.items() if value})
         return user
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def create_missing_profiles(apps, schema_editor):
+    # Profiles are created only with the user now, so users from before need one
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Profile = apps.get_model('users', 'Profile')
+    missing = User.objects.filter(profile__isnull=True).order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for user_id in missing.iterator(chunk_size=BATCH_SIZE):
+        batch.append(Profile(user_id=user_id))
+        if len(batch) == BATCH_SIZE:
+            Profile.objects.bulk_create(batch)
+            batch = []
+    Profile.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,6 @@
 # users/models.py
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 
 class Profile(models.Model):
 
@@ -12,3 +10,12 @@ class Profile(models.Model):
 
     def __str__(self):
         return f"Profile of {self.user.username}"
+
+    def update(self, **fields):
+        """Set the given fields and save only the ones that changed; returns whether it saved"""
+        changed = [name for name, value in fields.items() if getattr(self, name) != value]
+        for name in changed:
+            setattr(self, name, fields[name])
+        if changed:
+            self.save(update_fields=changed)
+        return bool(changed)
@@ -20,14 +20,11 @@ class UserMeSerializer(serializers.ModelSerializer):
         profile_data = validated_data.pop('profile', {})
         for attr, val in validated_data.items():
             setattr(instance, attr, val)
-        instance.save()
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
 
         if profile_data:
-            prof = getattr(instance, 'profile', None)
-            if prof is None:
-                prof = Profile.objects.create(user=instance)
-            for attr, val in profile_data.items():
-                setattr(prof, attr, val)
-            prof.save()
+            # the profile exists since the user was created (signal + backfill)
+            instance.profile.update(**profile_data)
 
         return instance
\ No newline at end of file
@@ -5,14 +5,8 @@ from django.contrib.auth.models import User
 from .models import Profile
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    # create profile when a new user is created
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # create the profile once, with the user; later saves (last_login on
+    # login, is_active on activation) never touch it
+    if created and not raw:
         Profile.objects.create(user=instance)
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    # keep profile in sync with user saves
-    # ensure profile exists in odd flows
-    Profile.objects.get_or_create(user=instance)
-    instance.profile.save()
\ No newline at end of file
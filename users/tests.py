@@ -1,3 +1,87 @@
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from orders.views import _generate_verification_token
+
+from .models import Profile
+
+
+class ProfileLifecycleTests(TestCase):
+    """Profiles are written when the user is created or they change, never on other user saves"""
+
+    def _capture(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = method(*args, **kwargs)
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def _profile_queries(self, queries):
+        return [sql for sql in queries if 'users_profile' in sql]
+
+    def _user_updates(self, queries):
+        return [sql for sql in queries if sql.startswith('UPDATE "auth_user"')]
+
+    def test_login_issues_no_profile_queries(self):
+        User.objects.create_user('ana', 'ana@example.com', 'secret123')
+        response, queries = self._capture(self.client.post, reverse('login'),
+                                          {'username': 'ana', 'password': 'secret123'})
+        self.assertRedirects(response, reverse('perfil'), fetch_redirect_response=False)
+        self.assertEqual(self._profile_queries(queries), [])
+        # Only last_login is written
+        updates = self._user_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"last_login"', updates[0])
+        self.assertNotIn('"password"', updates[0])
+
+    def test_activation_issues_no_profile_queries(self):
+        user = User.objects.create_user('ana', 'ana@example.com', 'secret123', is_active=False)
+        url = reverse('activate_account', args=[user.pk, _generate_verification_token(user)])
+        response, queries = self._capture(self.client.get, url)
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertEqual(self._profile_queries(queries), [])
+        updates = self._user_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"last_login"', updates[0])
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+
+    def test_profile_is_created_once_and_saved_only_on_change(self):
+        # INSERT del usuario y de su perfil, nada más
+        with self.assertNumQueries(2):
+            _, queries = self._capture(User.objects.create_user, 'ana', 'ana@example.com', 'secret123')
+        self.assertEqual(len([sql for sql in self._profile_queries(queries) if sql.startswith('INSERT')]), 1)
+
+        user = User.objects.get(username='ana')
+        user.first_name = 'Ana'
+        _, queries = self._capture(user.save)
+        self.assertEqual(self._profile_queries(queries), [])
+
+        profile = Profile.objects.get(user=user)
+        with self.assertNumQueries(0):
+            self.assertFalse(profile.update(phone=''))
+        with self.assertNumQueries(1):
+            self.assertTrue(profile.update(phone='3312345678', default_address=''))
+        profile.refresh_from_db()
+        self.assertEqual(profile.phone, '3312345678')
+
+    def test_me_endpoint_writes_only_what_changed(self):
+        user = User.objects.create_user('ana', 'ana@example.com', 'secret123')
+        self.client.force_login(user)
+        url = reverse('me-detail', args=[user.pk])
+        body = {'first_name': 'Ana', 'profile': {'phone': '3312345678'}}
+        response, queries = self._capture(self.client.patch, url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['profile']['phone'], '3312345678')
+        updates = [sql for sql in queries if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('"first_name"', updates[0])
+        self.assertNotIn('"last_name"', updates[0])
+        self.assertIn('"phone"', updates[1])
+        self.assertNotIn('"default_address"', updates[1])
+
+        # Los mismos valores otra vez no escriben nada
+        response, queries = self._capture(self.client.patch, url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sql for sql in queries if sql.startswith('UPDATE') and 'users_profile' in sql], [])
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'orders',
+    'users',
     'django_extensions',
     'rest_framework',
     'drf_yasg',
@@ -53,6 +54,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Tiempo, consultas y tamaño de respuesta por vista (Server-Timing y /metrics/)
+    'orders.middleware.RequestMetricsMiddleware',
+    # Lecturas del catálogo a la réplica; fija al primario tras escribir
+    'orders.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,13 +93,84 @@ WSGI_APPLICATION = 'web_project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'mydatabase',
-        'USER': 'user',
-        'PASSWORD': 'password',
-        'HOST': 'db',
+        'NAME': os.environ.get('POSTGRES_DB', 'mydatabase'),
+        'USER': os.environ.get('POSTGRES_USER', 'user'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'password'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
     }
 }
 
+# Conexiones a Postgres
+# Con psycopg 3 + psycopg_pool cada proceso mantiene un pool de conexiones
+# (DB_POOL=1, por defecto). Con CONN_HEALTH_CHECKS Django le pasa al pool
+# su check, que verifica cada conexión antes de prestarla; el pool además
+# descarta las inactivas. Tamaño por proceso: con N workers de
+# gunicorn el servidor ve hasta N * DB_POOL_MAX_SIZE conexiones.
+# Sin pool (DB_POOL=0 o psycopg2) se usan conexiones persistentes por hilo
+# durante DB_CONN_MAX_AGE segundos, con health checks.
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+if ConnectionPool is not None and os.environ.get('DB_POOL', '1') == '1':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # Segundos esperando una conexión libre antes de fallar
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # Cerrar conexiones inactivas y reciclar las viejas
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Réplica de lectura (orders.routers.ReplicaRouter)
+# Con POSTGRES_REPLICA_HOST las lecturas del catálogo (restaurantes, productos,
+# reseñas) y las exportaciones van a la réplica; una petición que escribe, y
+# las del mismo cliente durante REPLICA_PIN_SECONDS, leen del primario.
+REPLICA_DB_ALIAS = 'replica'
+REPLICA_PIN_SECONDS = 5
+if os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES[REPLICA_DB_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+        'PORT': os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        # En tests la réplica es la misma base que el primario
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['orders.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# El catálogo (orders.catalog) usa memoria local por defecto; define
+# CATALOG_CACHE_URL=redis://host:6379/1 para compartirlo entre procesos
+# (requiere el paquete redis).
+
+CATALOG_CACHE_URL = os.environ.get('CATALOG_CACHE_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CATALOG_CACHE_URL,
+    } if CATALOG_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 300
 
 
 # Password validation
@@ -138,6 +214,29 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'orders.pagination.StableCursorPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Segundos que el carrito reutiliza los precios guardados en la sesión
+CART_SNAPSHOT_TTL = 300
+
+# Índice en memoria de carga de conductores (orders.load_index); propone el
+# conductor y dispatch lo confirma con un candado de fila. La deriva de cada
+# proceso se consulta en /dispatch/load-stats/ (staff)
+DRIVER_LOAD_INDEX_ENABLED = True
+# Segundos antes de reconstruir el índice desde la base de datos
+DRIVER_LOAD_INDEX_TTL = 60
+
+# Instrumentación de peticiones (orders.middleware.RequestMetricsMiddleware)
+REQUEST_METRICS_SERVER_TIMING = True
+# Avisar en el log cuando una misma consulta se repite más veces en una petición
+REQUEST_METRICS_NPLUSONE_THRESHOLD = 10
+# Token para que Prometheus lea /metrics/ sin sesión de staff
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Configuración de Gmail
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -152,6 +251,16 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 # Configuración opcional pero recomendada
 DEFAULT_FROM_EMAIL = f'RAPPITESO <{os.environ.get("EMAIL_HOST_USER")}>'
 
+# Cola de correos salientes (orders.outbox, comando send_outbox)
+# Backend usado por el worker; por defecto EMAIL_BACKEND. Para pruebas locales:
+# django.core.mail.backends.locmem.EmailBackend o .filebased.EmailBackend
+OUTBOX_EMAIL_BACKEND = os.environ.get('OUTBOX_EMAIL_BACKEND')
+OUTBOX_MAX_ATTEMPTS = 5
+# Segundos antes del primer reintento; se duplica en cada intento
+OUTBOX_RETRY_BACKOFF = 30
+# Segundos que un worker reserva un lote antes de que otro pueda reclamarlo
+OUTBOX_LEASE_SECONDS = 300
+
 # django-allauth configuration
 SITE_ID = 1
 